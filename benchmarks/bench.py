@@ -0,0 +1,410 @@
+"""
+Time and measure the memory of each pipeline stage on synthetic inputs of growing size.
+
+Each stage is run at a series of scale steps, each in a fresh interpreter, so its peak
+memory is its own. Results are written as JSON, and can be compared with an earlier
+run to find regressions, e.g.
+
+::
+
+    python -m benchmarks.bench --steps 1 2 4 -o after.json --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+import multiprocessing
+from contextlib import redirect_stdout
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic
+
+# Base input sizes, multiplied by the scale step.
+SIZES = {
+    "regions": 2000,
+    "peaks": 20_000,
+    "sequences": 2000,
+    "scan_sequences": 200,
+    "motifs": 20,
+    "enhancers": 5000,
+    "genes": 20_000,
+    "edge_rows": 20_000,
+    "tfs": 500,
+    "edges": 100_000,
+}
+
+# Regressions are reported when a measure grows by more than this fraction.
+DEFAULT_THRESHOLD = 0.2
+
+# Each stage has a function writing its inputs for given sizes to a directory and
+# returning a description of them, and a function setting up the call to time from
+# those inputs, which runs in the measuring process but is not timed.
+
+
+def _prepare_extract(datadir, n):
+    sizes = synthetic.random_genome(os.path.join(datadir, "genome.fa"), chroms=2, length=2_000_000)
+    synthetic.bed_peaks(os.path.join(datadir, "regions.bed"), sizes, n["regions"])
+    return {"regions": n["regions"], "genome_bases": sum(sizes.values())}
+
+
+def _setup_extract(datadir, workdir):
+    from crcminer.motifs import extract_sequences_from_fasta
+
+    return lambda: extract_sequences_from_fasta(
+        os.path.join(datadir, "genome.fa"), os.path.join(datadir, "regions.bed"), os.path.join(workdir, "out.fa")
+    )
+
+
+def _prepare_intersect(datadir, n):
+    sizes = {"chr1": 50_000_000, "chr2": 50_000_000}
+    synthetic.bed_peaks(os.path.join(datadir, "enhancers.bed"), sizes, n["enhancers"], 1000, 50_000, seed=1)
+    synthetic.bed_peaks(os.path.join(datadir, "peaks.bed"), sizes, n["peaks"], seed=2)
+    return {"enhancers": n["enhancers"], "peaks": n["peaks"]}
+
+
+def _setup_intersect(datadir, workdir):
+    from crcminer.motifs import intersect_beds
+
+    return lambda: intersect_beds(
+        os.path.join(datadir, "peaks.bed"), os.path.join(datadir, "enhancers.bed"), os.path.join(workdir, "out.bed")
+    )
+
+
+def _prepare_background(datadir, n):
+    synthetic.random_sequences(os.path.join(datadir, "sequences.fa"), n["sequences"], 500)
+    return {"sequences": n["sequences"], "bases": n["sequences"] * 500}
+
+
+def _setup_background(datadir, workdir):
+    from crcminer.motifs import get_background
+
+    return lambda: get_background(os.path.join(datadir, "sequences.fa"))
+
+
+def _prepare_filter(datadir, n):
+    genes = synthetic.gene_names(n["genes"])
+    synthetic.rose_enhancers(os.path.join(datadir, "enhancers.txt"), {"chr1": 100_000_000}, n["enhancers"], genes)
+    synthetic.active_genes(os.path.join(datadir, "active.txt"), genes)
+    return {"enhancers": n["enhancers"], "genes": n["genes"]}
+
+
+def _setup_filter(datadir, workdir):
+    from crcminer.motifs import filter_enhancers_to_active_genes
+
+    return lambda: filter_enhancers_to_active_genes(
+        os.path.join(datadir, "active.txt"), os.path.join(datadir, "enhancers.txt")
+    )
+
+
+def _prepare_scan(datadir, n):
+    synthetic.random_sequences(os.path.join(datadir, "sequences.fa"), n["scan_sequences"], 500)
+    synthetic.meme_motifs(
+        os.path.join(datadir, "motifs.meme"), n["motifs"], synthetic.gene_names(n["motifs"], "TF"),
+        os.path.join(datadir, "id_map.csv"),
+    )
+    return {"sequences": n["scan_sequences"], "bases": n["scan_sequences"] * 500, "motifs": n["motifs"]}
+
+
+def _setup_scan(datadir, workdir, engine):
+    from crcminer.motifs import get_background, scan_for_motifs
+
+    fasta = os.path.join(datadir, "sequences.fa")
+    background = get_background(fasta)
+    return lambda: scan_for_motifs(
+        os.path.join(datadir, "motifs.meme"), fasta, background, os.path.join(workdir, "hits.txt"),
+        motif_id_map=os.path.join(datadir, "id_map.csv"), engine=engine,
+    )
+
+
+def _prepare_parse(datadir, n):
+    synthetic.edge_table(
+        os.path.join(datadir, "edges.txt"), n["edge_rows"],
+        synthetic.gene_names(n["tfs"], "TF"), synthetic.gene_names(n["genes"]),
+    )
+    return {"rows": n["edge_rows"]}
+
+
+def _setup_parse(datadir, workdir):
+    from crcminer.network import parse_enhancers
+
+    return lambda: parse_enhancers(os.path.join(datadir, "edges.txt"))
+
+
+def _prepare_network(datadir, n):
+    edges = synthetic.tf_network(n["tfs"])
+    edges.save(os.path.join(datadir, "network.npz"))
+    return {"tfs": n["tfs"], "edges": len(edges)}
+
+
+def _setup_network(datadir, workdir):
+    from crcminer.edges import EdgeList
+    from crcminer.network import networkX_helpers
+
+    network = EdgeList.load(os.path.join(datadir, "network.npz"))
+    return lambda: networkX_helpers(network, outdir=workdir)
+
+
+def _prepare_jaccard(datadir, n):
+    for i, edges in enumerate(synthetic.overlapping_edges(n["edges"], n["genes"])):
+        edges.save(os.path.join(datadir, f"edges{i}.npz"))
+    return {"edges": n["edges"], "nodes": n["genes"]}
+
+
+def _setup_jaccard(datadir, workdir):
+    from crcminer.compare import network_jaccard
+    from crcminer.edges import EdgeList
+
+    edges1, edges2 = (EdgeList.load(os.path.join(datadir, f"edges{i}.npz")) for i in (0, 1))
+    return lambda: network_jaccard(edges1, edges2)
+
+
+# Input writer and call setup of each stage, by name.
+STAGES = {
+    "extract_sequences_from_fasta": (_prepare_extract, _setup_extract),
+    "intersect_beds": (_prepare_intersect, _setup_intersect),
+    "get_background": (_prepare_background, _setup_background),
+    "filter_enhancers_to_active_genes": (_prepare_filter, _setup_filter),
+    "scan_for_motifs[fimo]": (_prepare_scan, partial(_setup_scan, engine="fimo")),
+    "scan_for_motifs[numpy]": (_prepare_scan, partial(_setup_scan, engine="numpy")),
+    "parse_enhancers": (_prepare_parse, _setup_parse),
+    "networkX_helpers": (_prepare_network, _setup_network),
+    "network_jaccard": (_prepare_jaccard, _setup_jaccard),
+}
+
+
+def _rss_mb():
+    """Get the resident memory of this process, in megabytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return _peak_rss_mb()
+
+
+def _peak_rss_mb():
+    """Get the peak resident memory of this process, in megabytes."""
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def _measure(name, datadir, workdir, repeat, conn):
+    """Set up and time one stage, in its own process, and send back its measures."""
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        func = STAGES[name][1](datadir, workdir)
+        rss = _rss_mb()
+        wall, cpu = [], []
+        for _ in range(repeat):
+            t0, c0 = time.perf_counter(), time.process_time()
+            func()
+            wall.append(time.perf_counter() - t0)
+            cpu.append(time.process_time() - c0)
+    conn.send({"wall": wall, "cpu": cpu, "rss_start_mb": rss, "peak_rss_mb": _peak_rss_mb()})
+    conn.close()
+
+
+def run_stage(name, step, scale=1.0, repeat=3, tmpdir=None):
+    """
+    Benchmark one stage at one scale step.
+
+    :param name: Stage name, from :data:`STAGES`.
+    :type name: str
+    :param step: Scale step, multiplying the input sizes.
+    :type step: int
+    :param scale: Overall factor on the input sizes.
+    :type scale: float
+    :param repeat: Number of timed runs.
+    :type repeat: int
+    :param tmpdir: Directory for the inputs and outputs. Defaults to a temporary one.
+    :type tmpdir: str
+    ...
+    :return: The stage, step, input sizes, wall and CPU times of each run in seconds,
+        and the peak memory of the process and its growth over the setup, in megabytes.
+    :rtype: dict
+    """
+
+    n = {key: max(1, int(size * scale * step)) for key, size in SIZES.items()}
+    with tempfile.TemporaryDirectory(dir=tmpdir) as root:
+        datadir = os.path.join(root, "data")
+        workdir = os.path.join(root, "work")
+        os.makedirs(datadir)
+        os.makedirs(workdir)
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            sizes = STAGES[name][0](datadir, n)
+
+        # A new interpreter per measurement, so peak memory is not inherited.
+        ctx = multiprocessing.get_context("spawn")
+        recv, send = ctx.Pipe(duplex=False)
+        proc = ctx.Process(target=_measure, args=(name, datadir, workdir, repeat, send))
+        proc.start()
+        send.close()
+        try:
+            measures = recv.recv()
+        except EOFError:
+            proc.join()
+            raise RuntimeError(f"Benchmark of {name} at step {step} failed (exit code {proc.exitcode})")
+        proc.join()
+
+    return {
+        "stage": name,
+        "step": step,
+        "sizes": sizes,
+        "wall": measures["wall"],
+        "cpu": measures["cpu"],
+        "wall_min": min(measures["wall"]),
+        "cpu_min": min(measures["cpu"]),
+        "peak_rss_mb": measures["peak_rss_mb"],
+        "rss_growth_mb": measures["peak_rss_mb"] - measures["rss_start_mb"],
+    }
+
+
+def environment():
+    """Describe the machine and package versions the benchmarks ran with."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+def run_benchmarks(stages=None, steps=(1, 2, 4), scale=1.0, repeat=3, tmpdir=None):
+    """
+    Benchmark stages across scale steps.
+
+    :param stages: Stage names, from :data:`STAGES`. Defaults to all of them.
+    :type stages: list
+    :param steps: Scale steps.
+    :type steps: list
+    :param scale: Overall factor on the input sizes.
+    :type scale: float
+    :param repeat: Number of timed runs per stage and step.
+    :type repeat: int
+    :param tmpdir: Directory for the inputs and outputs. Defaults to a temporary one.
+    :type tmpdir: str
+    ...
+    :return: Environment, settings and results of each stage and step, see :func:`run_stage`.
+    :rtype: dict
+    """
+
+    results = []
+    for name in stages or STAGES:
+        for step in steps:
+            result = run_stage(name, step, scale, repeat, tmpdir)
+            print(
+                f"{name:<36} step {step:>3}: {result['wall_min']:9.3f} s wall, "
+                f"{result['cpu_min']:9.3f} s CPU, {result['peak_rss_mb']:8.1f} MB peak"
+            )
+            results.append(result)
+    return {
+        "environment": environment(),
+        "settings": {"scale": scale, "repeat": repeat, "sizes": SIZES},
+        "results": results,
+    }
+
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare benchmark results with an earlier run.
+
+    :param baseline: Earlier results, from :func:`run_benchmarks`.
+    :type baseline: dict
+    :param current: New results.
+    :type current: dict
+    :param threshold: Fraction a measure must grow by to count as a regression.
+    :type threshold: float
+    ...
+    :return: Ratios of the new to the earlier minimum wall time and peak memory of each
+        stage and step run in both, and whether either grew past the threshold.
+    :rtype: :class:`pandas.DataFrame`
+    """
+
+    for key in ("scale", "sizes"):
+        if baseline["settings"][key] != current["settings"][key]:
+            raise ValueError(f"Benchmarks were run with different input {key}, and cannot be compared")
+
+    def frame(results):
+        df = pd.DataFrame(results["results"], columns=["stage", "step", "wall_min", "peak_rss_mb"])
+        return df.set_index(["stage", "step"])
+
+    both = frame(baseline).join(frame(current), lsuffix="_before", rsuffix="_after", how="inner")
+    table = pd.DataFrame({
+        "wall_ratio": both["wall_min_after"] / both["wall_min_before"],
+        "memory_ratio": both["peak_rss_mb_after"] / both["peak_rss_mb_before"],
+    })
+    table["regression"] = (table[["wall_ratio", "memory_ratio"]] > 1 + threshold).any(axis=1)
+    return table.reset_index()
+
+
+DESCRIPTION = """
+Benchmark the CRCminer pipeline stages on synthetic inputs, at growing scale steps,
+recording wall and CPU time and peak memory as JSON
+"""
+
+EPILOG = """
+Stages: """ + ", ".join(STAGES)
+
+
+class CustomFormatter(
+    argparse.ArgumentDefaultsHelpFormatter, argparse.RawDescriptionHelpFormatter
+):
+    pass
+
+
+parser = argparse.ArgumentParser(
+    description=DESCRIPTION, epilog=EPILOG, formatter_class=CustomFormatter
+)
+
+parser.add_argument("-s", "--stages", nargs="+", default=None, help="Stages to run, defaults to all")
+parser.add_argument("--steps", nargs="+", type=int, default=[1, 2, 4], help="Scale steps")
+parser.add_argument("--scale", type=float, default=1.0, help="Overall factor on the input sizes")
+parser.add_argument("-r", "--repeat", type=int, default=3, help="Timed runs per stage and step")
+parser.add_argument("-o", "--output", default="crcminer_benchmarks.json", help="Output JSON file")
+parser.add_argument("-c", "--compare", default=None, help="Earlier output JSON file to compare with")
+parser.add_argument(
+    "-t", "--threshold", type=float, default=DEFAULT_THRESHOLD,
+    help="Fraction a measure must grow by to count as a regression"
+)
+parser.add_argument("--tmpdir", default=None, help="Directory for the generated inputs")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    unknown = set(args.stages or []) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    results = run_benchmarks(args.stages, args.steps, args.scale, args.repeat, args.tmpdir)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        try:
+            table = compare_results(baseline, results, args.threshold)
+        except ValueError as e:
+            parser.exit(2, f"{e}\n")
+        print(table.to_string(index=False, float_format="%.2f"))
+        if table["regression"].any():
+            sys.exit(1)
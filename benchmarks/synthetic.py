@@ -0,0 +1,341 @@
+"""
+Synthetic inputs for the benchmarks, generated at configurable sizes from a seed.
+"""
+import numpy as np
+import pandas as pd
+
+from crcminer.edges import EdgeList
+
+# Columns of a ROSE2 annotated enhancer table, as read by the pipeline.
+ROSE_COLUMNS = [
+    "REGION_ID", "CHROM", "START", "STOP", "NUM_LOCI", "CONSTITUENT_SIZE", "SIGNAL", "INPUT",
+    "enhancerRank", "OVERLAP_GENES", "PROXIMAL_GENES", "CLOSEST_GENE", "isSuper",
+]
+
+FASTA_LINE_WIDTH = 60
+
+
+def gene_names(n, prefix="GENE"):
+    """
+    Get distinct gene names.
+
+    :param n: Number of names.
+    :type n: int
+    :param prefix: Start of each name.
+    :type prefix: str
+    ...
+    :return: The names.
+    :rtype: :class:`numpy.ndarray`
+    """
+
+    return np.array([f"{prefix}{i}" for i in range(n)], dtype=object)
+
+
+def _write_fasta(path, records):
+    with open(path, "w") as f:
+        for name, seq in records:
+            f.write(f">{name}\n")
+            for i in range(0, len(seq), FASTA_LINE_WIDTH):
+                f.write(seq[i:i + FASTA_LINE_WIDTH])
+                f.write("\n")
+
+
+def _random_bases(rng, length, n_fraction=0.0):
+    seq = np.frombuffer(b"ACGT", dtype=np.uint8)[rng.integers(0, 4, length)]
+    if n_fraction:
+        # Runs of Ns, as in assembly gaps.
+        for start in rng.integers(0, length, max(1, int(length * n_fraction) // 1000)):
+            seq[start:start + 1000] = ord("N")
+    return seq.tobytes().decode()
+
+
+def random_genome(path, chroms=2, length=1_000_000, seed=0):
+    """
+    Write a genome FASTA of uniformly random bases, with some runs of Ns.
+
+    :param path: Output path.
+    :type path: str
+    :param chroms: Number of chromosomes.
+    :type chroms: int
+    :param length: Length of each chromosome.
+    :type length: int
+    :param seed: Random seed.
+    :type seed: int
+    ...
+    :return: Length of each chromosome, keyed by name.
+    :rtype: dict
+    """
+
+    rng = np.random.default_rng(seed)
+    sizes = {f"chr{i + 1}": length for i in range(chroms)}
+    _write_fasta(path, ((name, _random_bases(rng, size, 0.01)) for name, size in sizes.items()))
+    return sizes
+
+
+def random_sequences(path, n, length=500, seed=0):
+    """
+    Write a FASTA of random sequences, named like the regions the pipeline extracts.
+
+    :param path: Output path.
+    :type path: str
+    :param n: Number of sequences.
+    :type n: int
+    :param length: Length of each sequence.
+    :type length: int
+    :param seed: Random seed.
+    :type seed: int
+    """
+
+    rng = np.random.default_rng(seed)
+    _write_fasta(path, (
+        (f"chr1:{i * length}-{(i + 1) * length}", _random_bases(rng, length)) for i in range(n)
+    ))
+
+
+def random_regions(chrom_sizes, n, min_width=200, max_width=2000, seed=0):
+    """
+    Get random regions of a genome, sorted by position.
+
+    :param chrom_sizes: Length of each chromosome, keyed by name.
+    :type chrom_sizes: dict
+    :param n: Number of regions.
+    :type n: int
+    :param min_width: Minimum region width.
+    :type min_width: int
+    :param max_width: Maximum region width.
+    :type max_width: int
+    :param seed: Random seed.
+    :type seed: int
+    ...
+    :return: Regions, with "chrom", "start" and "end" columns.
+    :rtype: :class:`pandas.DataFrame`
+    """
+
+    rng = np.random.default_rng(seed)
+    names = np.array(list(chrom_sizes), dtype=object)
+    chrom = names[rng.integers(0, len(names), n)]
+    width = rng.integers(min_width, max_width + 1, n)
+    limit = np.array([chrom_sizes[c] for c in chrom]) - width
+    start = (rng.random(n) * limit).astype(np.int64)
+    regions = pd.DataFrame({"chrom": chrom, "start": start, "end": start + width})
+    return regions.sort_values(["chrom", "start"], ignore_index=True)
+
+
+def bed_peaks(path, chrom_sizes, n, min_width=200, max_width=2000, seed=0):
+    """
+    Write a BED file of random peaks.
+
+    :param path: Output path.
+    :type path: str
+    :param chrom_sizes: Length of each chromosome, keyed by name.
+    :type chrom_sizes: dict
+    :param n: Number of peaks.
+    :type n: int
+    :param min_width: Minimum peak width.
+    :type min_width: int
+    :param max_width: Maximum peak width.
+    :type max_width: int
+    :param seed: Random seed.
+    :type seed: int
+    """
+
+    regions = random_regions(chrom_sizes, n, min_width, max_width, seed)
+    regions["name"] = [f"peak{i}" for i in range(n)]
+    regions.to_csv(path, sep="\t", header=False, index=False)
+
+
+def _gene_lists(rng, genes, n, max_genes):
+    """Get n comma-separated lists of 1 to max_genes random genes."""
+    counts = rng.integers(1, max_genes + 1, n)
+    picks = genes[rng.integers(0, len(genes), int(counts.sum()))]
+    ends = np.cumsum(counts)
+    return [",".join(picks[end - count:end]) for count, end in zip(counts.tolist(), ends.tolist())]
+
+
+def rose_enhancers(path, chrom_sizes, n, genes, seed=0):
+    """
+    Write a ROSE2-like annotated enhancer table.
+
+    :param path: Output path.
+    :type path: str
+    :param chrom_sizes: Length of each chromosome, keyed by name.
+    :type chrom_sizes: dict
+    :param n: Number of enhancers.
+    :type n: int
+    :param genes: Gene names to annotate enhancers with.
+    :type genes: :class:`numpy.ndarray`
+    :param seed: Random seed.
+    :type seed: int
+    """
+
+    rng = np.random.default_rng(seed)
+    regions = random_regions(chrom_sizes, n, 1000, 50_000, seed)
+    signal = np.sort(rng.pareto(1.5, n))[::-1] * 1000
+    pd.DataFrame({
+        "REGION_ID": [f"{i}_Peak_{i}_lociStitched" for i in range(n)],
+        "CHROM": regions["chrom"],
+        "START": regions["start"],
+        "STOP": regions["end"],
+        "NUM_LOCI": rng.integers(1, 50, n),
+        "CONSTITUENT_SIZE": rng.integers(1000, 50_000, n),
+        "SIGNAL": signal,
+        "INPUT": signal * rng.random(n) / 5,
+        "enhancerRank": np.arange(1, n + 1),
+        "OVERLAP_GENES": _gene_lists(rng, genes, n, 3),
+        "PROXIMAL_GENES": _gene_lists(rng, genes, n, 6),
+        "CLOSEST_GENE": genes[rng.integers(0, len(genes), n)],
+        "isSuper": (np.arange(n) < n // 10).astype(int),
+    }, columns=ROSE_COLUMNS).to_csv(path, sep="\t", index=False)
+
+
+def active_genes(path, genes, fraction=0.3, seed=0):
+    """
+    Write a random subset of genes, one per line.
+
+    :param path: Output path.
+    :type path: str
+    :param genes: Gene names.
+    :type genes: :class:`numpy.ndarray`
+    :param fraction: Fraction of the genes to write.
+    :type fraction: float
+    :param seed: Random seed.
+    :type seed: int
+    """
+
+    rng = np.random.default_rng(seed)
+    keep = genes[rng.random(len(genes)) < fraction]
+    with open(path, "w") as f:
+        f.writelines(f"{gene}\n" for gene in keep)
+
+
+def meme_motifs(path, n, genes, id_map_path=None, min_width=6, max_width=20, seed=0):
+    """
+    Write a MEME motif file of random, fairly informative PWMs, and optionally a motif
+    ID map, in the format written by :func:`crcminer.motifmap.write_motif_id_map`, mapping each motif to a gene.
+
+    :param path: Output path of the MEME file.
+    :type path: str
+    :param n: Number of motifs.
+    :type n: int
+    :param genes: Gene names to map motifs to, in turn.
+    :type genes: :class:`numpy.ndarray`
+    :param id_map_path: Output path of the motif ID map.
+    :type id_map_path: str
+    :param min_width: Minimum motif width.
+    :type min_width: int
+    :param max_width: Maximum motif width.
+    :type max_width: int
+    :param seed: Random seed.
+    :type seed: int
+    """
+
+    rng = np.random.default_rng(seed)
+    lines = [
+        "MEME version 5.4.1", "", "ALPHABET= ACGT", "", "strands: + -", "",
+        "Background letter frequencies (from uniform background):",
+        "A 0.25000 C 0.25000 G 0.25000 T 0.25000 ", "",
+    ]
+    id_map = []
+    for i in range(n):
+        accession = f"M{i:05d}_2.00"
+        gene = genes[i % len(genes)]
+        width = int(rng.integers(min_width, max_width + 1))
+        matrix = rng.dirichlet(np.full(4, 0.3), width)
+        lines += [
+            f"MOTIF {accession} ({gene})_(Synthetic)", "",
+            f"letter-probability matrix: alength= 4 w= {width} nsites= 1 E= 0",
+        ]
+        lines += ["  " + "\t  ".join(f"{p:.6f}" for p in row) + "\t" for row in matrix]
+        lines.append("")
+        id_map.append(f"{accession},{gene},{gene},{i},ENSG{i:011d}")
+
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    if id_map_path is not None:
+        with open(id_map_path, "w") as f:
+            f.write("\n".join(id_map) + "\n")
+
+
+def edge_table(path, n, tfs, targets, seed=0):
+    """
+    Write an enhancer edge table, with comma-separated "gene" and "motif" columns, as
+    read by :func:`crcminer.network.parse_enhancers` and :func:`crcminer.compare.parse_bed`.
+
+    :param path: Output path.
+    :type path: str
+    :param n: Number of rows.
+    :type n: int
+    :param tfs: Names of the TFs of the motifs.
+    :type tfs: :class:`numpy.ndarray`
+    :param targets: Names of the target genes.
+    :type targets: :class:`numpy.ndarray`
+    :param seed: Random seed.
+    :type seed: int
+    """
+
+    rng = np.random.default_rng(seed)
+    start = rng.integers(0, 100_000_000, n)
+    pd.DataFrame({
+        "chr": "chr1",
+        "st": start,
+        "en": start + 1000,
+        "gene": _gene_lists(rng, targets, n, 3),
+        "motif": _gene_lists(rng, tfs, n, 5),
+    }).to_csv(path, sep="\t", index=False)
+
+
+def tf_network(n, density=0.2, self_loops=0.3, seed=0):
+    """
+    Get a random TF network, with skewed out-degrees as in real ones, and a fraction of
+    self-regulating TFs, which CRC cliques are made of. TF networks are dense, as each
+    TF's enhancers hold motifs of many others.
+
+    :param n: Number of TFs.
+    :type n: int
+    :param density: Number of edges, as a fraction of all ordered pairs of TFs.
+    :type density: float
+    :param self_loops: Fraction of TFs regulating themselves.
+    :type self_loops: float
+    :param seed: Random seed.
+    :type seed: int
+    ...
+    :return: The edges.
+    :rtype: :class:`crcminer.edges.EdgeList`
+    """
+
+    rng = np.random.default_rng(seed)
+    weight = rng.pareto(2.0, n) + 1
+    m = int(n * n * density)
+    source = rng.choice(n, m, p=weight / weight.sum())
+    target = rng.integers(0, n, m)
+    loops = np.flatnonzero(rng.random(n) < self_loops)
+    return EdgeList(gene_names(n, "TF"), np.r_[source, loops], np.r_[target, loops])
+
+
+def overlapping_edges(n, nodes, overlap=0.5, seed=0):
+    """
+    Get two random edge lists sharing about a given fraction of their edges.
+
+    :param n: Number of edges in each list.
+    :type n: int
+    :param nodes: Number of nodes.
+    :type nodes: int
+    :param overlap: Fraction of the edges of the second list taken from the first.
+    :type overlap: float
+    :param seed: Random seed.
+    :type seed: int
+    ...
+    :return: The two edge lists.
+    :rtype: tuple
+    """
+
+    rng = np.random.default_rng(seed)
+    names = gene_names(nodes)
+    first = EdgeList(names, rng.integers(0, nodes, n), rng.integers(0, nodes, n))
+    shared = int(n * overlap)
+    second = EdgeList(
+        names,
+        np.r_[first.source[:shared], rng.integers(0, nodes, n - shared)],
+        np.r_[first.target[:shared], rng.integers(0, nodes, n - shared)],
+    )
+    return first, second
@@ -4,13 +4,30 @@
 """
 This app generates visualizations using Dash CytoScape package for CRC networks
 """
+import argparse
+import os
+import uuid
+
 import dash
 import dash_bootstrap_components as dbc
-from dash import Input, Output, dcc, State, html
+from dash import Input, Output, Patch, dcc, State, html
 import dash_cytoscape as cyto
+import numpy as np
 import pandas as pd
 import plotly.express as px
 
+from crcminer.app.runs import DEFAULT_CACHE_MB, LAYOUTS, MAX_ELEMENTS, LRUCache, RunStore, diff_elements
+
+# Number of figures and sent network views kept, to rebuild or diff against.
+FIGURE_CACHE_SIZE = 64
+VIEW_CACHE_SIZE = 64
+
+# Scatter plots with more points than this are drawn with WebGL.
+WEBGL_POINTS = 1000
+
+# Scatter plots are downsampled to at most this many points on the server.
+MAX_POINTS = 5000
+
 
 # Styles for network
 
@@ -48,503 +65,661 @@ extraStyle = [
     {"selector": ".triangle", "style": {"shape": "triangle"}},
 ]
 
-metaDict = {"EN": "red triangle", "TF": ""}
+# Node and edge colors, set by update_stylesheet.
+colorStyle = [
+    {"selector": "node", "style": {"background-color": "gray"}},
+    {"selector": "edge", "style": {"line-color": "gray"}},
+]
 
 
 # Functions
 
 
-def getUniqueNodes(nodeSeries, edgeSeries, metaDict, metaDf):
-    nodeSet = pd.Series(list(nodeSeries) + list(edgeSeries)).unique()
-    typeSet = metaDf[metaDf["node"].isin(nodeSet)]
-    typDict = dict(zip(typeSet["node"], typeSet["type"]))
-    return [
-        {"data": {"id": short, "label": label}, "classes": metaDict[typDict[label]]}
-        for short, label in (tuple(zip(nodeSet, nodeSet)))
-    ]
+def degreeOptions(series):
+    return [{"label": k, "value": k} for k in sorted(series.unique().tolist())]
+
+
+def downsamplePoints(df, x, y, maxPoints=MAX_POINTS):
+    """
+    Keep at most about maxPoints rows of a scatter plot, one per cell of a grid over the
+    plot, preferring points far from the origin, so outliers are always kept.
+    """
+    if len(df) <= maxPoints:
+        return df
+    side = int(np.sqrt(maxPoints))
+    xs, ys = df[x].to_numpy(dtype=float), df[y].to_numpy(dtype=float)
+    col = ((xs - xs.min()) / max(np.ptp(xs), 1e-12) * (side - 1)).astype(np.int64)
+    row = ((ys - ys.min()) / max(np.ptp(ys), 1e-12) * (side - 1)).astype(np.int64)
+    order = np.argsort(-(xs * xs + ys * ys), kind="stable")
+    _, first = np.unique((row * side + col)[order], return_index=True)
+    return df.iloc[np.sort(order[first])]
+
+
+def scatterFigure(df, x, y, **kwargs):
+    sample = downsamplePoints(df, x, y)
+    return px.scatter(
+        data_frame=sample,
+        x=x,
+        y=y,
+        hover_data=sample,
+        render_mode="webgl" if len(sample) > WEBGL_POINTS else "svg",
+        **kwargs,
+    )
 
 
-def getEdges(nodeSeries, edgeSeries):
-    return [
-        {"data": {"source": source, "target": target}}
-        for source, target in (tuple(zip(nodeSeries, edgeSeries)))
-    ]
+def cliqueFractionLabel(topCliques):
+    # Runs mined with --top-k have clique fractions over their best cliques only.
+    return "TF Top-k Clique Fraction" if topCliques else "TF Clique Fraction"
 
 
-def readFile(fname):
-    return pd.read_csv(fname)
+def cliqueFigure(degreeDf, topCliques=False):
+    cliquePlot = px.bar(
+        data_frame=degreeDf.loc[degreeDf["TF_CliqueFraction"] > 0.1],
+        x="TF",
+        y="TF_CliqueFraction",
+        labels={"TF_CliqueFraction": cliqueFractionLabel(topCliques)},
+    )
+    cliquePlot.update_layout(xaxis=dict(tickfont=dict(size=14)))
+    return cliquePlot
 
 
-# Body
+def inOutFigure(degreeDf):
+    fig_In = scatterFigure(degreeDf, "In", "Out")
 
-flowImageUrl = "https://raw.githubusercontent.com/stjude-biohackathon/KIDS23-Team14/main/images/Workflow.svg"
+    fig_In.add_hline(y=0)
+    fig_In.add_vline(x=0)
+    fig_In.update_traces(
+        marker=dict(size=10, color="#e2dd25", line=dict(width=2, color="DarkSlateGrey")),
+        selector=dict(mode="markers"),
+    )
+    return fig_In
 
-app = dash.Dash(external_stylesheets=[dbc.themes.FLATLY, dbc.icons.BOOTSTRAP])
-server = app.server
-
-logoImageUrl = app.get_asset_url("logo1.png")
-
-logoContent = dbc.CardImg(src=logoImageUrl, style={"height": "10%"}, top=True)
-
-# Sample Data load from csv
-sampleA = pd.read_csv("./data/group1_degreeTable.txt", sep=",").sort_values(
-    by="TF_CliqueFraction", ascending=False
-)
-sampleB = pd.read_csv("./data/group2_degreeTable.txt", sep=",").sort_values(
-    by="TF_CliqueFraction", ascending=False
-)
-
-fname = "./data/sample_2.csv"
-# fname = "./data/group1_EdgeTable.txt"
-netInputDf = readFile(fname)
-
-metafn = "./data/nodes_2.csv"
-# metafn = "./data/group1_degreeTable.txt"
-metaDf = readFile(metafn)
-
-# cliqueFn = "./data/TF_Degrees.csv"
-# cliqueDf = pd.read_csv(cliqueFn).sort_values(by = 'TF_CliqueFraction', ascending=False)
-cliquePlot = px.bar(
-    data_frame=sampleA.loc[sampleA["TF_CliqueFraction"] > 0.1],
-    x="TF",
-    y="TF_CliqueFraction",
-)
-cliquePlot.update_layout(xaxis=dict(tickfont=dict(size=14)))
-
-nodes = getUniqueNodes(
-    netInputDf["node"].unique(), netInputDf["edge"], metaDict, metaDf
-)
-edges = getEdges(netInputDf["node"], netInputDf["edge"])
-
-initialElements = nodes + edges
-
-cytoObject = cyto.Cytoscape(
-    id="cytoscape-layout-1",
-    elements=initialElements,
-    stylesheet=extraStyle,
-    style={"width": "100%", "height": "600px"},
-    layout={
-        "name": "cose",
-        "directed": True,
-    },
-)
 
-# Group comparison
-groupData = pd.merge(sampleA, sampleB, on="TF", how="left").fillna(0)
+def groupFigures(sampleA, sampleB, nameA, nameB, topCliquesA=False, topCliquesB=False):
+    groupData = pd.merge(sampleA, sampleB, on="TF", how="left").fillna(0)
 
-groupData["deltaInDegree"] = groupData["In_x"] - groupData["In_y"]
-groupData["deltaOutDegree"] = groupData["Out_x"] - groupData["Out_y"]
+    groupData["deltaInDegree"] = groupData["In_x"] - groupData["In_y"]
+    groupData["deltaOutDegree"] = groupData["Out_x"] - groupData["Out_y"]
 
-fig = px.scatter(
-    data_frame=groupData,
-    x="deltaOutDegree",
-    y="deltaInDegree",
-    labels={
-        "deltaOutDegree": "deltaOutDegree (group1 OUT - group2 OUT degree)",
-        "deltaInDegree": "deltaInDegree (group1 IN - group1 IN degree)",
-    },
-    hover_data=groupData,
-)
-
-fig.add_hline(y=0)
-fig.add_vline(x=0)
-fig.update_traces(
-    marker=dict(size=10, line=dict(width=2, color="DarkSlateGrey")),
-    selector=dict(mode="markers"),
-)
-
-fig_CF = px.scatter(
-    data_frame=groupData,
-    x="TF_CliqueFraction_x",
-    y="TF_CliqueFraction_y",
-    labels={
-        "TF_CliqueFraction_x": "TF Clique Fraction in group 1",
-        "TF_CliqueFraction_y": "TF Clique Fraction in group 2",
-    },
-    hover_data=groupData,
-)
+    fig = scatterFigure(
+        groupData,
+        "deltaOutDegree",
+        "deltaInDegree",
+        labels={
+            "deltaOutDegree": f"deltaOutDegree ({nameA} OUT - {nameB} OUT degree)",
+            "deltaInDegree": f"deltaInDegree ({nameA} IN - {nameB} IN degree)",
+        },
+    )
 
-fig_CF.add_hline(y=0)
-fig_CF.add_vline(x=0)
-fig_CF.update_traces(
-    marker=dict(size=10, color="#ce6c17", line=dict(width=2, color="DarkSlateGrey")),
-    selector=dict(mode="markers"),
-)
+    fig.add_hline(y=0)
+    fig.add_vline(x=0)
+    fig.update_traces(
+        marker=dict(size=10, line=dict(width=2, color="DarkSlateGrey")),
+        selector=dict(mode="markers"),
+    )
 
+    fig_CF = scatterFigure(
+        groupData,
+        "TF_CliqueFraction_x",
+        "TF_CliqueFraction_y",
+        labels={
+            "TF_CliqueFraction_x": f"{cliqueFractionLabel(topCliquesA)} in {nameA}",
+            "TF_CliqueFraction_y": f"{cliqueFractionLabel(topCliquesB)} in {nameB}",
+        },
+    )
 
-fig_In = px.scatter(data_frame=sampleA, x="In", y="Out", hover_data=sampleA)
+    fig_CF.add_hline(y=0)
+    fig_CF.add_vline(x=0)
+    fig_CF.update_traces(
+        marker=dict(size=10, color="#ce6c17", line=dict(width=2, color="DarkSlateGrey")),
+        selector=dict(mode="markers"),
+    )
+    return fig, fig_CF
 
-fig_In.add_hline(y=0)
-fig_In.add_vline(x=0)
-fig_In.update_traces(
-    marker=dict(size=10, color="#e2dd25", line=dict(width=2, color="DarkSlateGrey")),
-    selector=dict(mode="markers"),
-)
 
+# Body
 
-# Header
-header = dbc.Card(
-    [
-        dbc.Row(
-            [
-                dbc.Col(
-                    dbc.CardImg(
-                        src=logoImageUrl,
-                        className="img-fluid rounded-start",
-                    ),
-                    className="col-md-4",
-                ),
-                dbc.Col(
-                    dbc.CardBody(
-                        [
-                            html.H4("CRCMiner", className="card-title"),
-                            html.P(
-                                "Putative Core Regulatory Circuitry (CRC) Identification.",
-                                className="card-text",
-                            ),
-                            html.Small(
-                                "Team 14",
-                                className="card-text text-muted",
-                            ),
-                        ]
-                    ),
-                    className="col-md-8",
-                ),
-            ],
-            className="align-items-center w-100",
-        ),
-    ],
-    style={"maxWidth": "600px"},
-    className="align-items-center w-100 border-0 bg-transparent",
-)
+flowImageUrl = "https://raw.githubusercontent.com/stjude-biohackathon/KIDS23-Team14/main/images/Workflow.svg"
+
+
+def create_app(indirs, cache_mb=DEFAULT_CACHE_MB):
+    """
+    Create the report app for the CRCminer runs found under one or more directories.
+
+    Runs are only listed at startup. A run's tables are read, and its network elements
+    built, when it is first selected, and kept in a size-bounded LRU cache.
+
+    :param indirs: Directories containing CRCminer results.
+    :type indirs: list
+    :param cache_mb: Bound on the size of the loaded runs, in megabytes.
+    :type cache_mb: float
+    ...
+    :return: The app.
+    :rtype: :class:`dash.Dash`
+    """
+
+    store = RunStore(indirs, max_mb=cache_mb)
+    # Figures by the runs they show, and the element lists last sent to each view.
+    figures = LRUCache(FIGURE_CACHE_SIZE)
+    views = LRUCache(VIEW_CACHE_SIZE)
+    runNames = store.names
+    runOptions = [{"label": name, "value": name} for name in runNames]
+
+    app = dash.Dash(
+        __name__,
+        assets_folder=os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets"),
+        external_stylesheets=[dbc.themes.FLATLY, dbc.icons.BOOTSTRAP],
+    )
 
+    logoImageUrl = app.get_asset_url("logo1.png")
 
-## Tab 1
-flowCard = dbc.Card(
-    dbc.CardBody(
+    # Header
+    header = dbc.Card(
         [
-            html.H5("Stages in CRC identification", className="card-title"),
             dbc.Row(
                 [
                     dbc.Col(
                         dbc.CardImg(
-                            src=flowImageUrl,
+                            src=logoImageUrl,
                             className="img-fluid rounded-start",
-                            style={"height": "85%", "width": "85%"},
                         ),
-                        className="justify-content-center align-items-center",
-                    )
-                ]
-            ),
-        ]
-    ),
-    className="w-100 mb-3",
-)
-
-useCard = dbc.Card(
-    dbc.CardBody(
-        [
-            html.P(
-                "Please refer to the GitHub repo for details.",
-            ),
-            dbc.Button(
-                html.I(" GitHub Repo", className="bi bi-github me-2"),
-                href="https://github.com/stjude-biohackathon/KIDS23-Team14",
-                external_link=True,
-                target="_blank",
-                color="info",
-                outline=True,
-            ),
-        ]
-    ),
-    className="w-100 mb-3",
-)
-
-tab1_content = dbc.Card(
-    dbc.CardBody(
-        [
-            dbc.Button(
-                "How to Use?",
-                id="use-button",
-                className="mb-3",
-                color="info",
-                n_clicks=0,
-            ),
-            dbc.Collapse(
-                useCard,
-                id="collapseUse",
-                is_open=True,
-            ),
-            html.Br(),
-            dbc.Button(
-                "Overall CRC Identification workflow",
-                id="flow-button",
-                className="mb-3",
-                color="info",
-                n_clicks=0,
-            ),
-            dbc.Collapse(
-                flowCard,
-                id="collapseFlow",
-                is_open=True,
-            ),
-        ]
-    ),
-    className="mt-3",
-)
-
-# Tab 2
-tab2_content = dbc.Card(
-    dbc.CardBody(
-        [
-            html.H5("Network visualization:", className="card-text"),
-            # dcc.Input(id="input2", type="text", placeholder="Gene", debounce=True),
-            html.I(" Enhancer", className="bi bi-triangle-fill me-2"),
-            html.I(" Transcription factor", className="bi bi-circle-fill me-2"),
-            dbc.Row(
-                [
+                        className="col-md-4",
+                    ),
                     dbc.Col(
-                        cyto.Cytoscape(
-                            id="cytoscape-layout-2",
-                            elements=initialElements,
-                            stylesheet=extraStyle,
-                            style={"width": "100%", "height": "600px"},
-                            layout={
-                                "name": "cose",
-                                "directed": True,
-                            },
+                        dbc.CardBody(
+                            [
+                                html.H4("CRCMiner", className="card-title"),
+                                html.P(
+                                    "Putative Core Regulatory Circuitry (CRC) Identification.",
+                                    className="card-text",
+                                ),
+                                html.Small(
+                                    "Team 14",
+                                    className="card-text text-muted",
+                                ),
+                            ]
                         ),
-                        width=8,
+                        className="col-md-8",
                     ),
-                    dbc.Col(
-                        [
-                            dbc.Badge("In Degree >=:", color="info", className="mr-1"),
-                            dcc.Dropdown(
-                                id="inDegree",
-                                options=[
-                                    {"label": k, "value": k}
-                                    for k in range(
-                                        metaDf["In"].min(), metaDf["In"].max()
-                                    )
-                                ],
-                                clearable=False,
-                                value=metaDf["In"].min(),
-                                style={"width": "80px"},
-                            ),
-                            dbc.Badge("Out Degree >=:", color="info", className="mr-1"),
-                            dcc.Dropdown(
-                                id="outDegree",
-                                options=[
-                                    {"label": k, "value": k}
-                                    for k in range(
-                                        metaDf["Out"].min(), metaDf["Out"].max()
-                                    )
-                                ],
-                                clearable=False,
-                                value=metaDf["Out"].min(),
-                                style={"width": "80px"},
-                            ),
-                            dbc.Badge("Nodes:", color="info", className="mr-1"),
-                            dcc.Dropdown(
-                                id="nodeDropdown",
-                                options=[
-                                    {
-                                        "label": i,
-                                        "value": i,
-                                    }
-                                    for i in metaDf["node"].unique()
-                                ],
-                                value=list(metaDf["node"].unique()),
-                                multi=True,
-                                style={"width": "80%"},
+                ],
+                className="align-items-center w-100",
+            ),
+        ],
+        style={"maxWidth": "600px"},
+        className="align-items-center w-100 border-0 bg-transparent",
+    )
+
+    ## Tab 1
+    flowCard = dbc.Card(
+        dbc.CardBody(
+            [
+                html.H5("Stages in CRC identification", className="card-title"),
+                dbc.Row(
+                    [
+                        dbc.Col(
+                            dbc.CardImg(
+                                src=flowImageUrl,
+                                className="img-fluid rounded-start",
+                                style={"height": "85%", "width": "85%"},
                             ),
-                            dbc.Badge("Edge color:", color="info", className="mr-1"),
-                            dcc.Input(id="input-edge-color", type="text"),
-                            html.Br(),
-                            dbc.Badge("Node color:", color="info", className="mr-1"),
-                            dcc.Input(id="input-node-color", type="text"),
-                            html.Br(),
-                            dbc.Badge("Layout:", color="info", className="mr-1"),
-                            dcc.Dropdown(
-                                id="dropdown-update-layout",
-                                value="cose",
-                                clearable=False,
-                                options=[
-                                    {"label": name.capitalize(), "value": name}
-                                    for name in [
-                                        "grid",
-                                        "random",
-                                        "circle",
-                                        "cose",
-                                        "concentric",
-                                    ]
-                                ],
+                            className="justify-content-center align-items-center",
+                        )
+                    ]
+                ),
+            ]
+        ),
+        className="w-100 mb-3",
+    )
+
+    useCard = dbc.Card(
+        dbc.CardBody(
+            [
+                html.P(
+                    "Please refer to the GitHub repo for details.",
+                ),
+                dbc.Button(
+                    html.I(" GitHub Repo", className="bi bi-github me-2"),
+                    href="https://github.com/stjude-biohackathon/KIDS23-Team14",
+                    external_link=True,
+                    target="_blank",
+                    color="info",
+                    outline=True,
+                ),
+            ]
+        ),
+        className="w-100 mb-3",
+    )
+
+    tab1_content = dbc.Card(
+        dbc.CardBody(
+            [
+                dbc.Button(
+                    "How to Use?",
+                    id="use-button",
+                    className="mb-3",
+                    color="info",
+                    n_clicks=0,
+                ),
+                dbc.Collapse(
+                    useCard,
+                    id="collapseUse",
+                    is_open=True,
+                ),
+                html.Br(),
+                dbc.Button(
+                    "Overall CRC Identification workflow",
+                    id="flow-button",
+                    className="mb-3",
+                    color="info",
+                    n_clicks=0,
+                ),
+                dbc.Collapse(
+                    flowCard,
+                    id="collapseFlow",
+                    is_open=True,
+                ),
+            ]
+        ),
+        className="mt-3",
+    )
+
+    # Tab 2
+    tab2_content = dbc.Card(
+        dbc.CardBody(
+            [
+                html.H5("Network visualization:", className="card-text"),
+                dbc.Badge("Run:", color="info", className="mr-1"),
+                dcc.Dropdown(
+                    id="runDropdown",
+                    options=runOptions,
+                    value=runNames[0] if runNames else None,
+                    clearable=False,
+                    style={"width": "50%"},
+                ),
+                # dcc.Input(id="input2", type="text", placeholder="Gene", debounce=True),
+                html.I(" Enhancer", className="bi bi-triangle-fill me-2"),
+                html.I(" Transcription factor", className="bi bi-circle-fill me-2"),
+                # ID of the element list shown, to send later ones as changes to it.
+                dcc.Store(id="shownView"),
+                dbc.Row(
+                    [
+                        dbc.Col(
+                            cyto.Cytoscape(
+                                id="cytoscape-layout-2",
+                                elements=[],
+                                stylesheet=extraStyle + colorStyle,
+                                style={"width": "100%", "height": "600px"},
+                                # Positions are computed on the server, see NetworkIndex.positions.
+                                layout={"name": "preset", "fit": True},
                             ),
-                        ]
-                    ),
-                ]
-            ),
-            # network2,
-        ]
-    ),
-    className="mt-3",
-)
+                            width=8,
+                        ),
+                        dbc.Col(
+                            [
+                                dbc.Badge("In Degree >=:", color="info", className="mr-1"),
+                                dcc.Dropdown(
+                                    id="inDegree",
+                                    options=[],
+                                    clearable=False,
+                                    value=None,
+                                    style={"width": "80px"},
+                                ),
+                                dbc.Badge("Out Degree >=:", color="info", className="mr-1"),
+                                dcc.Dropdown(
+                                    id="outDegree",
+                                    options=[],
+                                    clearable=False,
+                                    value=None,
+                                    style={"width": "80px"},
+                                ),
+                                dbc.Badge("Neighborhood of:", color="info", className="mr-1"),
+                                dcc.Dropdown(
+                                    id="seedDropdown",
+                                    options=[],
+                                    value=[],
+                                    multi=True,
+                                    placeholder="Type to search nodes",
+                                    style={"width": "80%"},
+                                ),
+                                dbc.Badge("Hops:", color="info", className="mr-1"),
+                                dcc.Dropdown(
+                                    id="hops",
+                                    options=[{"label": k, "value": k} for k in range(1, 4)],
+                                    clearable=False,
+                                    value=1,
+                                    style={"width": "80px"},
+                                ),
+                                dbc.Badge("Max elements:", color="info", className="mr-1"),
+                                dcc.Input(
+                                    id="maxElements", type="number", min=1, value=MAX_ELEMENTS, debounce=True
+                                ),
+                                html.Br(),
+                                html.Small(id="elementNote", className="text-muted"),
+                                html.Br(),
+                                dbc.Badge("Nodes:", color="info", className="mr-1"),
+                                dcc.Dropdown(
+                                    id="nodeDropdown",
+                                    options=[],
+                                    value=[],
+                                    multi=True,
+                                    style={"width": "80%"},
+                                ),
+                                dbc.Badge("Edge color:", color="info", className="mr-1"),
+                                dcc.Input(id="input-edge-color", type="text"),
+                                html.Br(),
+                                dbc.Badge("Node color:", color="info", className="mr-1"),
+                                dcc.Input(id="input-node-color", type="text"),
+                                html.Br(),
+                                dbc.Badge("Layout:", color="info", className="mr-1"),
+                                dcc.Dropdown(
+                                    id="dropdown-update-layout",
+                                    value="cose",
+                                    clearable=False,
+                                    options=[
+                                        {"label": name.capitalize(), "value": name}
+                                        for name in LAYOUTS
+                                    ],
+                                ),
+                            ]
+                        ),
+                    ]
+                ),
+                # network2,
+            ]
+        ),
+        className="mt-3",
+    )
 
+    # Tab 3
+    tab3_content = dbc.Card(
+        dbc.CardBody(
+            [
+                html.H5("Clique fraction plot: ", className="card-text"),
+                dcc.Graph(
+                    id="cliquePlot",
+                    figure={},
+                    responsive=True,
+                    style={"display": "inline-block", "width": "50%"},
+                ),
+                dcc.Graph(
+                    id="inOutPlot",
+                    figure={},
+                    responsive=True,
+                    style={"display": "inline-block", "width": "50%"},
+                ),
+                # network2,
+            ]
+        ),
+        className="mt-3",
+    )
+
+    # Tab 4
+    tab4_content = dbc.Card(
+        dbc.CardBody(
+            [
+                html.H5("Group comparison plot:", className="card-text"),
+                dbc.Row(
+                    [
+                        dbc.Col(
+                            [
+                                dbc.Badge("Group 1:", color="info", className="mr-1"),
+                                dcc.Dropdown(
+                                    id="groupA",
+                                    options=runOptions,
+                                    value=runNames[0] if runNames else None,
+                                    clearable=False,
+                                ),
+                            ]
+                        ),
+                        dbc.Col(
+                            [
+                                dbc.Badge("Group 2:", color="info", className="mr-1"),
+                                dcc.Dropdown(
+                                    id="groupB",
+                                    options=runOptions,
+                                    value=runNames[min(1, len(runNames) - 1)] if runNames else None,
+                                    clearable=False,
+                                ),
+                            ]
+                        ),
+                    ]
+                ),
+                dcc.Graph(
+                    id="groupDeltaPlot",
+                    figure={},
+                    responsive=False,
+                    style={"display": "inline-block", "width": "50%"},
+                ),
+                dcc.Graph(
+                    id="groupCliquePlot",
+                    figure={},
+                    responsive=False,
+                    style={"display": "inline-block", "width": "50%"},
+                ),
+                # network2,
+            ]
+        ),
+        className="mt-3",
+    )
 
-# Tab 3
-tab3_content = dbc.Card(
-    dbc.CardBody(
+    tabs = dbc.Card(
         [
-            html.H5("Clique fraction plot: ", className="card-text"),
-            dcc.Graph(
-                figure=cliquePlot,
-                responsive=True,
-                style={"display": "inline-block", "width": "50%"},
+            dbc.CardHeader(
+                dbc.Tabs(
+                    [
+                        dbc.Tab(tab1_content, label="Introduction", tab_id="tab-1"),
+                        dbc.Tab(tab2_content, label="Network", tab_id="tab-2"),
+                        dbc.Tab(tab3_content, label="Putative CRC TFs", tab_id="tab-3"),
+                        dbc.Tab(tab4_content, label="Group Comparison", tab_id="tab-4"),
+                    ],
+                    id="tabs",
+                    active_tab="tab-1",
+                )
             ),
-            dcc.Graph(
-                figure=fig_In,
-                responsive=True,
-                style={"display": "inline-block", "width": "50%"},
-            ),
-            # network2,
-        ]
-    ),
-    className="mt-3",
-)
-
+            dbc.CardBody(html.P(id="card-content", className="card-text")),
+        ],
+        style={"height": "100vh"},
+    )
 
-# Tab 4
-tab4_content = dbc.Card(
-    dbc.CardBody(
+    # App layout
+    app.layout = html.Div(
         [
-            html.H5("Group comparison plot:", className="card-text"),
-            dcc.Graph(
-                figure=fig,
-                responsive=False,
-                style={"display": "inline-block", "width": "50%"},
+            # hpage,
+            dbc.Row(
+                dbc.Col(header, width=12),
             ),
-            dcc.Graph(
-                figure=fig_CF,
-                responsive=False,
-                style={"display": "inline-block", "width": "50%"},
+            dbc.Row(
+                dbc.Col(tabs),
             ),
-            # network2,
+            # tabs
         ]
-    ),
-    className="mt-3",
-)
-
-
-tabs = dbc.Card(
-    [
-        dbc.CardHeader(
-            dbc.Tabs(
-                [
-                    dbc.Tab(tab1_content, label="Introduction", tab_id="tab-1"),
-                    dbc.Tab(tab2_content, label="Network", tab_id="tab-2"),
-                    dbc.Tab(tab3_content, label="Putative CRC TFs", tab_id="tab-3"),
-                    dbc.Tab(tab4_content, label="Group Comparison", tab_id="tab-4"),
-                ],
-                id="tabs",
-                active_tab="tab-1",
-            )
-        ),
-        dbc.CardBody(html.P(id="card-content", className="card-text")),
-    ],
-    style={"height": "100vh"},
-)
-
-# App layout
-app.layout = html.Div(
-    [
-        # hpage,
-        dbc.Row(
-            dbc.Col(header, width=12),
-        ),
-        dbc.Row(
-            dbc.Col(tabs),
-        ),
-        # tabs
-    ]
-)
-
+    )
 
-@app.callback(
-    Output("cytoscape-layout-2", "elements"),
-    [
+    @app.callback(
+        Output("inDegree", "options"),
+        Output("inDegree", "value"),
+        Output("outDegree", "options"),
+        Output("outDegree", "value"),
+        Output("seedDropdown", "value"),
+        Output("cliquePlot", "figure"),
+        Output("inOutPlot", "figure"),
+        Input("runDropdown", "value"),
+    )
+    def select_run(runName):
+        if runName is None:
+            return [], None, [], None, [], {}, {}
+        run = store.get(runName)
+        return (
+            degreeOptions(run.meta["In"]),
+            int(run.meta["In"].min()),
+            degreeOptions(run.meta["Out"]),
+            int(run.meta["Out"].min()),
+            [],
+            figures.memoize(("clique", runName), cliqueFigure, run.degrees, run.top_cliques),
+            figures.memoize(("inOut", runName), inOutFigure, run.degrees),
+        )
+
+    @app.callback(
+        Output("seedDropdown", "options"),
+        Input("seedDropdown", "search_value"),
+        State("seedDropdown", "value"),
+        State("runDropdown", "value"),
+    )
+    def search_seeds(searchValue, seeds, runName):
+        # Only send the nodes matching the search, as a genome-wide network has too
+        # many to list. Selected nodes must stay in the options.
+        seeds = seeds or []
+        if runName is None:
+            return []
+        matches = []
+        if searchValue:
+            index = store.get(runName).index
+            matches = [name for name in index.names[index.search(searchValue)] if name not in seeds]
+        return [{"label": i, "value": i} for i in seeds + matches]
+
+    def neighborhood(index, seeds, hops):
+        """Get the codes of the nodes near the seeds, and their distances, or None for all nodes."""
+        if not seeds:
+            return None, None
+        return index.neighborhood(index.codes(seeds), hops)
+
+    @app.callback(
+        Output("cytoscape-layout-2", "elements"),
+        Output("cytoscape-layout-2", "layout"),
+        Output("elementNote", "children"),
+        Output("shownView", "data"),
         Input("nodeDropdown", "value"),
-    ],
-)
-def filter_nodes(selectNodes):
-    # Generate node list
-    filterDf = netInputDf[netInputDf["node"].isin(selectNodes)]
-    subNodes = getUniqueNodes(
-        filterDf["node"].unique(), filterDf["edge"], metaDict, metaDf
+        Input("maxElements", "value"),
+        Input("dropdown-update-layout", "value"),
+        State("seedDropdown", "value"),
+        State("hops", "value"),
+        State("runDropdown", "value"),
+        State("shownView", "data"),
     )
-    subEdges = getEdges(filterDf["node"], filterDf["edge"])
-    return subNodes + subEdges
-
-
-@app.callback(
-    Output("nodeDropdown", "options"),
-    Output("nodeDropdown", "value"),
-    [
-        Input("inDegree", "value"),
-        Input("outDegree", "value"),
-    ],
-)
-def filter_nodes(inputDegree, outputDegree):
-    # Generate node list
-    genes = list(
-        metaDf.loc[
-            (metaDf["In"] >= inputDegree) & (metaDf["Out"] >= outputDegree), "node"
-        ]
+    def filter_elements(selectNodes, maxElements, layout, seeds, hops, runName, shownView):
+        # Nodes come with their positions, so the browser only has to draw them.
+        preset = {"name": "preset", "fit": True}
+        if runName is None:
+            return [], preset, "", None
+        index = store.get(runName).index
+        sources = index.codes(selectNodes or [])
+        distance = None
+        hood, hoodDistance = neighborhood(index, seeds, hops)
+        if hood is not None:
+            distance = pd.Series(hoodDistance, index=hood).reindex(sources).fillna(hops + 1).to_numpy()
+        elements, total = index.elements(
+            sources, limit=maxElements or MAX_ELEMENTS, distance=distance, layout=layout
+        )
+        if len(elements) < total:
+            note = f"Showing the {len(elements)} most connected of {total} elements."
+        else:
+            note = f"Showing all {total} elements."
+
+        # Send only the changes to the elements shown, if they are known and fewer.
+        update = elements
+        shown = views.get(shownView) if shownView else None
+        if shown is not None:
+            moved, removed, added, patched = diff_elements(shown, elements)
+            if len(moved) + len(removed) + len(added) < len(elements):
+                elements = patched
+                update = Patch()
+                for i, position in moved:
+                    update[i]["position"] = position
+                for i in removed:
+                    del update[i]
+                update.extend(added)
+        viewId = uuid.uuid4().hex
+        views.put(viewId, elements)
+        return update, preset, note, viewId
+
+    @app.callback(
+        Output("nodeDropdown", "options"),
+        Output("nodeDropdown", "value"),
+        [
+            Input("inDegree", "value"),
+            Input("outDegree", "value"),
+            Input("seedDropdown", "value"),
+            Input("hops", "value"),
+        ],
+        State("maxElements", "value"),
+        State("runDropdown", "value"),
     )
-    dropOptions = [
-        {
-            "label": i,
-            "value": i,
-        }
-        for i in genes
-    ]
-    return dropOptions, genes
-
-
-@app.callback(
-    Output("cytoscape-layout-2", "layout"), Input("dropdown-update-layout", "value")
-)
-def update_layout(layout):
-    return {"name": layout, "directed": True, "animate": True}
-
+    def filter_nodes(inputDegree, outputDegree, seeds, hops, maxElements, runName):
+        if runName is None or inputDegree is None or outputDegree is None:
+            return [], []
+        index = store.get(runName).index
+        hood, distance = neighborhood(index, seeds, hops)
+        # Generate node list, at most as many as can be shown.
+        codes = index.degree_range(inputDegree, outputDegree, candidates=hood, distance=distance)
+        genes = index.names[codes[: maxElements or MAX_ELEMENTS]].tolist()
+        dropOptions = [
+            {
+                "label": i,
+                "value": i,
+            }
+            for i in genes
+        ]
+        return dropOptions, genes
 
-@app.callback(
-    Output("cytoscape-layout-2", "stylesheet"),
-    Input("input-edge-color", "value"),
-    Input("input-node-color", "value"),
-)
-def update_stylesheet(line_color, bg_color):
-    if line_color is None:
-        line_color = "gray"
+    @app.callback(
+        Output("groupDeltaPlot", "figure"),
+        Output("groupCliquePlot", "figure"),
+        Input("groupA", "value"),
+        Input("groupB", "value"),
+    )
+    def compare_groups(nameA, nameB):
+        if nameA is None or nameB is None:
+            return {}, {}
+        runA, runB = store.get(nameA), store.get(nameB)
+        return figures.memoize(
+            ("group", nameA, nameB),
+            groupFigures,
+            runA.degrees,
+            runB.degrees,
+            nameA,
+            nameB,
+            runA.top_cliques,
+            runB.top_cliques,
+        )
+
+    @app.callback(
+        Output("cytoscape-layout-2", "stylesheet"),
+        Input("input-edge-color", "value"),
+        Input("input-node-color", "value"),
+    )
+    def update_stylesheet(line_color, bg_color):
+        if line_color is None:
+            line_color = "gray"
 
-    if bg_color is None:
-        bg_color = "gray"
+        if bg_color is None:
+            bg_color = "gray"
 
-    new_styles = [
-        {"selector": "node", "style": {"background-color": bg_color}},
-        {"selector": "edge", "style": {"line-color": line_color}},
-    ]
+        # Only the colors of the stylesheet change.
+        new_styles = Patch()
+        new_styles[len(extraStyle)]["style"]["background-color"] = bg_color
+        new_styles[len(extraStyle) + 1]["style"]["line-color"] = line_color
 
-    return extraStyle + new_styles
+        return new_styles
 
+    @app.callback(
+        Output("collapseFlow", "is_open"),
+        [Input("flow-button", "n_clicks")],
+        [State("collapseFlow", "is_open")],
+    )
+    def toggle_collapse(n, is_open):
+        return not is_open if n else is_open
 
-@app.callback(
-    Output("collapseFlow", "is_open"),
-    [Input("flow-button", "n_clicks")],
-    [State("collapseFlow", "is_open")],
-)
-def toggle_collapse(n, is_open):
-    return not is_open if n else is_open
+    return app
 
 
 if __name__ == "__main__":
-    app.run_server(port=8888, debug=True)
+    parser = argparse.ArgumentParser(description="Launch the CRCminer report app.")
+    parser.add_argument("--indir", nargs="+", default=[os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")],
+                        help="Directories containing CRCminer results.")
+    parser.add_argument("--port", type=int, default=8888, help="Port to serve the app on.")
+    parser.add_argument("--cache-mb", type=float, default=DEFAULT_CACHE_MB,
+                        help="Bound on the size of the loaded runs, in megabytes.")
+    args = parser.parse_args()
+
+    app = create_app(args.indir, cache_mb=args.cache_mb)
+    app.run(port=args.port, debug=True)
@@ -0,0 +1,659 @@
+"""
+Discovery and lazy, size-bounded loading of CRCminer runs for the report app.
+"""
+import os
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from crcminer import profiling
+from crcminer.edges import _csr, _distinct
+
+# File name suffixes of each table of a run, with the run name as prefix, e.g.
+# "<name>_TF_Degrees.csv" as written by 'mine'. A bare file name, e.g. "TF_Degrees.csv"
+# as written by network.py, belongs to the run named after its directory.
+TABLE_SUFFIXES = {
+    "degrees": ["_degreeTable.txt", "_TF_Degrees.csv", "TF_Degrees.csv"],
+    "edges": ["_EdgeTable.txt", "_edges.txt"],
+    "nodes": ["_NodesTPM.txt"],
+    "cliques": ["_Putative_CRC_Cliques.txt", "_Putative_CRC_Cliques.csv", "Putative_CRC_Cliques.csv"],
+}
+
+# Directories never searched for runs, e.g. the stage cache of 'mine'.
+SKIP_DIRS = {"cache", "__pycache__", "assets"}
+
+# Default cap on the number of Cytoscape elements, nodes plus edges, sent to the browser.
+MAX_ELEMENTS = 2000
+
+# Node layouts computed on the server, by the name of the Cytoscape layout they stand
+# in for. "cose" is force-directed.
+LAYOUTS = ["cose", "grid", "circle", "concentric", "random"]
+
+# Distance between neighboring nodes in the non-force-directed layouts, in pixels.
+LAYOUT_SPACING = 80
+
+# Number of layouts kept per run, one per layout and set of shown elements.
+LAYOUT_CACHE_SIZE = 32
+
+# Default bound on the size of the loaded runs.
+DEFAULT_CACHE_MB = 512
+
+metaDict = {"EN": "red triangle", "TF": ""}
+
+
+class LRUCache:
+    """
+    Thread-safe mapping that keeps only its most recently used entries.
+
+    :param maxsize: Maximum number of entries.
+    :type maxsize: int
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Get an entry, marking it as recently used, or ``default`` if missing."""
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        """Add or replace an entry, dropping the least recently used ones beyond the size."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def memoize(self, key, func, *args, **kwargs):
+        """Get an entry, or compute it with ``func`` and add it if missing."""
+        value = self.get(key, self)
+        if value is self:
+            value = func(*args, **kwargs)
+            self.put(key, value)
+        return value
+
+
+def _match_table(fname):
+    """Get the table type and run name prefix of a file name, or None."""
+    for table, suffixes in TABLE_SUFFIXES.items():
+        for suffix in suffixes:
+            if fname == suffix.lstrip("_"):
+                return table, ""
+            if fname.endswith(suffix) and len(fname) > len(suffix):
+                return table, fname[: -len(suffix)]
+    return None
+
+
+def _run_label(indir, root, name, level):
+    """Get a run's name, qualified by its directory to the given level, to tell clashing runs apart."""
+    if level == 0:
+        return name
+    rel = os.path.relpath(root, indir)
+    parts = [] if rel == os.curdir else rel.split(os.sep)
+    if level > 1:
+        parts.insert(0, os.path.basename(indir))
+    # 'mine' writes a run to a directory named after it, so don't repeat the name.
+    if not parts or parts[-1] != name:
+        parts.append(name)
+    return "/".join(parts)
+
+
+def discover_runs(indirs):
+    """
+    Find the runs under one or more directories, without reading any tables.
+
+    A run is a set of tables sharing a file name prefix within a directory, and needs
+    at least an edge or degree table. Runs are named by their prefix, or by their
+    directory if their files have none. Clashing names are replaced by the run's path
+    relative to its input directory, then also prefixed by the input directory, and
+    numbered if they still clash, so that every run is listed.
+
+    :param indirs: Directories to search, recursively.
+    :type indirs: list
+    ...
+    :return: Table paths of each run, keyed by table type, keyed by run name, in
+        sorted order of name.
+    :rtype: dict
+    """
+
+    found = {}
+    origin = {}
+    for indir in indirs:
+        for root, dirs, files in os.walk(indir):
+            dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS and not d.startswith("."))
+            for fname in files:
+                match = _match_table(fname)
+                if match is None:
+                    continue
+                table, prefix = match
+                name = prefix or os.path.basename(os.path.abspath(root))
+                key = (os.path.abspath(root), name)
+                found.setdefault(key, {})[table] = os.path.join(root, fname)
+                # Directories under more than one input directory are named after the first.
+                origin.setdefault(key, os.path.abspath(indir))
+
+    keys = [key for key in sorted(found) if "edges" in found[key] or "degrees" in found[key]]
+    names = {key: key[1] for key in keys}
+    for level in (1, 2):
+        counts = Counter(names.values())
+        for key in keys:
+            if counts[names[key]] > 1:
+                names[key] = _run_label(origin[key], *key, level)
+
+    runs = {}
+    for key in keys:
+        name, n = names[key], 1
+        while name in runs:
+            n += 1
+            name = f"{names[key]} ({n})"
+        runs[name] = found[key]
+    return dict(sorted(runs.items()))
+
+
+def _gather(offsets, values, rows):
+    """Get the values of the given rows of a CSR structure, concatenated."""
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    total = int(lengths.sum())
+    # Position of each value within its row, added to the offset of the row.
+    within = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return values[np.repeat(starts, lengths) + within]
+
+
+def _force_layout(n, source, target, iterations=50, seed=0, block=1024):
+    """
+    Fruchterman-Reingold force-directed layout, vectorized over all node pairs.
+
+    Repulsion between all pairs is computed in blocks of rows, bounding memory to
+    ``block`` times ``n`` pairs, and attraction along edges with scatter-adds.
+    """
+
+    rng = np.random.default_rng(seed)
+    pos = rng.random((n, 2)).astype(np.float32)
+    k2 = np.float32(1.0 / max(n, 1))
+    k = np.sqrt(k2)
+    temp = 0.1
+    for _ in range(iterations):
+        disp = np.empty((n, 2), dtype=np.float32)
+        for lo in range(0, n, block):
+            dx = pos[lo:lo + block, 0, None] - pos[None, :, 0]
+            dy = pos[lo:lo + block, 1, None] - pos[None, :, 1]
+            inv = k2 / np.maximum(dx * dx + dy * dy, np.float32(1e-6))
+            disp[lo:lo + block, 0] = (dx * inv).sum(1)
+            disp[lo:lo + block, 1] = (dy * inv).sum(1)
+        delta = pos[source] - pos[target]
+        force = delta * (np.sqrt((delta * delta).sum(1)) / k)[:, None]
+        np.subtract.at(disp, source, force)
+        np.add.at(disp, target, force)
+        # Move each node along its displacement, by at most the current temperature.
+        length = np.maximum(np.sqrt((disp * disp).sum(1)), np.float32(1e-9))
+        pos += disp * (np.minimum(length, temp) / length)[:, None]
+        temp -= 0.1 / (iterations + 1)
+    return pos
+
+
+def layout_positions(layout, n, source, target):
+    """
+    Compute node positions for a network view.
+
+    :param layout: Layout name, from :data:`LAYOUTS`.
+    :type layout: str
+    :param n: Number of nodes, ranked by relevance, as positions are filled in that
+        order by the grid, circle and concentric layouts.
+    :type n: int
+    :param source: Index of the TF of each edge, into the nodes.
+    :type source: :class:`numpy.ndarray`
+    :param target: Index of the target of each edge, into the nodes.
+    :type target: :class:`numpy.ndarray`
+    ...
+    :return: x and y position of each node, in pixels.
+    :rtype: :class:`numpy.ndarray`
+    """
+
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout: {layout}")
+    i = np.arange(n)
+    size = np.sqrt(max(n, 1)) * LAYOUT_SPACING
+    if layout == "grid":
+        cols = int(np.ceil(np.sqrt(max(n, 1))))
+        return np.c_[i % cols, i // cols] * LAYOUT_SPACING
+    if layout == "circle":
+        radius = max(n * LAYOUT_SPACING / (2 * np.pi), LAYOUT_SPACING)
+        angle = 2 * np.pi * i / max(n, 1)
+        return np.c_[np.cos(angle), np.sin(angle)] * radius
+    if layout == "concentric":
+        # Most relevant node in the center, then rings of 6, 12, 18... nodes outwards.
+        capacity = np.r_[1, 6 * np.arange(1, n + 1)]
+        ring = np.searchsorted(np.cumsum(capacity), i, side="right")
+        within = i - (np.cumsum(capacity) - capacity)[ring]
+        angle = 2 * np.pi * within / capacity[ring]
+        return np.c_[np.cos(angle), np.sin(angle)] * (ring * LAYOUT_SPACING)[:, None]
+    if layout == "random":
+        return np.random.default_rng(0).random((n, 2)) * size
+
+    if not n:
+        return np.zeros((0, 2))
+    pos = _force_layout(n, source, target)
+    pos -= pos.min(0)
+    return pos / max(float(pos.max()), 1e-9) * size
+
+
+class NetworkIndex:
+    """
+    Adjacency and degree index of a run's network, answering the dashboard's node and
+    element queries without scanning all nodes or edges.
+
+    Nodes are integer codes. Edges are kept once each, grouped by TF in CSR form, along
+    with an undirected adjacency for neighborhood queries and nodes sorted by in- and
+    out-degree for degree range queries. Nodes are ranked by total degree, so capped
+    responses keep the best connected nodes. Node positions of each view are computed
+    once and cached.
+
+    :param edges: Edges, with "node" (TF) and "edge" (target) columns.
+    :type edges: :class:`pandas.DataFrame`
+    :param meta: One row per node, with "node", "type", "In" and "Out" columns. Must
+        include every node of ``edges``.
+    :type meta: :class:`pandas.DataFrame`
+    """
+
+    def __init__(self, edges, meta):
+        self.names = meta["node"].to_numpy(dtype=object)
+        self.classes = meta["type"].map(metaDict).to_numpy(dtype=object)
+        self.in_degree = meta["In"].to_numpy(dtype=np.int64)
+        self.out_degree = meta["Out"].to_numpy(dtype=np.int64)
+        self._lookup = pd.Index(self.names)
+        n = len(self.names)
+
+        # Position of each node when ranked by total degree, ties by name.
+        order = np.lexsort((self.names.astype(str), -(self.in_degree + self.out_degree)))
+        self.rank = np.empty(n, dtype=np.int64)
+        self.rank[order] = np.arange(n)
+
+        keys = _distinct(
+            self._lookup.get_indexer(edges["node"]).astype(np.int64) * n
+            + self._lookup.get_indexer(edges["edge"])
+        )
+        self.source, self.target = keys // n, keys % n
+        self._out_offsets, self._out_edges = _csr(self.source, np.arange(len(keys)), n)
+        self._adj_offsets, self._adj_nodes = _csr(
+            np.r_[self.source, self.target], np.r_[self.target, self.source], n
+        )
+
+        self._by_in = np.argsort(self.in_degree, kind="stable")
+        self._by_out = np.argsort(self.out_degree, kind="stable")
+        self._by_name = np.argsort(self.names.astype(str), kind="stable")
+        self._sorted_names = self.names[self._by_name].astype(str)
+
+        self._layouts = LRUCache(LAYOUT_CACHE_SIZE)
+
+    def nbytes(self):
+        """Size of the index arrays, in bytes."""
+        return sum(a.nbytes for a in vars(self).values() if isinstance(a, np.ndarray))
+
+    def codes(self, names):
+        """Get the codes of node names, dropping unknown names."""
+        codes = self._lookup.get_indexer(list(names))
+        return codes[codes >= 0]
+
+    def search(self, prefix, limit=50):
+        """
+        Find nodes by name prefix, with a binary search over the sorted names.
+
+        :param prefix: Start of the node names.
+        :type prefix: str
+        :param limit: Maximum number of nodes returned.
+        :type limit: int
+        ...
+        :return: Codes of the first ``limit`` matching nodes, by name.
+        :rtype: :class:`numpy.ndarray`
+        """
+
+        lo = np.searchsorted(self._sorted_names, prefix, side="left")
+        hi = np.searchsorted(self._sorted_names, prefix + "\U0010ffff", side="left")
+        return self._by_name[lo:min(hi, lo + limit)]
+
+    def degree_range(self, min_in=0, min_out=0, candidates=None, distance=None):
+        """
+        Get the nodes with at least the given in- and out-degree.
+
+        Only the nodes past the lower bound in the sparser of the two degree orders are
+        visited, so selective thresholds do not scan the whole network.
+
+        :param min_in: Minimum in-degree.
+        :type min_in: int
+        :param min_out: Minimum out-degree.
+        :type min_out: int
+        :param candidates: Codes to limit the query to, e.g. a neighborhood.
+        :type candidates: :class:`numpy.ndarray`
+        :param distance: Distance of each candidate from the seeds of a neighborhood, to
+            rank nodes by first.
+        :type distance: :class:`numpy.ndarray`
+        ...
+        :return: Codes of the nodes, ranked by distance, if given, then total degree.
+        :rtype: :class:`numpy.ndarray`
+        """
+
+        if candidates is None:
+            in_first = np.searchsorted(self.in_degree[self._by_in], min_in, side="left")
+            out_first = np.searchsorted(self.out_degree[self._by_out], min_out, side="left")
+            if len(self._by_in) - in_first <= len(self._by_out) - out_first:
+                candidates = self._by_in[in_first:]
+            else:
+                candidates = self._by_out[out_first:]
+        candidates = np.asarray(candidates, dtype=np.int64)
+        keep = (self.in_degree[candidates] >= min_in) & (self.out_degree[candidates] >= min_out)
+        return self.ranked(candidates[keep], None if distance is None else np.asarray(distance)[keep])
+
+    def neighborhood(self, seeds, hops=1):
+        """
+        Get the nodes within a number of edges of the seeds, in either direction.
+
+        The search only visits edges of reached nodes.
+
+        :param seeds: Codes of the seed nodes.
+        :type seeds: :class:`numpy.ndarray`
+        :param hops: Number of edges to follow from the seeds.
+        :type hops: int
+        ...
+        :return: Codes of the reached nodes, including the seeds, and the number of
+            edges from the nearest seed to each.
+        :rtype: tuple
+        """
+
+        visited = _distinct(np.asarray(seeds, dtype=np.int64))
+        distance = np.zeros(len(visited), dtype=np.int64)
+        frontier = visited
+        for hop in range(1, hops + 1):
+            if not len(frontier):
+                break
+            reached = _distinct(_gather(self._adj_offsets, self._adj_nodes, frontier))
+            frontier = reached[~np.isin(reached, visited, assume_unique=True)]
+            visited = np.r_[visited, frontier]
+            distance = np.r_[distance, np.full(len(frontier), hop, dtype=np.int64)]
+        return visited, distance
+
+    def ranked(self, codes, distance=None):
+        """Order node codes by distance from the seeds, if given, then rank."""
+        codes = np.asarray(codes, dtype=np.int64)
+        keys = (self.rank[codes],) if distance is None else (self.rank[codes], distance)
+        return codes[np.lexsort(keys)]
+
+    def positions(self, layout, nodes, source, target):
+        """
+        Get the layout of a view, computing it if it is not cached.
+
+        :param layout: Layout name, from :data:`LAYOUTS`.
+        :type layout: str
+        :param nodes: Codes of the shown nodes, ranked.
+        :type nodes: :class:`numpy.ndarray`
+        :param source: Codes of the TF of each shown edge.
+        :type source: :class:`numpy.ndarray`
+        :param target: Codes of the target of each shown edge.
+        :type target: :class:`numpy.ndarray`
+        ...
+        :return: x and y position of each node, in pixels.
+        :rtype: :class:`numpy.ndarray`
+        """
+
+        # Edges as indices into the shown nodes.
+        order = np.argsort(nodes, kind="stable")
+        return self._layouts.memoize(
+            (layout, nodes.tobytes(), source.tobytes(), target.tobytes()),
+            layout_positions,
+            layout,
+            len(nodes),
+            order[np.searchsorted(nodes[order], source)],
+            order[np.searchsorted(nodes[order], target)],
+        )
+
+    def elements(self, sources, limit=MAX_ELEMENTS, distance=None, layout=None):
+        """
+        Get the Cytoscape elements of the edges of the given TFs, capped in number.
+
+        Nodes are ranked by distance from the seeds, if given, then by total degree. The
+        most relevant nodes are kept, followed by the edges between them, with as many
+        nodes as fit in ``limit`` elements with their edges.
+
+        :param sources: Codes of the TFs whose edges to show.
+        :type sources: :class:`numpy.ndarray`
+        :param limit: Maximum number of elements.
+        :type limit: int
+        :param distance: Distance of each node of ``sources`` from the seeds, see
+            :meth:`neighborhood`. Targets outside ``sources`` rank after them.
+        :type distance: :class:`numpy.ndarray`
+        :param layout: Layout to give node positions for, from :data:`LAYOUTS`, for a
+            "preset" Cytoscape layout. Defaults to no positions.
+        :type layout: str
+        ...
+        :return: The node and edge elements, and the total number of elements before
+            the cap.
+        :rtype: tuple
+        """
+
+        sources = np.asarray(sources, dtype=np.int64)
+        edge_ids = _gather(self._out_offsets, self._out_edges, sources)
+        source, target = self.source[edge_ids], self.target[edge_ids]
+
+        # Nodes of the edges, with their positions once ranked.
+        nodes = _distinct(np.r_[source, target])
+        hops = None
+        if distance is not None:
+            # Targets outside the sources rank after all of them.
+            hops = np.full(len(nodes), int(np.max(distance, initial=0)) + 1, dtype=np.int64)
+            shown = np.isin(sources, nodes)
+            hops[np.searchsorted(nodes, sources[shown])] = np.asarray(distance)[shown]
+        order = np.lexsort((self.rank[nodes],) if hops is None else (self.rank[nodes], hops))
+        position = np.empty(len(nodes), dtype=np.int64)
+        position[order] = np.arange(len(nodes))
+        total = len(nodes) + len(edge_ids)
+
+        # An edge is shown once both of its nodes are, i.e. after the later of the two.
+        shown_after = np.maximum(
+            position[np.searchsorted(nodes, source)], position[np.searchsorted(nodes, target)]
+        )
+        edge_order = np.argsort(shown_after, kind="stable")
+        shown_after = shown_after[edge_order]
+        # Elements needed to show the first k nodes, for each k.
+        needed = np.arange(1, len(nodes) + 1) + np.searchsorted(shown_after, np.arange(len(nodes)), side="right")
+        k = int(np.searchsorted(needed, limit, side="right"))
+        nodes = nodes[order[:k]]
+        edges = edge_order[:int(np.searchsorted(shown_after, k - 1, side="right")) if k else 0]
+
+        elements = [
+            {"data": {"id": name, "label": name}, "classes": cls}
+            for name, cls in zip(self.names[nodes], self.classes[nodes])
+        ]
+        if layout is not None:
+            pos = self.positions(layout, nodes, source[edges], target[edges])
+            for element, (x, y) in zip(elements, pos.tolist()):
+                element["position"] = {"x": x, "y": y}
+        elements += [
+            {"data": {"source": s, "target": t}}
+            for s, t in zip(self.names[source[edges]], self.names[target[edges]])
+        ]
+        return elements, total
+
+
+def element_key(element):
+    """Get the identity of a Cytoscape element, its node ID or its edge's nodes."""
+    data = element["data"]
+    return data["id"] if "id" in data else (data["source"], data["target"])
+
+
+def diff_elements(old, new):
+    """
+    Get the changes turning one Cytoscape element list into another, for partial updates.
+
+    Elements in both lists keep their place in ``old``, so the updated list has the kept
+    elements in their old order, followed by the added ones. Only the positions of kept
+    elements are compared, as the rest of an element is identified by its key.
+
+    :param old: Elements shown.
+    :type old: list
+    :param new: Elements to show.
+    :type new: list
+    ...
+    :return: Changed positions of kept nodes as (index in ``old``, position) pairs,
+        indices into ``old`` of removed elements, in decreasing order so they can be
+        deleted one after the other, the added elements, and the updated list.
+    :rtype: tuple
+    """
+
+    new_by_key = {element_key(element): element for element in new}
+    old_keys = set()
+    moved, removed, kept = [], [], []
+    for i, element in enumerate(old):
+        key = element_key(element)
+        current = new_by_key.get(key)
+        # Elements changed other than in position, e.g. a node's type in another run, are replaced.
+        if current is None or any(current.get(k) != element.get(k) for k in ("data", "classes")):
+            removed.append(i)
+            continue
+        old_keys.add(key)
+        if current.get("position") != element.get("position"):
+            moved.append((i, current["position"]))
+        kept.append(current)
+    added = [element for key, element in new_by_key.items() if key not in old_keys]
+    return moved, removed[::-1], added, kept + added
+
+
+def _read_table(path):
+    """Read a comma- or tab-delimited table, telling them apart by the header line."""
+    with open(path) as f:
+        header = f.readline()
+    if not header:
+        # Empty, e.g. the clique table of a network without CRC cliques.
+        return pd.DataFrame()
+    return pd.read_csv(path, sep="\t" if "\t" in header else ",")
+
+
+class RunData:
+    """
+    Parsed tables and network elements of one run.
+
+    :param name: Run name.
+    :type name: str
+    :param tables: Paths of the run's tables, keyed by table type, from :func:`discover_runs`.
+    :type tables: dict
+    """
+
+    def __init__(self, name, tables):
+        self.name = name
+
+        # Edges as "node" (TF) and "edge" (target) columns, as in the EdgeTable files.
+        self.edges = pd.DataFrame({"node": [], "edge": []}, dtype=object)
+        if "edges" in tables:
+            edges = _read_table(tables["edges"])
+            self.edges = edges.rename(columns={"TF": "node", "target": "edge"})[["node", "edge"]]
+
+        # Runs mined with --top-k have clique fractions over their best cliques only.
+        self.top_cliques = False
+        if "degrees" in tables:
+            degrees = _read_table(tables["degrees"])
+            if "TF_TopCliqueFraction" in degrees.columns:
+                self.top_cliques = True
+                degrees = degrees.rename(columns={"TF_TopCliqueFraction": "TF_CliqueFraction"})
+            self.degrees = degrees[
+                [c for c in ("TF", "Out", "In", "Total", "TF_CliqueFraction") if c in degrees.columns]
+            ]
+        else:
+            distinct = self.edges.drop_duplicates()
+            out_degree = distinct["node"].value_counts()
+            in_degree = distinct["edge"].value_counts()
+            self.degrees = pd.DataFrame({"Out": out_degree, "In": in_degree}).fillna(0).astype(int)
+            self.degrees["Total"] = self.degrees["Out"] + self.degrees["In"]
+            self.degrees = self.degrees.rename_axis("TF").reset_index()
+        # Runs without clique fractions, e.g. with only an edge table, show none rather than NaN.
+        if "TF_CliqueFraction" not in self.degrees.columns:
+            self.degrees["TF_CliqueFraction"] = 0.0
+        self.degrees["TF_CliqueFraction"] = self.degrees["TF_CliqueFraction"].fillna(0.0)
+        self.degrees = self.degrees.sort_values(by="TF_CliqueFraction", ascending=False)
+
+        # One row per node, with its type and degrees. Nodes without a type are TFs if
+        # they regulate anything, and enhancer targets otherwise.
+        nodes = pd.DataFrame(
+            {"node": pd.unique(pd.concat([self.edges["node"], self.edges["edge"], self.degrees["TF"]]))}
+        )
+        meta = nodes.merge(self.degrees.rename(columns={"TF": "node"}), on="node", how="left")
+        meta[["Out", "In", "Total"]] = meta[["Out", "In", "Total"]].fillna(0).astype(int)
+        if "nodes" in tables:
+            info = _read_table(tables["nodes"]).drop_duplicates("node")
+            meta = meta.merge(info, on="node", how="left")
+        if "type" not in meta.columns:
+            meta["type"] = None
+        meta["type"] = meta["type"].where(meta["type"].isin(list(metaDict)), None)
+        meta["type"] = meta["type"].fillna(pd.Series("TF", index=meta.index).where(meta["Out"] > 0, "EN"))
+        self.meta = meta
+
+        self.cliques = None
+        if "cliques" in tables:
+            self.cliques = _read_table(tables["cliques"])
+
+        self.index = NetworkIndex(self.edges, self.meta)
+
+    def nbytes(self):
+        """Approximate memory use of the run, in bytes."""
+        frames = [self.edges, self.degrees, self.meta] + ([self.cliques] if self.cliques is not None else [])
+        return sum(int(df.memory_usage(deep=True).sum()) for df in frames) + self.index.nbytes()
+
+
+class RunStore:
+    """
+    Runs found under a set of directories, loaded when first requested.
+
+    Loaded runs are kept in a least-recently-used cache bounded by their approximate
+    size, so pointing the app at hundreds of runs neither slows its startup nor
+    grows its memory without bound.
+
+    :param indirs: Directories to search for runs, see :func:`discover_runs`.
+    :type indirs: list
+    :param max_mb: Bound on the size of the loaded runs, in megabytes. The most recently
+        used run is always kept, even if larger.
+    :type max_mb: float
+    """
+
+    def __init__(self, indirs, max_mb=DEFAULT_CACHE_MB):
+        self.runs = discover_runs(indirs)
+        self.max_bytes = max_mb * 1024 * 1024
+        self._cache = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    @property
+    def names(self):
+        """Names of all runs found, sorted."""
+        return list(self.runs)
+
+    def get(self, name):
+        """
+        Get a run's data, loading it if it is not cached.
+
+        :param name: Run name.
+        :type name: str
+        ...
+        :return: The run.
+        :rtype: :class:`RunData`
+        """
+
+        with self._lock:
+            if name in self._cache:
+                self._cache.move_to_end(name)
+                return self._cache[name]
+
+            with profiling.stage("load_run", label=name):
+                run = RunData(name, self.runs[name])
+                profiling.add_counts(edges=len(run.edges), nodes=len(run.meta))
+            self._cache[name] = run
+            self._sizes[name] = run.nbytes()
+            while len(self._cache) > 1 and sum(self._sizes.values()) > self.max_bytes:
+                evicted, _ = self._cache.popitem(last=False)
+                del self._sizes[evicted]
+            return run
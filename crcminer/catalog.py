@@ -0,0 +1,225 @@
+import hashlib
+import io
+import os
+import pickle
+
+from pymemesuite.common import MotifFile
+
+# Motif catalog bundled with CRCminer.
+MOTIF_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "Homo_sapiens.meme")
+
+# Default location of serialized catalogs, keyed by the files they were built from.
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "crcminer")
+
+# Placeholder IDs written by CRCminer map-motifs for genes it could not resolve.
+_MISSING_IDS = {"", "notfound", "badmatch"}
+
+
+def read_motif_id_map(motif_id_map):
+    """
+    Read a motif accession to gene ID mapping file.
+
+    :param motif_id_map: Path to the comma-delimited motif ID map file, as
+        written by :func:`crcminer.motifmap.write_motif_id_map`.
+    :type motif_id_map: str
+    ...
+    :return: Dictionary of gene IDs keyed by motif accession. Motifs are keyed by
+        the symbol they were resolved to, or their gene name if unresolved.
+    :rtype: dict
+    """
+
+    motif_mappings = {}
+    with open(motif_id_map) as r:
+        for line in r:
+            lines = line.strip().split(",")
+            motif_accession = lines[0]
+            gene_symbol = lines[1] if lines[2] in _MISSING_IDS else lines[2]
+            entrez = lines[3]
+            ensemble = lines[4]
+            motif_mappings[motif_accession] = {
+                "symbol": gene_symbol,
+                "entrez": entrez,
+                "ensemble": ensemble,
+            }
+
+    return motif_mappings
+
+
+class MotifCatalog:
+    """
+    Motifs from a MEME file, indexed by accession and gene IDs.
+
+    The catalog keeps the text of each motif rather than parsed pymemesuite
+    objects, which cannot be serialized, so it can be cached on disk with
+    :meth:`load` and only the motifs that are actually scanned are parsed.
+
+    :param header: MEME file header, up to the first motif.
+    :type header: bytes
+    :param blocks: Text of each motif, in file order.
+    :type blocks: list
+    :param motif_mappings: Gene IDs keyed by motif accession, may be empty.
+    :type motif_mappings: dict
+    """
+
+    def __init__(self, header, blocks, motif_mappings):
+        self.header = header
+        self.blocks = blocks
+        self.motif_mappings = motif_mappings
+        self.accessions = [block.split(None, 1)[0].decode() for block in blocks]
+
+        # Motif indices keyed by accession and by each gene ID type.
+        self.index = {"accession": {}, "symbol": {}, "entrez": {}, "ensemble": {}}
+        for i, accession in enumerate(self.accessions):
+            self.index["accession"].setdefault(accession, []).append(i)
+            for id_type, ids in motif_mappings.get(accession, {}).items():
+                for gene_id in ids.split(";"):
+                    if gene_id not in _MISSING_IDS:
+                        self.index[id_type].setdefault(gene_id, []).append(i)
+
+    def __len__(self):
+        return len(self.blocks)
+
+    @classmethod
+    def from_files(cls, motif_file, motif_id_map=None):
+        """
+        Build a catalog from a MEME motif file and an optional motif ID map.
+
+        :param motif_file: Path to the MEME motif file.
+        :type motif_file: str
+        :param motif_id_map: Path to the motif ID map file.
+        :type motif_id_map: str
+        ...
+        :return: The motif catalog.
+        :rtype: :class:`MotifCatalog`
+        """
+
+        with open(motif_file, "rb") as f:
+            header, *blocks = f.read().split(b"\nMOTIF ")
+
+        motif_mappings = {}
+        if motif_id_map is not None:
+            motif_mappings = read_motif_id_map(motif_id_map)
+
+        return cls(header + b"\n", blocks, motif_mappings)
+
+    @classmethod
+    def load(cls, motif_file, motif_id_map=None, cache_path=None):
+        """
+        Load a catalog from its binary cache, building and caching it if needed.
+
+        :param motif_file: Path to the MEME motif file.
+        :type motif_file: str
+        :param motif_id_map: Path to the motif ID map file.
+        :type motif_id_map: str
+        :param cache_path: Path of the serialized catalog. Defaults to a file in
+            ``~/.cache/crcminer`` named after the paths, sizes and modification
+            times of the source files, so edited files get a new cache.
+        :type cache_path: str
+        ...
+        :return: The motif catalog.
+        :rtype: :class:`MotifCatalog`
+        """
+
+        if cache_path is None:
+            h = hashlib.sha256()
+            for path in (motif_file, motif_id_map):
+                if path is not None:
+                    st = os.stat(path)
+                    h.update(f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+            cache_path = os.path.join(CACHE_DIR, h.hexdigest()[:32] + ".pkl")
+
+        if os.path.exists(cache_path):
+            with open(cache_path, "rb") as f:
+                return pickle.load(f)
+
+        catalog = cls.from_files(motif_file, motif_id_map)
+        catalog.save(cache_path)
+        return catalog
+
+    def save(self, path):
+        """
+        Serialize the catalog to a file.
+
+        :param path: Output path.
+        :type path: str
+        """
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}"
+        with open(tmp, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def lookup(self, gene_id, id_type="symbol"):
+        """
+        Get the indices of the motifs for a gene ID.
+
+        :param gene_id: Gene ID or motif accession.
+        :type gene_id: str
+        :param id_type: One of "accession", "symbol", "entrez" or "ensemble".
+        :type id_type: str
+        ...
+        :return: Motif indices, in file order.
+        :rtype: list
+        """
+
+        return self.index[id_type].get(gene_id, [])
+
+    def select(self, id_map_col="symbol", active_genes=None):
+        """
+        Get the motifs to scan and the ID to report for each.
+
+        Motifs without an ID map entry are reported by accession. If active genes
+        are given, only motifs with at least one active gene are selected.
+
+        :param id_map_col: Gene ID type used to report motifs and match active genes.
+        :type id_map_col: str
+        :param active_genes: Active genes. If None, all motifs are selected.
+        :type active_genes: list
+        ...
+        :return: List of (motif index, motif ID) tuples, in file order.
+        :rtype: list
+        """
+
+        if active_genes is None:
+            indices = range(len(self))
+        else:
+            # Only touch the motifs of active genes, via the ID indices. Motifs
+            # missing from the ID map are matched by accession.
+            indices = set()
+            for gene in active_genes:
+                indices.update(self.lookup(gene, id_map_col))
+                indices.update(
+                    i for i in self.lookup(gene, "accession")
+                    if self.accessions[i] not in self.motif_mappings
+                )
+            indices = sorted(indices)
+
+        selected = []
+        for i in indices:
+            accession = self.accessions[i]
+            if accession in self.motif_mappings:
+                selected.append((i, self.motif_mappings[accession][id_map_col]))
+            else:
+                selected.append((i, accession))
+
+        return selected
+
+    def motifs(self, indices):
+        """
+        Parse the motifs at the given indices.
+
+        :param indices: Motif indices.
+        :type indices: list
+        ...
+        :return: pymemesuite motifs keyed by index.
+        :rtype: dict
+        """
+
+        indices = list(indices)
+        if not indices:
+            return {}
+
+        text = self.header + b"\n".join(b"MOTIF " + self.blocks[i] for i in indices)
+        with MotifFile(io.BytesIO(text)) as mf:
+            return dict(zip(indices, mf))
@@ -1,36 +1,42 @@
 import os
 import logging
+import argparse
+
+import numpy as np
 import pandas as pd
 
+from crcminer import profiling
+from crcminer.edges import EdgeList, Vocabulary, _distinct, read_edge_table
+
 SCRIPT_PATH = os.path.abspath(__file__)
 FORMAT = "[%(asctime)s] %(levelname)s %(message)s"
 l = logging.getLogger()
-lh = logging.StreamHandler()
-lh.setFormatter(logging.Formatter(FORMAT))
-l.addHandler(lh)
-l.setLevel(logging.INFO)
 debug = l.debug
 info = l.info
 warning = l.warning
 error = l.error
 
 
-def parse_bed(bedfile):
+def parse_bed(bedfile, vocabulary=None):
+    """
+    inputs:
+    bedfile: enhancer bed file with "gene" and "motif" columns
 
-    df = pd.read_csv(bedfile, sep="\t")
-    df = df[["gene", "motif"]]  # these names are mocked.
-    df2 = df.dropna()
-    df2 = (
-        df2.assign(gene=df2["gene"].str.split(","), motif=df2["motif"].str.split(","))
-        .explode("gene")
-        .explode("motif")
-        .reset_index(drop=True)
-    )
-    # print(df.head())
-    _list = df2.values.tolist()  # edgelist
-    # return tuple
-    # (['A', 'BAR'], ['B', 'BAR'], ['C', 'BAR'], ['FOO', 'X'], ['FOO', 'Y'], ['FOO', 'Z'], ['JANE1', 'DOE'])
-    return list(df2.itertuples(index=False, name=None))
+    vocabulary: crcminer.edges.Vocabulary shared between samples, so their edges
+    have the same integer codes
+
+    Output:
+    EdgeList of the distinct TF (motif) to target (gene) edges, in the same direction
+    as the edges written by 'mine', e.g. for
+    (('BAR', 'A'), ('BAR', 'B'), ('BAR', 'C'), ('X', 'FOO'), ('Y', 'FOO'), ('Z', 'FOO'), ('DOE', 'JANE1'))
+    """
+    return read_edge_table(bedfile, source_col="motif", target_col="gene", vocabulary=vocabulary)
+
+
+def _shared_keys(edgelist, vocabulary):
+    """Get the distinct edges of an EdgeList as sorted integer keys, with nodes coded by a shared vocabulary."""
+    codes = vocabulary.encode(edgelist.nodes).astype(np.int64)
+    return _distinct((codes[edgelist.source] << 32) | codes[edgelist.target])
 
 
 def network_jaccard(edgelist1, edgelist2):
@@ -41,24 +47,221 @@ def network_jaccard(edgelist1, edgelist2):
     edgelist2: output from parse_bed for sampleY
 
     Output:
-    float: indicating similarity index
+    float: indicating similarity index, 0 if both samples have no edges
 
     ref:
     https://medium.com/rapids-ai/similarity-in-graphs-jaccard-versus-the-overlap-coefficient-610e083b877d
 
     """
 
-    edgeintersection = len(set(edgelist1).intersection(edgelist2))
-    edgeunion = (len(edgelist1) + len(edgelist2)) - edgeintersection
+    vocabulary = Vocabulary()
+    keys1 = _shared_keys(edgelist1, vocabulary)
+    keys2 = _shared_keys(edgelist2, vocabulary)
+
+    # Sizes of the distinct edge sets, so duplicate edges do not count twice.
+    edgeintersection = len(np.intersect1d(keys1, keys2, assume_unique=True))
+    edgeunion = (len(keys1) + len(keys2)) - edgeintersection
+    if edgeunion == 0:
+        return 0.0
 
-    print(float((edgeintersection) / edgeunion))
     return float((edgeintersection) / edgeunion)
 
 
+def load_edges(path, vocabulary=None):
+    """
+    Load the edges of a sample.
+
+    inputs:
+    path: CRCminer 'mine' output directory (its <name>_edges.npz is read), an
+    edges .npz file, or an enhancer bed file with "gene" and "motif" columns
+
+    vocabulary: crcminer.edges.Vocabulary used to parse enhancer bed files
+
+    Output:
+    EdgeList of the sample
+    """
+
+    if os.path.isdir(path):
+        name = os.path.basename(os.path.normpath(path))
+        path = os.path.join(path, f"{name}_edges.npz")
+    if path.endswith(".npz"):
+        return EdgeList.load(path)
+    return parse_bed(path, vocabulary)
+
+
+def _splitmix64(x):
+    """Mix 64-bit integers into well-distributed hashes (SplitMix64 finalizer)."""
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _popcount(words):
+    """Count the set bits of each row of a 2D uint64 array."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int64)
+    table = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+    return table[words.view(np.uint8)].sum(axis=1)
+
+
+def minhash_signatures(keys, size=128, seed=0):
+    """
+    Compute one-permutation MinHash sketches of edge sets.
+
+    Each edge is hashed once, and the sketch keeps the smallest hash falling in each
+    of ``size`` bins, so sketching costs one pass over the edges of a sample.
+
+    inputs:
+    keys: list of integer edge key arrays, one per sample
+
+    size: number of bins, i.e. the sketch length
+
+    seed: seed of the hash function
+
+    Output:
+    numpy array of shape (samples, size), the smallest hash in each bin, or the
+    maximum uint64 for empty bins. See minhash_jaccard.
+    """
+
+    signatures = np.full((len(keys), size), np.iinfo(np.uint64).max, dtype=np.uint64)
+    salt = _splitmix64(np.array([seed], dtype=np.uint64))
+    for i, k in enumerate(keys):
+        hashes = _splitmix64(np.asarray(k).astype(np.uint64) ^ salt)
+        np.minimum.at(signatures[i], hashes % np.uint64(size), hashes)
+    return signatures
+
+
+def minhash_jaccard(signatures):
+    """
+    Estimate the Jaccard index of every pair of sketches from minhash_signatures.
+
+    The estimate is the fraction of bins holding the same hash, among the bins that
+    are not empty in both sketches.
+
+    Output:
+    numpy array of shape (samples, samples)
+    """
+
+    empty = signatures == np.iinfo(np.uint64).max
+    jaccard = np.zeros((len(signatures), len(signatures)))
+    for i in range(len(signatures)):
+        matches = ((signatures == signatures[i]) & ~empty).sum(axis=1)
+        used = signatures.shape[1] - (empty & empty[i]).sum(axis=1)
+        np.divide(matches, used, out=jaccard[i], where=used > 0)
+    return jaccard
+
+
+def compare_networks(edgelists, names=None, minhash=None, seed=0):
+    """
+    Compare the edges of every pair of samples.
+
+    Edges of all samples are coded into one integer space, and each sample's edges
+    are held as a bitset over all distinct edges, so intersections are counted a
+    word at a time. With ``minhash``, Jaccard indices are instead estimated from
+    MinHash sketches of that length, which scales to hundreds of samples with large
+    networks; overlap coefficients are then derived from the estimated intersections
+    and the exact edge counts.
+
+    inputs:
+    edgelists: list of EdgeList, e.g. from load_edges, one per sample
+
+    names: sample names, used to label the matrices
+
+    minhash: sketch length for approximate comparison, or None for exact
+
+    seed: seed of the MinHash hash function
+
+    Output:
+    (jaccard, overlap): pandas dataframes of the pairwise Jaccard indices and
+    overlap coefficients, indexed by sample name in both directions
+    """
+
+    names = list(names) if names is not None else [str(i) for i in range(len(edgelists))]
+    vocabulary = Vocabulary()
+    keys = [_shared_keys(e, vocabulary) for e in edgelists]
+    sizes = np.array([len(k) for k in keys], dtype=np.int64)
+
+    if minhash:
+        jaccard = minhash_jaccard(minhash_signatures(keys, minhash, seed))
+        intersection = jaccard * (sizes[:, None] + sizes[None, :]) / (1 + jaccard)
+    else:
+        edges = _distinct(np.concatenate(keys)) if keys else np.zeros(0, dtype=np.int64)
+        words = -(-len(edges) // 64)
+        bits = np.zeros((len(keys), words), dtype=np.uint64)
+        for i, k in enumerate(keys):
+            member = np.zeros(words * 64, dtype=bool)
+            member[np.searchsorted(edges, k)] = True
+            bits[i] = np.packbits(member, bitorder="little").view(np.uint64)
+
+        intersection = np.zeros((len(keys), len(keys)))
+        for i in range(len(keys)):
+            intersection[i] = _popcount(bits[i] & bits)
+        union = sizes[:, None] + sizes[None, :] - intersection
+        jaccard = np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+    smaller = np.minimum(sizes[:, None], sizes[None, :]).astype(np.float64)
+    overlap = np.divide(intersection, smaller, out=np.zeros_like(intersection), where=smaller > 0)
+    # Estimated intersections can exceed the smaller network.
+    overlap = np.minimum(overlap, 1.0)
+
+    return (
+        pd.DataFrame(jaccard, index=names, columns=names),
+        pd.DataFrame(overlap, index=names, columns=names),
+    )
+
+
+def sample_name(path):
+    """Name a sample after its run directory or file."""
+    name = os.path.basename(os.path.normpath(path))
+    for suffix in ("_edges.npz", ".npz"):
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return os.path.splitext(name)[0]
+
+
+def compare_runs(paths, output="CRCminer_compare", minhash=None, seed=0):
+    """
+    Compare the networks of several samples and write the similarity matrices.
+
+    inputs:
+    paths: CRCminer 'mine' output directories, or edge files (see load_edges)
+
+    output: prefix of the output files, <output>_jaccard.txt and <output>_overlap.txt
+
+    minhash: sketch length for approximate comparison, or None for exact
+
+    seed: seed of the MinHash hash function
+
+    Output:
+    (jaccard, overlap) as returned by compare_networks
+    """
+
+    # Each sample's edges are loaded once, however many pairs it is part of.
+    vocabulary = Vocabulary()
+    edgelists = []
+    for path in paths:
+        info("Loading edges from %s", path)
+        with profiling.stage("load", label=sample_name(path)):
+            edgelists.append(load_edges(path, vocabulary))
+            profiling.add_counts(edges=len(edgelists[-1]))
+
+    info("Comparing %d networks", len(edgelists))
+    with profiling.stage("compare"):
+        jaccard, overlap = compare_networks(
+            edgelists, [sample_name(p) for p in paths], minhash=minhash, seed=seed
+        )
+        n = len(edgelists)
+        profiling.add_counts(networks=n, pairs=n * (n - 1) // 2)
+    jaccard.to_csv(output + "_jaccard.txt", sep="\t")
+    overlap.to_csv(output + "_overlap.txt", sep="\t")
+    return jaccard, overlap
+
+
 DESCRIPTION = """
-When you have two different network graph
-objects between mutiple samples 
-compare them using jaccard similarity index
+When you have network graph objects from multiple samples,
+compare every pair of them using the jaccard similarity index
+and the overlap coefficient
 """
 
 EPILOG = """
@@ -75,25 +278,39 @@ parser = argparse.ArgumentParser(
     description=DESCRIPTION, epilog=EPILOG, formatter_class=CustomFormatter
 )
 
-parser.add_argument("edgelist1")
+parser.add_argument("runs", nargs="+", help="CRCminer 'mine' output directories or edge files")
+parser.add_argument(
+    "-o", "--output", default="CRCminer_compare", help="Prefix of the output matrices"
+)
+parser.add_argument(
+    "-m", "--minhash", type=int, default=None,
+    help="Estimate similarities from MinHash sketches of this length, for many samples"
+)
+parser.add_argument(
+    "-p", "--profile", default=None, help="Write per-stage timings, memory use and counts to this JSON file"
+)
 parser.add_argument(
     "-v", "--verbose", action="store_true", help="Set logging level to DEBUG"
 )
 
-args = parser.parse_args()
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    # Only configure logging when run as a script, so importing the module leaves it alone.
+    lh = logging.StreamHandler()
+    lh.setFormatter(logging.Formatter(FORMAT))
+    l.addHandler(lh)
+    l.setLevel(logging.INFO)
+
+    if args.verbose:
+        l.setLevel(logging.DEBUG)
 
-e1 = parse_bed(args.edgelist1)
-# print e1
-# [('A', 'BAR'), ('B', 'BAR'), ('C', 'BAR'), ('FOO', 'X'), ('FOO', 'Y'), ('FOO', 'Z'), ('JANE1', 'DOE')]
-# copying the same set for testing.
-e2 = parse_bed(args.edgelist1)
-e2 = e2[0:3]  # subsetting
-# print(e2)
-# [('A', 'BAR'), ('B', 'BAR'), ('C', 'BAR')]
+    debug("%s begin", SCRIPT_PATH)
 
-network_jaccard(e1, e2)  # should print out  0.42857142857142855
+    if args.profile:
+        profiling.start_profiling()
 
-if args.verbose:
-    l.setLevel(logging.DEBUG)
+    compare_runs(args.runs, args.output, minhash=args.minhash)
 
-debug("%s begin", SCRIPT_PATH)
+    if args.profile:
+        profiling.stop_profiling().write(args.profile)
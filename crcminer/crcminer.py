@@ -1,15 +1,34 @@
 import rich_click as click
 
+from crcminer import profiling
+from crcminer.catalog import MOTIF_FILE
+from crcminer.compare import compare_runs
+from crcminer.genome import index_genome
+from crcminer.motifmap import NAME_PATTERN, write_motif_id_map
+from crcminer.pipeline import run_mine, run_mine_batch
+
 
 # Command Group
 @click.group(name="CRCminer")
-def CRCminer():
+@click.option("--profile", type=click.Path(), default=None,
+              help="Write wall time, CPU time, peak memory, item counts and throughput of each stage to this JSON file.")
+@click.option("--profile-stage", type=str, default=None,
+              help="Also profile this stage function by function, e.g. 'scan'. A cProfile capture is also written next to the JSON file, as <profile>.<stage>.prof.")
+@click.option("--profile-mode", type=click.Choice(profiling.CAPTURE_MODES), default="cprofile",
+              help="How to profile --profile-stage: 'cprofile' traces every call, 'sample' samples the stack, adding next to no overhead.")
+@click.pass_context
+def CRCminer(ctx, profile, profile_stage, profile_mode):
     """
     CRCminer: A tool for identifying CRCs from a set of (super)enhancers, with
     optional limitation to subpeaks (e.g. ATAC, constituent H3K27ac peaks, etc)
     and active genes (e.g. those with TPM > 1).
     """
-    pass
+    if profile is not None:
+        profiling.start_profiling(capture=profile_stage, mode=profile_mode)
+        # Written when the command exits, including when it fails or is interrupted.
+        ctx.call_on_close(lambda: profiling.stop_profiling().write(profile))
+    elif profile_stage is not None:
+        raise click.UsageError("--profile-stage needs --profile")
 
 
 @CRCminer.command(name="mine",
@@ -32,30 +51,168 @@ def CRCminer():
 @click.option("--mapping", type=click.Path(),
               help="Motif accession to gene ID mapping file.",
               required=False)
-@click.option("--name", type=click.Path(), help="Analysis name, used to name output files and directory.")
-def mine(fasta, enhancer, mapping, threshold, subpeaks, active, name):
-    pass
+@click.option("--name", type=click.Path(), default="CRCminer",
+              help="Analysis name, used to name output files and directory.")
+@click.option("--threads", type=int, default=1,
+              help="Number of worker processes used for motif scanning.")
+@click.option("--batch-size", type=int, default=None,
+              help="Stream sequences in batches of this size during motif scanning to bound memory use.")
+@click.option("--merge-overlaps", is_flag=True, default=False,
+              help="Merge overlapping regions into a single sequence before motif scanning.")
+@click.option("--cache-dir", type=click.Path(), default=None,
+              help="Directory for cached stage outputs, reused when a stage's inputs and parameters are unchanged. Defaults to 'cache' in the output directory.")
+@click.option("--engine", type=click.Choice(["fimo", "numpy"]), default="fimo",
+              help="Motif scanning engine. 'numpy' is a vectorized scanner reporting the same matches as FIMO, with exact q-values.")
+@click.option("--hits-format", type=click.Choice(["tsv", "parquet", "arrow"]), default="tsv",
+              help="Format of the motif hit output. Parquet and Arrow are columnar, smaller and faster to read downstream.")
+@click.option("--occurrence-cutoff", type=int, default=1,
+              help="Minimum number of distinct occurrences of a motif in a region to keep it. Overlapping matches count as one.")
+@click.option("--top-k", type=int, default=None,
+              help="Only find and report the best scoring CRC cliques, much faster for dense networks. TF clique fractions are then over these cliques only, written as TF_TopCliqueFraction.")
+def mine(fasta, enhancer, mapping, threshold, subpeaks, active, name, threads, batch_size,
+         merge_overlaps, cache_dir, engine, hits_format, occurrence_cutoff, top_k):
+    run_mine(
+        fasta,
+        enhancer,
+        name=name,
+        mapping=mapping,
+        threshold=threshold,
+        subpeaks=subpeaks,
+        active=active,
+        threads=threads,
+        batch_size=batch_size,
+        merge_overlaps=merge_overlaps,
+        cache_dir=cache_dir,
+        engine=engine,
+        hits_format=hits_format,
+        occurrence_cutoff=occurrence_cutoff,
+        top_k=top_k,
+    )
 
 
-@CRCminer.command(name="compare",
-                  help="Compare output from two CRCminer 'mine' runs.")
-@click.option("--sample1", type=click.Path(),
-              help="CRCminer 'mine' output from one sample.",
+@CRCminer.command(name="mine-batch",
+                  help="Identifies putative CRC members in many samples, sharing the genome, motifs and stage cache between them.")
+@click.option("--manifest", type=click.Path(exists=True),
+              help="Tab-delimited file with a header and a row per sample, with 'name' and 'enhancer' columns and optional 'subpeaks' and 'active' columns.",
+              required=True)
+@click.option("--fasta", type=click.Path(),
+              help="Genome FASTA file.",
+              required=True)
+@click.option("--outdir", type=click.Path(), default=".",
+              help="Directory to write a subdirectory per sample to.")
+@click.option("--threshold", type=float, default=1e-4,
+              help="p-value threshold used for determining significant motif matches.")
+@click.option("--mapping", type=click.Path(),
+              help="Motif accession to gene ID mapping file.",
+              required=False)
+@click.option("--threads", type=int, default=1,
+              help="Number of worker processes shared by all samples.")
+@click.option("--batch-size", type=int, default=None,
+              help="Stream sequences in batches of this size during motif scanning to bound memory use.")
+@click.option("--merge-overlaps", is_flag=True, default=False,
+              help="Merge overlapping regions into a single sequence before motif scanning.")
+@click.option("--cache-dir", type=click.Path(), default=None,
+              help="Directory for cached stage outputs, shared by all samples. Defaults to 'cache' in the output directory.")
+@click.option("--engine", type=click.Choice(["fimo", "numpy"]), default="fimo",
+              help="Motif scanning engine. 'numpy' is a vectorized scanner reporting the same matches as FIMO, with exact q-values.")
+@click.option("--hits-format", type=click.Choice(["tsv", "parquet", "arrow"]), default="tsv",
+              help="Format of the motif hit output. Parquet and Arrow are columnar, smaller and faster to read downstream.")
+@click.option("--occurrence-cutoff", type=int, default=1,
+              help="Minimum number of distinct occurrences of a motif in a region to keep it. Overlapping matches count as one.")
+@click.option("--top-k", type=int, default=None,
+              help="Only find and report the best scoring CRC cliques, much faster for dense networks. TF clique fractions are then over these cliques only, written as TF_TopCliqueFraction.")
+def mine_batch(manifest, fasta, outdir, mapping, threshold, threads, batch_size,
+               merge_overlaps, cache_dir, engine, hits_format, occurrence_cutoff, top_k):
+    run_mine_batch(
+        manifest,
+        fasta,
+        outdir=outdir,
+        mapping=mapping,
+        threads=threads,
+        cache_dir=cache_dir,
+        threshold=threshold,
+        batch_size=batch_size,
+        merge_overlaps=merge_overlaps,
+        engine=engine,
+        hits_format=hits_format,
+        occurrence_cutoff=occurrence_cutoff,
+        top_k=top_k,
+    )
+
+
+@CRCminer.command(name="index-genome",
+                  help="Write a packed, memory-mapped copy of a genome FASTA for faster 'mine' runs.")
+@click.option("--fasta", type=click.Path(exists=True),
+              help="Genome FASTA file. The cache is written alongside it and used automatically by 'mine'.",
               required=True)
-@click.option("--sample2", type=click.Path(),
-              help="CRCminer 'mine' output from another sample.",
+def index_genome_cmd(fasta):
+    index_genome(fasta)
+
+
+@CRCminer.command(name="map-motifs",
+                  help="Write the motif ID to gene ID mapping file used by 'mine --mapping', from a local gene annotation table.")
+@click.option("--annotation", type=click.Path(exists=True),
+              help="Tab-delimited gene annotation table with a header, e.g. an HGNC download, or a GTF file. Indexed once and cached.",
               required=True)
-def compare(sample1, sample2):
-    pass
+@click.option("--motifs", type=click.Path(exists=True), default=MOTIF_FILE,
+              help="MEME motif file. Defaults to the bundled human motifs.")
+@click.option("--output", type=click.Path(), default="motif_id_map.csv",
+              help="Path of the mapping file to write.")
+@click.option("--name-pattern", type=str, default=NAME_PATTERN,
+              help="Regular expression finding the gene name in a motif's alternate name. Its first group is used if it has any.")
+@click.option("--symbol-column", type=str, default=None,
+              help="Annotation table column of gene symbols. Detected if not given.")
+@click.option("--entrez-column", type=str, default=None,
+              help="Annotation table column of Entrez gene IDs. Detected if not given.")
+@click.option("--ensembl-column", type=str, default=None,
+              help="Annotation table column of Ensembl gene IDs. Detected if not given.")
+@click.option("--synonym-column", type=str, multiple=True,
+              help="Annotation table column of gene synonyms, e.g. aliases or previous symbols. Can be given multiple times. Detected if not given.")
+@click.option("--strict", is_flag=True, default=False,
+              help="Only accept exact symbol matches, reporting case-insensitive and synonym matches as 'badmatch'.")
+def map_motifs(annotation, motifs, output, name_pattern, symbol_column, entrez_column,
+               ensembl_column, synonym_column, strict):
+    columns = {"symbol": symbol_column, "entrez": entrez_column, "ensembl": ensembl_column,
+               "synonyms": list(synonym_column)}
+    counts = write_motif_id_map(
+        annotation,
+        output,
+        motif_file=motifs,
+        name_pattern=name_pattern,
+        columns={k: v for k, v in columns.items() if v},
+        strict=strict,
+    )
+    print(", ".join(f"{n} {status}" for status, n in counts.items()))
+
+
+@CRCminer.command(name="compare",
+                  help="Compare output from two or more CRCminer 'mine' runs.")
+@click.argument("runs", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option("--output", type=click.Path(), default="CRCminer_compare",
+              help="Prefix of the output files, <output>_jaccard.txt and <output>_overlap.txt.")
+@click.option("--minhash", type=int, default=None,
+              help="Estimate similarities from MinHash sketches of this length, rather than exactly. Useful for hundreds of samples.")
+@click.option("--seed", type=int, default=0,
+              help="Seed of the MinHash hash function.")
+def compare(runs, output, minhash, seed):
+    compare_runs(runs, output, minhash=minhash, seed=seed)
 
 
 @CRCminer.command(name="report",
                   help="Interactive application to explore, visualize, and interpret CRCminer results.")
-@click.option("--indir", type=click.Path(),
-              help="Paths to one or more input directory containing CRCminer results.",
+@click.option("--indir", type=click.Path(exists=True), multiple=True,
+              help="Paths to one or more input directory containing CRCminer results. Runs are found recursively and only loaded when selected.",
               required=True)
-def report(indir):
-    pass
+@click.option("--port", type=int, default=8888,
+              help="Port to serve the application on.")
+@click.option("--cache-mb", type=float, default=512,
+              help="Bound on the memory used by loaded runs, in megabytes. Least recently viewed runs are dropped first.")
+def report(indir, port, cache_mb):
+    # Dash is optional, so only import the app when it is launched.
+    from crcminer.app.app import create_app
+
+    app = create_app(list(indir), cache_mb=cache_mb)
+    app.run(port=port)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,388 @@
+import numpy as np
+import pandas as pd
+from ncls import NCLS
+
+from crcminer.motifs import enhancer_gene_ids
+
+# Record names are written as chrom:start-end, see motifs._region_names.
+_RECORD_NAME = r"^(?P<chrom>.+):(?P<start>\d+)-(?P<end>\d+)$"
+
+# Rows of an edge table read at once, bounding the size of the expanded edges.
+EDGE_CHUNK_SIZE = 100_000
+
+
+class EdgeList:
+    """
+    Directed TF to target gene edges, with nodes as integer codes.
+
+    :param nodes: Node names, indexed by code.
+    :type nodes: :class:`numpy.ndarray`
+    :param source: Code of the TF of each edge.
+    :type source: :class:`numpy.ndarray`
+    :param target: Code of the target gene of each edge.
+    :type target: :class:`numpy.ndarray`
+    :param weight: Optional multiplicity of each edge.
+    :type weight: :class:`numpy.ndarray`
+    """
+
+    def __init__(self, nodes, source, target, weight=None):
+        self.nodes = np.asarray(nodes, dtype=object)
+        self.source = np.asarray(source, dtype=np.int32)
+        self.target = np.asarray(target, dtype=np.int32)
+        self.weight = None if weight is None else np.asarray(weight, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.source)
+
+    def keys(self):
+        """Get each edge as one integer, the source code in the high and target code in the low 32 bits."""
+        return (self.source.astype(np.int64) << 32) | self.target.astype(np.int64)
+
+    def save(self, path):
+        """
+        Write the edges to a NumPy ``.npz`` file.
+
+        :param path: Output path.
+        :type path: str
+        """
+
+        arrays = {"nodes": self.nodes.astype(str), "source": self.source, "target": self.target}
+        if self.weight is not None:
+            arrays["weight"] = self.weight
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read edges written by :meth:`save`.
+
+        :param path: Path to the ``.npz`` file.
+        :type path: str
+        ...
+        :return: The edges.
+        :rtype: :class:`EdgeList`
+        """
+
+        with np.load(path) as f:
+            weight = f["weight"] if "weight" in f.files else None
+            return cls(f["nodes"].tolist(), f["source"], f["target"], weight)
+
+    def to_frame(self):
+        """
+        Get the edges by node name.
+
+        :return: pandas dataframe with "TF" and "target" columns, and "weight" if set.
+        :rtype: :class:`pandas.DataFrame`
+        """
+
+        df = pd.DataFrame({"TF": self.nodes[self.source], "target": self.nodes[self.target]})
+        if self.weight is not None:
+            df["weight"] = self.weight
+        return df
+
+
+class Vocabulary:
+    """
+    Integer codes for node names, in order of first appearance.
+
+    Sharing one vocabulary between edge lists gives the same node the same code in
+    each, so their edges can be compared as integers.
+
+    :param names: Initial node names.
+    :type names: list
+    """
+
+    def __init__(self, names=()):
+        self._names = list(names)
+        self._index = pd.Index(self._names, dtype=object)
+
+    def __len__(self):
+        return len(self._names)
+
+    @property
+    def names(self):
+        """Node names, indexed by code."""
+        return np.asarray(self._names, dtype=object)
+
+    def encode(self, names):
+        """
+        Get the codes of node names, adding those not seen before in the given order.
+
+        :param names: Node names.
+        :type names: :class:`numpy.ndarray`
+        ...
+        :return: Code of each name.
+        :rtype: :class:`numpy.ndarray`
+        """
+
+        names = np.asarray(names, dtype=object)
+        codes = self._index.get_indexer(names)
+        new = codes < 0
+        if new.any():
+            self._names.extend(pd.unique(names[new]).tolist())
+            self._index = pd.Index(self._names, dtype=object)
+            codes[new] = self._index.get_indexer(names[new])
+        return codes.astype(np.int32)
+
+
+def parse_record_names(names):
+    """
+    Parse sequence record names back into genomic coordinates.
+
+    :param names: Record names, as chrom:start-end with a 0-based start.
+    :type names: list
+    ...
+    :return: pandas dataframe with "chrom", "start" and "end" columns, one row per name.
+    :rtype: :class:`pandas.DataFrame`
+    """
+
+    coords = pd.Series(np.asarray(names, dtype=object), dtype=object).str.extract(_RECORD_NAME)
+    if coords["chrom"].isna().any():
+        bad = np.asarray(names, dtype=object)[coords["chrom"].isna().to_numpy()][0]
+        raise ValueError(f"Sequence record name is not chrom:start-end: {bad}")
+
+    return coords.astype({"start": "int64", "end": "int64"})
+
+
+def _expand(pairs, offsets, values):
+    """
+    Pair each item with every value of its group, given groups as CSR offsets.
+
+    :return: Index into ``pairs`` and the value for each expanded pair.
+    :rtype: tuple
+    """
+
+    counts = offsets[pairs + 1] - offsets[pairs]
+    index = np.repeat(np.arange(len(pairs)), counts)
+    # Position of each expanded pair within its group.
+    within = np.arange(len(index)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return index, values[offsets[pairs[index]] + within]
+
+
+def _distinct(keys):
+    """Get the sorted distinct values of an integer array, faster than np.unique."""
+    keys = np.sort(keys)
+    return keys[np.r_[True, keys[1:] != keys[:-1]]] if len(keys) else keys
+
+
+def _distinct_counts(keys, counts):
+    """Get the sorted distinct values of an integer array, with the summed counts of each."""
+    order = np.argsort(keys, kind="stable")
+    keys, counts = keys[order], counts[order]
+    if not len(keys):
+        return keys, counts
+    first = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[first], np.add.reduceat(counts, first)
+
+
+def _split_names(column):
+    """Split comma-separated names, giving all names in order and the number per row."""
+    return (
+        np.asarray(",".join(column).split(","), dtype=object),
+        column.str.count(",").to_numpy(dtype=np.int64) + 1,
+    )
+
+
+def _csr(rows, values, n):
+    """Group values by row, as offsets into the values sorted by row."""
+    order = np.argsort(rows, kind="stable")
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=offsets[1:])
+    return offsets, values[order]
+
+
+def join_hits_to_enhancers(
+    hits,
+    enhancers,
+    counts=None,
+    id_cols=["OVERLAP_GENES", "PROXIMAL_GENES", "CLOSEST_GENE"]
+):
+    """
+    Join motif hits to the enhancers they fall in, giving TF to target gene edges.
+
+    Hit positions are mapped from their sequence records back to the genome and
+    overlapped with the enhancers through a nested containment list, all as array
+    operations. Each motif ID is a TF, or several separated by ";", and each gene
+    associated with an enhancer holding a hit of it is one of its targets.
+
+    :param hits: Hits with "sequence_record", "start", "end" and "motif_id" columns,
+        e.g. from :func:`crcminer.hits.read_hits`.
+    :type hits: :class:`pandas.DataFrame`
+    :param enhancers: ROSE2 enhancer table. If it has an "active_genes" column, as written
+        by :func:`crcminer.motifs.filter_enhancers_to_active_genes`, only those genes are
+        used as targets.
+    :type enhancers: :class:`pandas.DataFrame`
+    :param counts: Region and motif pairs to keep, e.g. from :func:`crcminer.hits.count_occurrences`.
+        If None, all hits are used.
+    :type counts: :class:`pandas.DataFrame`
+    :param id_cols: Columns of the enhancer table containing associated gene IDs, used
+        when it has no "active_genes" column.
+    :type id_cols: list
+    ...
+    :return: Distinct TF to target gene edges.
+    :rtype: :class:`EdgeList`
+    """
+
+    # Hits without a motif ID, e.g. for motifs mapped to no gene, have no TF.
+    hits = hits[hits["motif_id"].notna().to_numpy()]
+    record_codes, records = pd.factorize(hits["sequence_record"])
+    motif_codes, motifs = pd.factorize(hits["motif_id"])
+
+    if counts is not None:
+        keep_records = pd.Index(records).get_indexer(counts["sequence_record"])
+        keep_motifs = pd.Index(motifs).get_indexer(counts["motif_id"])
+        found = (keep_records >= 0) & (keep_motifs >= 0)
+        keep = np.isin(
+            record_codes.astype(np.int64) * len(motifs) + motif_codes,
+            keep_records[found].astype(np.int64) * len(motifs) + keep_motifs[found],
+        )
+        record_codes, motif_codes = record_codes[keep], motif_codes[keep]
+        hits = hits[keep]
+
+    enhancers = enhancers.reset_index(drop=True)
+    if not len(hits) or not len(enhancers):
+        return EdgeList([], [], [])
+    regions = parse_record_names(records)
+
+    # Offset each chromosome into its own range, so one index covers the whole genome.
+    chroms = pd.Index(pd.unique(np.concatenate((
+        regions["chrom"].to_numpy(dtype=object), enhancers["CHROM"].astype(str).to_numpy(dtype=object)
+    ))))
+    stride = int(max(regions["end"].max(), enhancers["STOP"].max())) + 1
+    region_base = chroms.get_indexer(regions["chrom"]).astype(np.int64) * stride + regions["start"].to_numpy()
+    enh_base = chroms.get_indexer(enhancers["CHROM"].astype(str)).astype(np.int64) * stride
+
+    # Hits are 1-based within their record, and reverse strand hits have start > end.
+    start = hits["start"].to_numpy(dtype=np.int64)
+    end = hits["end"].to_numpy(dtype=np.int64)
+    hit_start = region_base[record_codes] + np.minimum(start, end) - 1
+    hit_end = region_base[record_codes] + np.maximum(start, end)
+
+    index = NCLS(
+        enh_base + enhancers["START"].to_numpy(dtype=np.int64),
+        enh_base + enhancers["STOP"].to_numpy(dtype=np.int64),
+        np.arange(len(enhancers), dtype=np.int64),
+    )
+    hit_idx, enh_idx = index.all_overlaps_both(hit_start, hit_end, np.arange(len(hit_start), dtype=np.int64))
+
+    # Distinct (motif, enhancer) pairs.
+    pairs = _distinct(motif_codes[hit_idx].astype(np.int64) * len(enhancers) + enh_idx)
+    pair_motifs = pairs // len(enhancers)
+    pair_enhancers = pairs % len(enhancers)
+
+    # TFs of each motif and targets of each enhancer, as codes into one set of node names.
+    tfs = pd.Series(np.asarray(motifs, dtype=object)).str.split(";").explode()
+    tfs = tfs[tfs != ""]
+    if "active_genes" in enhancers.columns:
+        id_cols = ["active_genes"]
+    gene_rows, gene_codes, genes = enhancer_gene_ids(enhancers, id_cols)
+
+    node_codes, nodes = pd.factorize(np.concatenate((
+        tfs.to_numpy(dtype=object), np.asarray(genes, dtype=object)
+    )))
+    tf_nodes = node_codes[:len(tfs)]
+    gene_nodes = node_codes[len(tfs):][gene_codes]
+
+    tf_offsets, tf_values = _csr(tfs.index.to_numpy(), tf_nodes, len(motifs))
+    gene_offsets, gene_values = _csr(gene_rows, gene_nodes, len(enhancers))
+
+    index, source = _expand(pair_motifs, tf_offsets, tf_values)
+    index, target = _expand(pair_enhancers[index], gene_offsets, gene_values)
+    source = source[index]
+
+    edges = _distinct(source.astype(np.int64) * len(nodes) + target)
+    source, target = edges // len(nodes), edges % len(nodes)
+
+    # Keep only nodes with an edge, as a graph built from the edges would have.
+    used = _distinct(np.concatenate((source, target)))
+    codes = np.full(len(nodes), -1, dtype=np.int64)
+    codes[used] = np.arange(len(used))
+    return EdgeList(np.asarray(nodes, dtype=object)[used], codes[source], codes[target])
+
+
+def read_edge_table(
+    path,
+    source_col="gene",
+    target_col="motif",
+    vocabulary=None,
+    weights=False,
+    chunksize=EDGE_CHUNK_SIZE
+):
+    """
+    Read edges from a table of comma-separated sources and targets, e.g.
+
+    ::
+
+        chr	st	en	gene	motif
+        chr1	10	20	A,B,C	BAR
+        chr1	11	21	FOO	X,Y,Z
+
+    Each row gives an edge from every source to every target in it. The table is read
+    in chunks, with names coded through ``vocabulary`` and the edges of each chunk
+    expanded and deduplicated as integer arrays, so memory scales with the number of
+    distinct edges. Rows missing either column are skipped.
+
+    :param path: Path to the tab-delimited table.
+    :type path: str
+    :param source_col: Column of source names.
+    :type source_col: str
+    :param target_col: Column of target names.
+    :type target_col: str
+    :param vocabulary: Vocabulary to code names with, shared between tables to compare them.
+        Node codes are in order of first appearance in the expanded edges, as when adding
+        them to a :class:`networkx.DiGraph` one by one.
+    :type vocabulary: :class:`Vocabulary`
+    :param weights: Whether to count how many times each edge appears.
+    :type weights: bool
+    :param chunksize: Rows read at once.
+    :type chunksize: int
+    ...
+    :return: Distinct edges, sorted by source then target code, with every name in the
+        vocabulary as nodes.
+    :rtype: :class:`EdgeList`
+    """
+
+    vocabulary = Vocabulary() if vocabulary is None else vocabulary
+    keys = []
+    counts = []
+
+    reader = pd.read_csv(
+        path, sep="\t", usecols=[source_col, target_col], dtype=str, chunksize=chunksize
+    )
+    for chunk in reader:
+        chunk = chunk.dropna()
+        if not len(chunk):
+            continue
+        sources, n_sources = _split_names(chunk[source_col])
+        targets, n_targets = _split_names(chunk[target_col])
+
+        # Code names within the chunk, then pair every source with each target of its row.
+        local, names = pd.factorize(np.concatenate((sources, targets)))
+        target_offsets = np.zeros(len(chunk) + 1, dtype=np.int64)
+        np.cumsum(n_targets, out=target_offsets[1:])
+        rows = np.repeat(np.arange(len(chunk)), n_sources)
+        index, target = _expand(rows, target_offsets, local[len(sources):])
+        source = local[:len(sources)][index]
+
+        # Add new names in order of first appearance in the edges.
+        seen = pd.unique(np.column_stack((source, target)).ravel())
+        codes = np.empty(len(names), dtype=np.int64)
+        codes[seen] = vocabulary.encode(np.asarray(names, dtype=object)[seen])
+
+        chunk_keys = (codes[source] << 32) | codes[target]
+        if weights:
+            chunk_keys, chunk_counts = _distinct_counts(chunk_keys, np.ones(len(chunk_keys), dtype=np.int64))
+            counts.append(chunk_counts)
+        else:
+            chunk_keys = _distinct(chunk_keys)
+        keys.append(chunk_keys)
+
+    keys = np.concatenate(keys) if keys else np.zeros(0, dtype=np.int64)
+    weight = None
+    if weights:
+        keys, weight = _distinct_counts(keys, np.concatenate(counts) if counts else np.zeros(0, dtype=np.int64))
+    else:
+        keys = _distinct(keys)
+
+    return EdgeList(vocabulary.names, keys >> 32, keys & 0xFFFFFFFF, weight)
@@ -0,0 +1,241 @@
+import os
+
+import numpy as np
+import pyfaidx
+
+# Packed genome cache files are written next to the FASTA, with these suffixes.
+PACKED_SUFFIX = ".crc2bit.npy"
+INDEX_SUFFIX = ".crc2bit.npz"
+
+# Bases are read this many at a time when packing; must be a multiple of 4.
+CHUNK_SIZE = 1 << 24
+
+_CODES = np.zeros(256, dtype=np.uint8)
+for _i, _base in enumerate(b"ACGT"):
+    _CODES[_base] = _i
+    _CODES[_base | 0x20] = _i
+_IS_BASE = np.zeros(256, dtype=bool)
+_IS_BASE[list(b"ACGTacgt")] = True
+
+# Lookup from a packed byte to its four bases, as a single 32-bit word.
+_UNPACK = np.ascontiguousarray(
+    np.frombuffer(b"ACGT", dtype=np.uint8)[(np.arange(256)[:, None] >> np.array([6, 4, 2, 0])) & 3]
+).view(np.uint32).ravel()
+
+
+def genome_cache_paths(fasta_path):
+    """
+    Get the paths of the packed genome and its index for a FASTA file.
+
+    :param fasta_path: Path to the genome FASTA file.
+    :type fasta_path: str
+    ...
+    :return: Paths to the packed genome and the index file.
+    :rtype: tuple
+    """
+
+    return fasta_path + PACKED_SUFFIX, fasta_path + INDEX_SUFFIX
+
+
+def has_genome_cache(fasta_path):
+    """
+    Check whether an up-to-date packed genome cache exists for a FASTA file.
+
+    :param fasta_path: Path to the genome FASTA file.
+    :type fasta_path: str
+    ...
+    :return: True if both cache files exist and are newer than the FASTA.
+    :rtype: bool
+    """
+
+    fasta_mtime = os.path.getmtime(fasta_path)
+    return all(
+        os.path.exists(path) and os.path.getmtime(path) >= fasta_mtime
+        for path in genome_cache_paths(fasta_path)
+    )
+
+
+def _runs(mask, offset):
+    """Get the start and end coordinates of runs of True in a boolean array."""
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], mask, [False])).view(np.int8)))
+    return edges[::2] + offset, edges[1::2] + offset
+
+
+def _join_runs(starts, ends):
+    """Concatenate run arrays, joining runs that were split across chunks."""
+    starts = np.concatenate(starts) if starts else np.zeros(0, dtype=np.int64)
+    ends = np.concatenate(ends) if ends else np.zeros(0, dtype=np.int64)
+    keep = np.ones(len(starts), dtype=bool)
+    keep[1:] = starts[1:] != ends[:-1]
+    return starts[keep], ends[np.append(keep[1:], True)]
+
+
+def _run_mask(runs, g0, g1):
+    """Get a boolean mask of the positions in [g0, g1) covered by runs."""
+    starts, ends = runs
+    lo = np.searchsorted(ends, g0, side="right")
+    hi = np.searchsorted(starts, g1, side="left")
+
+    # Runs are sorted and disjoint, so their clipped bounds alternate off/on segments.
+    bounds = np.clip(np.column_stack((starts[lo:hi], ends[lo:hi])).ravel(), g0, g1) - g0
+    bounds = np.concatenate(([0], bounds, [g1 - g0]))
+    return np.repeat(np.arange(len(bounds) - 1) % 2 == 1, np.diff(bounds))
+
+
+def index_genome(fasta_path):
+    """
+    Write a packed, memory-mappable copy of a genome FASTA file.
+
+    Each base is stored in 2 bits, with every chromosome starting on a byte boundary.
+    Runs of non-ACGT letters (stored as N) and of lowercase (soft-masked) letters are
+    kept in a separate index file, along with chromosome names, lengths and offsets,
+    so sequences are reconstructed exactly as written in the FASTA, apart from
+    ambiguity codes other than N.
+
+    :param fasta_path: Path to the genome FASTA file.
+    :type fasta_path: str
+    ...
+    :return: Paths to the packed genome and the index file.
+    :rtype: tuple
+    """
+
+    packed_path, index_path = genome_cache_paths(fasta_path)
+    fasta = pyfaidx.Fasta(fasta_path, as_raw=True)
+
+    names = list(fasta.keys())
+    lengths = np.array([len(fasta[name]) for name in names], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum((lengths + 3) // 4)[:-1])).astype(np.int64)
+
+    packed = np.lib.format.open_memmap(
+        packed_path, mode="w+", dtype=np.uint8, shape=(int(np.sum((lengths + 3) // 4)),)
+    )
+    n_starts, n_ends, lower_starts, lower_ends = [], [], [], []
+
+    for name, length, offset in zip(names, lengths, offsets):
+        print("Indexing " + name)
+        for pos in range(0, length, CHUNK_SIZE):
+            seq = np.frombuffer(fasta[name][pos:pos + CHUNK_SIZE].encode(), dtype=np.uint8)
+            start = offset * 4 + pos
+
+            runs = _runs(~_IS_BASE[seq], start)
+            n_starts.append(runs[0])
+            n_ends.append(runs[1])
+            runs = _runs(seq >= ord("a"), start)
+            lower_starts.append(runs[0])
+            lower_ends.append(runs[1])
+
+            codes = np.zeros(-(-len(seq) // 4) * 4, dtype=np.uint8)
+            codes[:len(seq)] = _CODES[seq]
+            codes = codes.reshape(-1, 4)
+            packed[offset + pos // 4:offset + pos // 4 + len(codes)] = (
+                (codes[:, 0] << 6) | (codes[:, 1] << 4) | (codes[:, 2] << 2) | codes[:, 3]
+            )
+
+    packed.flush()
+    del packed
+
+    n_starts, n_ends = _join_runs(n_starts, n_ends)
+    lower_starts, lower_ends = _join_runs(lower_starts, lower_ends)
+    with open(index_path, "wb") as f:
+        np.savez(
+            f,
+            names=np.array(names),
+            lengths=lengths,
+            offsets=offsets,
+            n_starts=n_starts,
+            n_ends=n_ends,
+            lower_starts=lower_starts,
+            lower_ends=lower_ends,
+        )
+
+    return packed_path, index_path
+
+
+class PackedGenome:
+    """
+    Read-only access to a genome packed by :func:`index_genome`.
+
+    The packed bases are memory-mapped, so concurrent jobs on the same node share
+    the genome through the page cache rather than each reading their own copy.
+
+    :param fasta_path: Path to the genome FASTA file the cache was built from.
+    :type fasta_path: str
+    """
+
+    # Sequences differ between sources, as packing turns IUPAC codes other than N into N.
+    source = "packed"
+
+    def __init__(self, fasta_path):
+        packed_path, index_path = genome_cache_paths(fasta_path)
+        self.packed = np.load(packed_path, mmap_mode="r")
+
+        with np.load(index_path) as index:
+            self.lengths = dict(zip(index["names"].tolist(), index["lengths"].tolist()))
+            self.offsets = dict(zip(index["names"].tolist(), index["offsets"].tolist()))
+            self.n_runs = (index["n_starts"], index["n_ends"])
+            self.lower_runs = (index["lower_starts"], index["lower_ends"])
+
+    def fetch(self, chrom, start, end):
+        """
+        Get the sequence of a region, clipped to the chromosome bounds.
+
+        :param chrom: Chromosome name.
+        :type chrom: str
+        :param start: 0-based start position.
+        :type start: int
+        :param end: End position, exclusive.
+        :type end: int
+        ...
+        :return: Sequence of the region, as written in the FASTA.
+        :rtype: str
+        """
+
+        start = max(0, int(start))
+        end = min(int(end), self.lengths[chrom])
+        if end <= start:
+            return ""
+
+        # Global base coordinates of the region.
+        g0 = self.offsets[chrom] * 4 + start
+        g1 = g0 + end - start
+        first = g0 // 4
+        seq = _UNPACK[self.packed[first:-(-g1 // 4)]].view(np.uint8)[g0 - first * 4:g1 - first * 4]
+
+        seq[_run_mask(self.n_runs, g0, g1)] = ord("N")
+        seq[_run_mask(self.lower_runs, g0, g1)] |= 0x20
+
+        return seq.tobytes().decode()
+
+
+class FastaGenome:
+    """
+    Access to a genome FASTA through its index, with the same interface as :class:`PackedGenome`.
+
+    :param fasta_path: Path to the genome FASTA file.
+    :type fasta_path: str
+    """
+
+    source = "fasta"
+
+    def __init__(self, fasta_path):
+        self.fasta = pyfaidx.Fasta(fasta_path, as_raw=True)
+
+    def fetch(self, chrom, start, end):
+        """Get the sequence of a region, clipped to the chromosome bounds."""
+        return self.fasta[chrom][start:end]
+
+
+def open_genome(fasta_path):
+    """
+    Open a genome for reading regions, from its packed cache if it is up to date.
+
+    :param fasta_path: Path to the genome FASTA file.
+    :type fasta_path: str
+    ...
+    :return: The genome.
+    :rtype: :class:`PackedGenome` or :class:`FastaGenome`
+    """
+
+    if has_genome_cache(fasta_path):
+        return PackedGenome(fasta_path)
+    return FastaGenome(fasta_path)
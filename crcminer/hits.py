@@ -0,0 +1,360 @@
+import numpy as np
+import pandas as pd
+
+from crcminer import profiling
+
+# Columns of the motif hit output, in order. TSV output has no header line.
+HIT_COLUMNS = ["sequence_record", "start", "end", "motif_id", "score", "strand", "p-value", "q-value"]
+
+# Output formats, by name and by file extension.
+HIT_FORMATS = {"tsv": ".txt", "parquet": ".parquet", "arrow": ".arrow"}
+
+# Text output is written once this many bytes have been formatted.
+TSV_BUFFER_SIZE = 1 << 20
+
+
+class HitBlock:
+    """
+    Matches of one motif, as typed columns.
+
+    Record names are stored once, with an integer code per match, so blocks map
+    directly onto dictionary-encoded columns.
+
+    :param motif_id: ID of the motif reported for each match.
+    :type motif_id: str
+    :param names: Record names referred to by ``record``.
+    :type names: list
+    :param record: Index into ``names`` of the record of each match.
+    :type record: :class:`numpy.ndarray`
+    :param start: Start position of each match within its record.
+    :type start: :class:`numpy.ndarray`
+    :param end: End position of each match within its record.
+    :type end: :class:`numpy.ndarray`
+    :param score: Score of each match.
+    :type score: :class:`numpy.ndarray`
+    :param strand: Strand of each match, "+" or "-".
+    :type strand: :class:`numpy.ndarray`
+    :param pvalue: p-value of each match.
+    :type pvalue: :class:`numpy.ndarray`
+    :param qvalue: q-value of each match.
+    :type qvalue: :class:`numpy.ndarray`
+    """
+
+    def __init__(self, motif_id, names, record, start, end, score, strand, pvalue, qvalue):
+        self.motif_id = motif_id
+        self.names = names
+        self.record = np.asarray(record, dtype=np.int32)
+        self.start = np.asarray(start, dtype=np.int64)
+        self.end = np.asarray(end, dtype=np.int64)
+        self.score = np.asarray(score, dtype=np.float64)
+        self.strand = np.asarray(strand, dtype="U1")
+        self.pvalue = np.asarray(pvalue, dtype=np.float64)
+        self.qvalue = np.asarray(qvalue, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.record)
+
+    @classmethod
+    def from_pattern(cls, pattern, motif_id):
+        """
+        Collect the matched elements of a FIMO pattern.
+
+        :param pattern: Pattern returned by :meth:`pymemesuite.fimo.FIMO.score_motif`.
+        :type pattern: :class:`pymemesuite.cisml.Pattern`
+        :param motif_id: ID of the motif to report for each match.
+        :type motif_id: str
+        ...
+        :return: The matches.
+        :rtype: :class:`HitBlock`
+        """
+
+        elements = pattern.matched_elements
+        codes = {}
+        record = [codes.setdefault(m.source.accession.decode(), len(codes)) for m in elements]
+        return cls(
+            motif_id,
+            list(codes),
+            record,
+            [m.start for m in elements],
+            [m.stop for m in elements],
+            [m.score for m in elements],
+            [m.strand for m in elements],
+            [m.pvalue for m in elements],
+            [m.qvalue for m in elements],
+        )
+
+    def to_tsv(self):
+        """
+        Format the matches as tab-delimited lines, in :data:`HIT_COLUMNS` order.
+
+        :return: Output lines for all matches, including trailing newlines.
+        :rtype: str
+        """
+
+        names = self.names
+        motif_id = self.motif_id
+        return "".join(
+            f"{names[r]}\t{start}\t{end}\t{motif_id}\t{score}\t{strand}\t{pvalue}\t{qvalue}\n"
+            for r, start, end, score, strand, pvalue, qvalue in zip(
+                self.record.tolist(),
+                self.start.tolist(),
+                self.end.tolist(),
+                self.score.tolist(),
+                self.strand.tolist(),
+                self.pvalue.tolist(),
+                self.qvalue.tolist(),
+            )
+        )
+
+    def to_arrow(self, schema):
+        """
+        Convert the matches to an Arrow record batch, with dictionary-encoded IDs.
+
+        :param schema: Schema of the batch, from :func:`hit_schema`.
+        :type schema: :class:`pyarrow.Schema`
+        ...
+        :return: The matches.
+        :rtype: :class:`pyarrow.RecordBatch`
+        """
+
+        import pyarrow as pa
+
+        # Only keep the names of records with matches in the dictionary.
+        used, record = np.unique(self.record, return_inverse=True)
+        names = pa.array([self.names[i] for i in used.tolist()], type=pa.string())
+        n = len(self)
+        columns = [
+            pa.DictionaryArray.from_arrays(pa.array(record.astype(np.int32)), names),
+            pa.array(self.start),
+            pa.array(self.end),
+            pa.DictionaryArray.from_arrays(
+                pa.array(np.zeros(n, dtype=np.int32)), pa.array([self.motif_id], type=pa.string())
+            ),
+            pa.array(self.score),
+            pa.DictionaryArray.from_arrays(
+                pa.array((self.strand == "-").astype(np.int8)), pa.array(["+", "-"], type=pa.string())
+            ),
+            pa.array(self.pvalue),
+            pa.array(self.qvalue),
+        ]
+        return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def hit_schema():
+    """
+    Get the Arrow schema of motif hits, with record names, motif IDs and strands
+    dictionary-encoded.
+
+    :return: The schema.
+    :rtype: :class:`pyarrow.Schema`
+    """
+
+    import pyarrow as pa
+
+    return pa.schema([
+        ("sequence_record", pa.dictionary(pa.int32(), pa.string())),
+        ("start", pa.int64()),
+        ("end", pa.int64()),
+        ("motif_id", pa.dictionary(pa.int32(), pa.string())),
+        ("score", pa.float64()),
+        ("strand", pa.dictionary(pa.int8(), pa.string())),
+        ("p-value", pa.float64()),
+        ("q-value", pa.float64()),
+    ])
+
+
+def hits_format(path):
+    """
+    Get the format of a motif hit file from its extension. Unknown extensions are TSV.
+
+    :param path: Path to the hit file.
+    :type path: str
+    ...
+    :return: "tsv", "parquet" or "arrow".
+    :rtype: str
+    """
+
+    for fmt, ext in HIT_FORMATS.items():
+        if path.endswith(ext):
+            return fmt
+    return "tsv"
+
+
+class HitWriter:
+    """
+    Write motif hits as headerless TSV, Parquet or Arrow IPC.
+
+    Each motif's matches are written together. In Parquet, they form a row group, so
+    its statistics let readers skip motifs they do not need. In Arrow, they form a
+    record batch of the IPC stream.
+
+    :param path: Output path.
+    :type path: str
+    :param fmt: Output format, "tsv", "parquet" or "arrow".
+    :type fmt: str
+    """
+
+    def __init__(self, path, fmt="tsv"):
+        if fmt not in HIT_FORMATS:
+            raise ValueError(f"Unknown hit output format: {fmt}")
+        self.fmt = fmt
+
+        if fmt == "tsv":
+            self._file = open(path, "w", buffering=TSV_BUFFER_SIZE)
+            return
+
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError(f"pyarrow is required to write motif hits as {fmt}") from e
+
+        self.schema = hit_schema()
+        if fmt == "parquet":
+            self._file = pq.ParquetWriter(path, self.schema, compression="zstd")
+        else:
+            self._file = pa.ipc.new_stream(path, self.schema)
+
+    def write(self, block):
+        """
+        Write the matches of one motif.
+
+        :param block: The matches.
+        :type block: :class:`HitBlock`
+        """
+
+        profiling.add_counts(hits=len(block))
+        profiling.tally("hits_per_motif", block.motif_id, len(block))
+        if not len(block):
+            return
+        if self.fmt == "tsv":
+            self._file.write(block.to_tsv())
+        elif self.fmt == "parquet":
+            import pyarrow as pa
+
+            self._file.write_table(pa.Table.from_batches([block.to_arrow(self.schema)]), row_group_size=len(block))
+        else:
+            self._file.write_batch(block.to_arrow(self.schema))
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_hits(path, columns=None, motif_ids=None):
+    """
+    Read motif hits written by :class:`HitWriter`.
+
+    Parquet and Arrow files only read the requested columns, and Parquet files skip
+    the row groups of motifs that are not requested.
+
+    :param path: Path to the hit file, in a format named by its extension (see :func:`hits_format`).
+    :type path: str
+    :param columns: Columns to read, from :data:`HIT_COLUMNS`. Defaults to all of them.
+    :type columns: list
+    :param motif_ids: Motif IDs to keep. Defaults to all of them.
+    :type motif_ids: list
+    ...
+    :return: Hits, with record names, motif IDs and strands as categoricals for
+        Parquet and Arrow input.
+    :rtype: :class:`pandas.DataFrame`
+    """
+
+    columns = list(columns or HIT_COLUMNS)
+    fmt = hits_format(path)
+    read_columns = columns if motif_ids is None or "motif_id" in columns else columns + ["motif_id"]
+
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        filters = None if motif_ids is None else [("motif_id", "in", list(motif_ids))]
+        df = pq.read_table(path, columns=read_columns, filters=filters).to_pandas()
+    elif fmt == "arrow":
+        import pyarrow as pa
+
+        with pa.ipc.open_stream(path) as reader:
+            df = reader.read_all().select(read_columns).to_pandas()
+    else:
+        df = pd.read_csv(
+            path, sep="\t", header=None, names=HIT_COLUMNS, usecols=read_columns,
+            dtype={"sequence_record": str, "motif_id": str, "strand": str},
+            float_precision="round_trip",
+        )[read_columns]
+
+    if motif_ids is not None:
+        df = df[df["motif_id"].isin(list(motif_ids))]
+    return df[columns].reset_index(drop=True)
+
+
+def count_occurrences(hits, cutoff=1):
+    """
+    Count the distinct occurrences of each motif in each region.
+
+    Hits of a motif that overlap within a region, including matches of both strands at
+    the same position, are collapsed into one occurrence. Hits are sorted by region,
+    motif and position and merged in a single vectorized sweep.
+
+    :param hits: Hits with "sequence_record", "motif_id", "start" and "end" columns,
+        e.g. from :func:`read_hits`.
+    :type hits: :class:`pandas.DataFrame`
+    :param cutoff: Minimum number of occurrences for a motif to be kept for a region.
+    :type cutoff: int
+    ...
+    :return: Regions, motif IDs and occurrence counts, with columns "sequence_record",
+        "motif_id" and "occurrences". Ordered by region, then motif, each in order of
+        first appearance in ``hits``.
+    :rtype: :class:`pandas.DataFrame`
+    """
+
+    # Hits without a motif ID, e.g. for motifs mapped to no gene, are not counted.
+    hits = hits[hits["motif_id"].notna().to_numpy()]
+    region_codes, regions = pd.factorize(hits["sequence_record"])
+    motif_codes, motifs = pd.factorize(hits["motif_id"])
+    start = hits["start"].to_numpy(dtype=np.int64)
+    end = hits["end"].to_numpy(dtype=np.int64)
+
+    if not len(start):
+        return pd.DataFrame({"sequence_record": [], "motif_id": [], "occurrences": []})
+
+    # Reverse strand hits are reported with start > end.
+    lo = np.minimum(start, end)
+    width = np.abs(end - start)
+    group = region_codes.astype(np.int64) * len(motifs) + motif_codes
+
+    # Sort by group, then position, as a single integer key. Positions are offset by
+    # group, so the running end of merged hits never carries over into the next group.
+    span = int(np.maximum(start, end).max()) + 2
+    key = group * span + lo
+    bits = int(width.max()).bit_length()
+    if (int(group.max()) + 1) * span << bits < 1 << 63:
+        # Pack the width into the low bits too, which sorts much faster than argsort.
+        packed = np.sort((key << bits) | width)
+        key = packed >> bits
+        width = packed & ((1 << bits) - 1)
+    else:
+        order = np.argsort(key)
+        key, width = key[order], width[order]
+
+    # A hit starting past the end of all earlier hits in its group is a new occurrence.
+    reach = np.maximum.accumulate(key + width)
+    new = np.ones(len(key), dtype=bool)
+    new[1:] = key[1:] > reach[:-1]
+
+    group = key // span
+    first = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    counts = np.add.reduceat(new.astype(np.int64), first)
+    groups = group[first]
+
+    keep = counts >= cutoff
+    groups = groups[keep]
+    profiling.add_counts(hits=len(start), occurrences=int(counts[keep].sum()), pairs=len(groups))
+    return pd.DataFrame({
+        "sequence_record": np.asarray(regions)[groups // len(motifs)],
+        "motif_id": np.asarray(motifs)[groups % len(motifs)],
+        "occurrences": counts[keep],
+    })
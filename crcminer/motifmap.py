@@ -0,0 +1,348 @@
+"""
+Offline mapping of motif names to gene IDs, through a local gene annotation table.
+"""
+import gzip
+import hashlib
+import os
+import pickle
+import re
+
+import pandas as pd
+
+from crcminer import profiling
+from crcminer.catalog import CACHE_DIR, MOTIF_FILE
+
+# Gene name of a motif, from its alternate name on the MOTIF line. Takes the first word
+# inside leading brackets, up to an underscore, e.g. "TFAP2D" from
+# "(TFAP2D)_(Mus_musculus)_(DBD_0.80)" in CIS-BP, or the start of a bare name, e.g.
+# "Arnt" from "Arnt" in JASPAR.
+NAME_PATTERN = r"^\(?([^()_\s]+)"
+
+# Columns tried, in order, for each gene ID type if not given explicitly. Covers HGNC
+# downloads, both the REST "complete set" and the custom download, and GTF-derived tables.
+COLUMN_CANDIDATES = {
+    "symbol": ["symbol", "Approved symbol", "gene_name", "Symbol", "gene_symbol"],
+    "entrez": ["entrez_id", "NCBI Gene ID", "NCBI Gene ID(supplied by NCBI)", "entrezgene", "GeneID"],
+    "ensembl": ["ensembl_gene_id", "Ensembl gene ID", "Ensembl ID(supplied by Ensembl)", "gene_id"],
+    "synonyms": ["alias_symbol", "prev_symbol", "Alias symbols", "Previous symbols", "Synonyms"],
+}
+
+# Separators of multiple values in one annotation table cell.
+_MULTI_VALUE = re.compile(r"[|,;]\s*")
+
+# Placeholders written for motifs whose gene could not be resolved, as read by
+# :func:`crcminer.catalog.read_motif_id_map`.
+NOT_FOUND = "notfound"
+BAD_MATCH = "badmatch"
+
+_GTF_ATTRIBUTE = re.compile(r'(\w+) "([^"]*)"')
+
+
+def _split(value):
+    return [v for v in _MULTI_VALUE.split(value.strip()) if v]
+
+
+def _strip_version(ensembl_id):
+    # GTF gene IDs are versioned, e.g. ENSG00000141510.18, but ID maps are not.
+    return ensembl_id.split(".", 1)[0] if ensembl_id.startswith("ENS") else ensembl_id
+
+
+def _read_gtf(path):
+    """Read the gene records of a GTF file as "symbol" and "ensembl" columns."""
+    opener = gzip.open if path.endswith(".gz") else open
+    symbols = []
+    ensembl = []
+    with opener(path, "rt") as f:
+        for line in f:
+            fields = line.split("\t", 8)
+            if len(fields) < 9 or fields[2] != "gene":
+                continue
+            attributes = dict(_GTF_ATTRIBUTE.findall(fields[8]))
+            if "gene_name" in attributes:
+                symbols.append(attributes["gene_name"])
+                ensembl.append(attributes.get("gene_id", ""))
+
+    return pd.DataFrame({"symbol": symbols, "ensembl": ensembl})
+
+
+def _is_gtf(path):
+    return re.search(r"\.gtf(\.gz)?$", path) is not None
+
+
+def _resolve_columns(header, columns):
+    """Pick the annotation table column of each gene ID type."""
+    columns = dict(columns or {})
+    for id_type, candidates in COLUMN_CANDIDATES.items():
+        if id_type not in columns:
+            found = [c for c in candidates if c in header]
+            columns[id_type] = found if id_type == "synonyms" else (found[0] if found else None)
+        elif id_type == "synonyms" and isinstance(columns[id_type], str):
+            columns[id_type] = [columns[id_type]]
+
+    if columns["symbol"] is None:
+        raise ValueError(
+            "No gene symbol column found in the annotation table, expected one of: "
+            + ", ".join(COLUMN_CANDIDATES["symbol"])
+        )
+    missing = [c for c in [columns["symbol"], columns["entrez"], columns["ensembl"], *columns["synonyms"]]
+               if c is not None and c not in header]
+    if missing:
+        raise ValueError(f"Annotation table is missing columns: {', '.join(missing)}")
+
+    return columns
+
+
+class GeneTable:
+    """
+    Gene IDs from a local annotation table, indexed by symbol, case-insensitive symbol
+    and synonym.
+
+    Rows with the same symbol, e.g. genes on both sex chromosomes in a GTF, are merged,
+    keeping each of their distinct IDs.
+
+    :param genes: Entrez and Ensembl IDs of each gene, as lists, keyed by symbol.
+    :type genes: dict
+    :param synonyms: Symbols keyed by the case-folded synonyms that refer to them.
+    :type synonyms: dict
+    """
+
+    def __init__(self, genes, synonyms):
+        self.genes = genes
+        self.synonyms = synonyms
+        self.folded = {}
+        for symbol in genes:
+            self.folded.setdefault(symbol.casefold(), []).append(symbol)
+
+    def __len__(self):
+        return len(self.genes)
+
+    @classmethod
+    def from_table(cls, path, columns=None):
+        """
+        Build the index from a tab-delimited annotation table, with a header line and a
+        row per gene, or from the gene records of a GTF file.
+
+        :param path: Path to the table or GTF file, optionally gzipped.
+        :type path: str
+        :param columns: Column of each gene ID type, keyed by "symbol", "entrez",
+            "ensembl" and "synonyms" (a list). Types not given are detected from
+            :data:`COLUMN_CANDIDATES`.
+        :type columns: dict
+        ...
+        :return: The gene table.
+        :rtype: :class:`GeneTable`
+        """
+
+        if _is_gtf(path):
+            df = _read_gtf(path)
+            columns = {"symbol": "symbol", "entrez": None, "ensembl": "ensembl", "synonyms": []}
+        else:
+            header = pd.read_csv(path, sep="\t", nrows=0).columns
+            columns = _resolve_columns(header, columns)
+            usecols = [c for c in [columns["symbol"], columns["entrez"], columns["ensembl"], *columns["synonyms"]]
+                       if c is not None]
+            df = pd.read_csv(path, sep="\t", dtype=str, usecols=usecols, keep_default_na=False)
+
+        genes = {}
+        symbols = df[columns["symbol"]].str.strip().tolist()
+        for id_type in ["entrez", "ensembl"]:
+            values = df[columns[id_type]].tolist() if columns[id_type] is not None else [""] * len(df)
+            for symbol, value in zip(symbols, values):
+                if not symbol:
+                    continue
+                ids = genes.setdefault(symbol, {"entrez": [], "ensembl": []})[id_type]
+                for gene_id in _split(value):
+                    if id_type == "ensembl":
+                        gene_id = _strip_version(gene_id)
+                    if gene_id not in ids:
+                        ids.append(gene_id)
+
+        synonyms = {}
+        for col in columns["synonyms"]:
+            for symbol, value in zip(symbols, df[col].tolist()):
+                if symbol:
+                    for synonym in _split(value):
+                        targets = synonyms.setdefault(synonym.casefold(), [])
+                        if symbol not in targets:
+                            targets.append(symbol)
+
+        return cls(genes, synonyms)
+
+    @classmethod
+    def load(cls, path, columns=None, cache_path=None):
+        """
+        Load the index from its binary cache, building and caching it if needed.
+
+        :param path: Path to the annotation table or GTF file.
+        :type path: str
+        :param columns: Column of each gene ID type, see :meth:`from_table`.
+        :type columns: dict
+        :param cache_path: Path of the serialized index. Defaults to a file in
+            ``~/.cache/crcminer`` named after the path, size and modification time of
+            the table and the columns used, so edited tables get a new cache.
+        :type cache_path: str
+        ...
+        :return: The gene table.
+        :rtype: :class:`GeneTable`
+        """
+
+        if cache_path is None:
+            st = os.stat(path)
+            h = hashlib.sha256(
+                f"genes:{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}:{sorted((columns or {}).items())}".encode()
+            )
+            cache_path = os.path.join(CACHE_DIR, h.hexdigest()[:32] + ".pkl")
+
+        if os.path.exists(cache_path):
+            with open(cache_path, "rb") as f:
+                return pickle.load(f)
+
+        table = cls.from_table(path, columns)
+        table.save(cache_path)
+        return table
+
+    def save(self, path):
+        """
+        Serialize the index to a file.
+
+        :param path: Output path.
+        :type path: str
+        """
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}"
+        with open(tmp, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def resolve(self, query, strict=False):
+        """
+        Find the gene a name refers to.
+
+        Names are matched to symbols exactly, then ignoring case, then to synonyms
+        (aliases and previous symbols). Names matching several genes are not resolved.
+
+        :param query: Gene name.
+        :type query: str
+        :param strict: Only accept exact symbol matches. Other matches are then reported
+            as bad matches, as MyGene.info symbol queries do.
+        :type strict: bool
+        ...
+        :return: Match status, "exact", "case", "synonym", :data:`BAD_MATCH` or
+            :data:`NOT_FOUND`, and the matched symbol, or None.
+        :rtype: tuple
+        """
+
+        if query in self.genes:
+            return "exact", query
+
+        for status, index in (("case", self.folded), ("synonym", self.synonyms)):
+            symbols = index.get(query.casefold())
+            if symbols:
+                if strict or len(symbols) > 1:
+                    return BAD_MATCH, None
+                return status, symbols[0]
+
+        return NOT_FOUND, None
+
+    def ids(self, symbol):
+        """
+        Get the Entrez and Ensembl IDs of a gene, several joined by ";".
+
+        :param symbol: Gene symbol.
+        :type symbol: str
+        ...
+        :return: Entrez and Ensembl IDs, :data:`NOT_FOUND` if the table has none.
+        :rtype: tuple
+        """
+
+        gene = self.genes[symbol]
+        return tuple(";".join(gene[id_type]) or NOT_FOUND for id_type in ["entrez", "ensembl"])
+
+
+def read_motif_names(motif_file):
+    """
+    Read the accession and alternate name of each motif in a MEME file.
+
+    Only MOTIF lines are parsed, so the file is read in a single pass.
+
+    :param motif_file: Path to the MEME motif file.
+    :type motif_file: str
+    ...
+    :return: Generator of (accession, alternate name) tuples, in file order. The
+        alternate name is None if the motif has none.
+    :rtype: generator
+    """
+
+    with open(motif_file) as f:
+        for line in f:
+            if line.startswith("MOTIF"):
+                words = line.split(None, 2)
+                yield words[1], words[2].strip() if len(words) > 2 else None
+
+
+def write_motif_id_map(
+    annotation,
+    output="motif_id_map.csv",
+    motif_file=MOTIF_FILE,
+    name_pattern=NAME_PATTERN,
+    columns=None,
+    strict=False,
+    cache_path=None
+):
+    """
+    Map each motif of a MEME file to a gene, and write the motif ID map read by
+    ``mine --mapping``, without network access.
+
+    Each line is "accession,name,symbol,entrez,ensembl", with the gene name taken from
+    the motif's alternate name, and its symbol and IDs from the annotation table.
+    Unresolved motifs have "notfound" (no matching gene) or "badmatch" (several, or only
+    inexact matches in ``strict`` mode) in place of the IDs, and motifs without an
+    alternate name or one not matching ``name_pattern`` are left out, so they are
+    reported by accession. Motifs sharing a gene each get their own line.
+
+    :param annotation: Path to the gene annotation table or GTF file, see
+        :meth:`GeneTable.from_table`.
+    :type annotation: str
+    :param output: Output path.
+    :type output: str
+    :param motif_file: Path to the MEME motif file.
+    :type motif_file: str
+    :param name_pattern: Regular expression finding the gene name in a motif's alternate
+        name. Its first group is used if it has any, otherwise the whole match.
+    :type name_pattern: str
+    :param columns: Column of each gene ID type, see :meth:`GeneTable.from_table`.
+    :type columns: dict
+    :param strict: Only accept exact symbol matches, see :meth:`GeneTable.resolve`.
+    :type strict: bool
+    :param cache_path: Path of the serialized annotation index, see :meth:`GeneTable.load`.
+    :type cache_path: str
+    ...
+    :return: Number of motifs with each match status, with "unnamed" for those left out.
+    :rtype: dict
+    """
+
+    pattern = re.compile(name_pattern)
+    with profiling.stage("annotation"):
+        table = GeneTable.load(annotation, columns, cache_path)
+        profiling.add_counts(genes=len(table), synonyms=len(table.synonyms))
+
+    status_counts = {}
+    with profiling.stage("map_motifs"), open(output, "w") as out:
+        for accession, alt_name in read_motif_names(motif_file):
+            match = pattern.search(alt_name) if alt_name is not None else None
+            if match is None:
+                status_counts["unnamed"] = status_counts.get("unnamed", 0) + 1
+                continue
+            query = match.group(1) if pattern.groups else match.group(0)
+
+            status, symbol = table.resolve(query, strict)
+            status_counts[status] = status_counts.get(status, 0) + 1
+            if symbol is None:
+                out.write(f"{accession},{query},{status},{status},{status}\n")
+            else:
+                entrez, ensembl = table.ids(symbol)
+                out.write(f"{accession},{query},{symbol},{entrez},{ensembl}\n")
+
+        profiling.add_counts(motifs=sum(status_counts.values()), **status_counts)
+    return status_counts
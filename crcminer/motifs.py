@@ -1,40 +1,193 @@
-import pyfaidx
+import ctypes
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
 import pyranges
 import pandas as pd
-from pymemesuite.common import Alphabet, Background, Sequence, MotifFile
+from pymemesuite.common import Alphabet, Array, Background, Sequence
 import Bio.SeqIO
+import pymemesuite.fimo
 from pymemesuite.fimo import FIMO
 
+from crcminer import profiling
+from crcminer.catalog import MotifCatalog
+from crcminer.genome import open_genome
+from crcminer.hits import HitBlock, HitWriter
+from crcminer.pwm import PWM, EncodedSequences, PWMScanner
+
+# FIMO estimates q-values with libmeme's global Mersenne Twister, so results depend on
+# every motif scanned before in the same process unless it is reseeded for each motif.
+_libmeme = ctypes.CDLL(pymemesuite.fimo.__file__)
+FIMO_SEED = 0
+
+
+def _read_regions(bed_path):
+    """
+    Read the first three columns of a BED file, sorted by chromosome and position.
+
+    :param bed_path: Path to the BED file.
+    :type bed_path: str
+    ...
+    :return: pandas dataframe with "chrom", "start" and "end" columns.
+    :rtype: :class:`pandas.DataFrame`
+    """
+
+    try:
+        regions = pd.read_csv(
+            bed_path,
+            sep="\t",
+            header=None,
+            usecols=[0, 1, 2],
+            names=["chrom", "start", "end"],
+            dtype={"chrom": str, "start": "int64", "end": "int64"},
+            comment="#",
+        )
+    except pd.errors.EmptyDataError:
+        # No regions, e.g. when no subpeaks overlap an enhancer.
+        regions = pd.DataFrame({
+            "chrom": pd.Series(dtype=str),
+            "start": pd.Series(dtype="int64"),
+            "end": pd.Series(dtype="int64"),
+        })
+
+    return regions.sort_values(["chrom", "start", "end"], kind="stable").reset_index(drop=True)
+
+
+def _region_names(regions):
+    """Name regions as chrom:start-end, matching the FASTA headers written for them."""
+    return regions["chrom"] + ":" + regions["start"].astype(str) + "-" + regions["end"].astype(str)
+
+
+def _merge_regions(regions):
+    """
+    Merge overlapping regions on the same chromosome.
+
+    :param regions: Sorted regions, as returned by :func:`_read_regions`.
+    :type regions: :class:`pandas.DataFrame`
+    ...
+    :return: Merge group number for each region.
+    :rtype: :class:`pandas.Series`
+    """
+
+    # A region starts a new group if it begins at or after the furthest end seen so far.
+    prev_end = regions.groupby("chrom", sort=False)["end"].cummax().shift()
+    new_chrom = regions["chrom"] != regions["chrom"].shift()
+    return (new_chrom | (regions["start"] >= prev_end)).cumsum()
 
-def extract_sequences_from_fasta(fasta_path, bed_path, output_path):
+
+def extract_sequences_from_fasta(
+    fasta_path, bed_path, output_path, merge=False, mapping_path=None,
+    block_size=1_000_000, max_gap=10_000
+):
     """Extract sequences from a FASTA file based on a BED file of regions.
 
     Writes the sequences to an output file.
 
-    :param fasta_path: Path to the genome FASTA file.
-    :type fasta_path: str
+    Regions are sorted by chromosome and position and grouped into blocks of nearby
+    regions spanning up to ``block_size`` bases, each of which is read from the FASTA
+    once, with region sequences sliced out of it. If a packed genome cache has been
+    written for the FASTA with :func:`crcminer.genome.index_genome`, blocks are read
+    from it rather than from the FASTA. Duplicate regions are only written once, and
+    overlapping regions can optionally be merged into a single record.
+
+    :param fasta_path: Path to the genome FASTA file, or the genome already opened with
+        :func:`crcminer.genome.open_genome`.
+    :type fasta_path: str or :class:`crcminer.genome.PackedGenome`
     :param bed_path: Path to the BED file.
     :type bed_path: str
     :param output_path: Path to the output file.
+    :type output_path: str
+    :param merge: Whether to merge overlapping regions into a single record.
+    :type merge: bool
+    :param mapping_path: Path to write a tab-delimited mapping of each BED region to
+        the name of the record containing it, if provided.
+    :type mapping_path: str
+    :param block_size: Maximum size of the genomic window read from the FASTA at once.
+    :type block_size: int
+    :param max_gap: Regions further apart than this are read in separate blocks.
+    :type max_gap: int
+    ...
+    :return: pandas dataframe of the BED regions, sorted, with the name of the
+        record containing each in the "record" column.
+    :rtype: :class:`pandas.DataFrame`
     """
 
-    # Open the FASTA file
-    fasta = pyfaidx.Fasta(fasta_path)
+    regions = _read_regions(bed_path)
+
+    # Records to write, with duplicates (and, optionally, overlaps) collapsed.
+    if merge:
+        group = _merge_regions(regions)
+        records = regions.groupby(group).agg(
+            chrom=("chrom", "first"), start=("start", "min"), end=("end", "max")
+        )
+        records["name"] = _region_names(records)
+        regions["record"] = group.map(records["name"])
+        records = records.reset_index(drop=True)
+    else:
+        regions["record"] = _region_names(regions)
+        records = (
+            regions.drop_duplicates("record")
+            .rename(columns={"record": "name"})
+            .reset_index(drop=True)
+        )
+
+    # Split records into blocks at large gaps between them, and cap block spans at block_size.
+    chroms = records["chrom"].to_numpy()
+    starts = records["start"].to_numpy()
+    ends = records["end"].to_numpy()
+    prev_end = records.groupby("chrom", sort=False)["end"].cummax().shift().to_numpy()
+    new_block = np.ones(len(records), dtype=bool)
+    new_block[1:] = (chroms[1:] != chroms[:-1]) | (starts[1:] - prev_end[1:] > max_gap)
+    gap_start = starts[np.maximum.accumulate(np.where(new_block, np.arange(len(records)), 0))]
+    new_block[1:] |= (starts[1:] - gap_start[1:]) // block_size != (starts[:-1] - gap_start[:-1]) // block_size
+    bounds = np.append(np.flatnonzero(new_block), len(records))
+
+    # Open the packed genome if available, otherwise the FASTA file.
+    genome = open_genome(fasta_path) if isinstance(fasta_path, str) else fasta_path
+    fetch = genome.fetch
+
+    names = records["name"].tolist()
+
+    with open(output_path, "w", buffering=1 << 20) as output_file:
+        for i, j in zip(bounds[:-1], bounds[1:]):
+            block_start = starts[i]
+            block_seq = fetch(chroms[i], block_start, ends[i:j].max())
+            output_file.write(
+                "".join(
+                    f">{names[k]}\n{block_seq[starts[k] - block_start:ends[k] - block_start]}\n"
+                    for k in range(i, j)
+                )
+            )
+
+    profiling.add_counts(
+        regions=len(regions), records=len(records), blocks=len(bounds) - 1,
+        bases=int((ends - starts).sum()),
+    )
+    if mapping_path is not None:
+        regions.to_csv(mapping_path, sep="\t", index=False)
 
-    # Open the output file
-    with open(output_path, "w") as output_file:
-        # Open the BED file
-        with open(bed_path, "r") as bed_file:
-            for line in bed_file:
-                fields = line.strip().split("\t")
-                chrom = fields[0]
-                start = int(fields[1])
-                end = int(fields[2])
-                # Use pyfaidx to extract the sequence
-                sequence = fasta[chrom][start:end]
-                # Write the sequence to the output file
-                output_file.write(f">{chrom}:{start}-{end}\n")
-                output_file.write(str(sequence) + "\n")
+    return regions
+
+
+def write_enhancer_bed(enhancers_file, output_bed):
+    """
+    Write the regions of a ROSE2 enhancer table to a BED file.
+
+    :param enhancers_file: Path to the tab-delimited file containing
+        the enhancers.
+    :type enhancers_file: str
+    :param output_bed: Path to the output BED file.
+    :type output_bed: str
+    """
+
+    enh_df = pd.read_table(enhancers_file)
+    profiling.add_counts(regions=len(enh_df))
+    enh_df[["CHROM", "START", "STOP", "REGION_ID"]].to_csv(
+        output_bed, sep="\t", header=False, index=False
+    )
 
 
 def intersect_beds(bed1, bed2, output_bed):
@@ -53,31 +206,217 @@ def intersect_beds(bed1, bed2, output_bed):
     bed2_df = pyranges.read_bed(bed2)
     bed1_df = pyranges.read_bed(bed1)
     result = bed1_df.intersect(bed2_df)
+    profiling.add_counts(regions=len(result))
 
     result.to_csv(output_bed, sep="\t", header=False)
 
 
+class SequenceCollection:
+    """
+    FASTA records held in memory as a single byte buffer.
+
+    Parse the extracted subpeak FASTA once and pass the collection to both
+    :func:`get_background` and :func:`scan_for_motifs`, rather than having each
+    of them reparse the file with Biopython.
+
+    :param names: Record names, i.e. the header up to the first whitespace.
+    :type names: list
+    :param buffer: Concatenated sequence letters of all records.
+    :type buffer: bytes
+    :param offsets: Start offset of each record in ``buffer``, followed by its length.
+    :type offsets: :class:`array.array`
+    """
+
+    def __init__(self, names, buffer, offsets):
+        self.names = names
+        self.buffer = buffer
+        self.offsets = offsets
+
+    @classmethod
+    def from_fasta(cls, fasta_file):
+        """
+        Read all records from a FASTA file.
+
+        :param fasta_file: Path to the FASTA file.
+        :type fasta_file: str
+        ...
+        :return: Collection of the FASTA records.
+        :rtype: :class:`SequenceCollection`
+        """
+
+        with open(fasta_file, "rb") as f:
+            data = f.read()
+
+        names = []
+        chunks = []
+        offsets = array("Q", [0])
+        for record in data.split(b">")[1:]:
+            header, _, seq = record.partition(b"\n")
+            seq = seq.replace(b"\n", b"").replace(b"\r", b"")
+            names.append(header.split(maxsplit=1)[0].decode())
+            chunks.append(seq)
+            offsets.append(offsets[-1] + len(seq))
+
+        return cls(names, b"".join(chunks), offsets)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        """Yield (name, sequence) string tuples."""
+        for i, name in enumerate(self.names):
+            yield name, self.buffer[self.offsets[i]:self.offsets[i + 1]].decode()
+
+    def __getitem__(self, key):
+        """Get a list of (name, sequence) string tuples for a slice of records."""
+        start, stop, _ = key.indices(len(self))
+        return [
+            (self.names[i], self.buffer[self.offsets[i]:self.offsets[i + 1]].decode())
+            for i in range(start, stop)
+        ]
+
+    def base_counts(self):
+        """
+        Count each nucleotide across all records, ignoring case.
+
+        :return: Dictionary of counts for "A", "C", "G" and "T".
+        :rtype: dict
+        """
+
+        return {
+            base: self.buffer.count(base.encode()) + self.buffer.count(base.lower().encode())
+            for base in "ACGT"
+        }
+
+    def batches(self, batch_size):
+        """
+        Yield lists of (name, sequence) string tuples, ``batch_size`` records at a time.
+        """
+
+        for i in range(0, len(self), batch_size):
+            yield self[i:i + batch_size]
+
+
+def _load_sequences(fasta):
+    """
+    Build pymemesuite sequences from a FASTA file or a :class:`SequenceCollection`.
+    """
+
+    if isinstance(fasta, SequenceCollection):
+        return [Sequence(seq, name=name.encode()) for name, seq in fasta]
+
+    return [
+        Sequence(str(record.seq), name=record.id.encode())
+        for record in Bio.SeqIO.parse(fasta, "fasta")
+    ]
+
+
 def get_background(fasta):
     """
     Get the background nucleotide sequences from a FASTA file.
 
-    :param fasta: Path to the FASTA file.
-    :type fasta: str
+    :param fasta: Path to the FASTA file, or the sequences already read from it.
+    :type fasta: str or :class:`SequenceCollection`
     ...
     :return: Background nucleotide sequences as a pymemesuite Background object.
     :rtype: :class:`pymemesuite.common.Background`
     """
 
-    alphabet = Alphabet.dna()
+    if isinstance(fasta, SequenceCollection):
+        return _background_from_counts(fasta.base_counts())
 
-    # Read in all sequences from subpeak FASTA.
-    sequences = [
-        Sequence(str(record.seq), name=record.id.encode())
-        for record in Bio.SeqIO.parse(fasta, "fasta")
-    ]
+    # Count bases record by record rather than holding every sequence in memory.
+    counts = dict.fromkeys("ACGT", 0)
+    for record in Bio.SeqIO.parse(fasta, "fasta"):
+        seq = str(record.seq).upper()
+        for base in counts:
+            counts[base] += seq.count(base)
+
+    return _background_from_counts(counts)
+
+
+def _background_from_counts(counts):
+    """
+    Build a background model from base counts, as ``Background.from_sequences`` would.
+
+    MEME averages the counts over both strands and adds a total pseudocount of 0.1
+    spread uniformly over the four bases, ignoring ambiguous letters.
+
+    :param counts: Dictionary of forward strand counts for "A", "C", "G" and "T".
+    :type counts: dict
+    ...
+    :return: Background nucleotide frequencies as a pymemesuite Background object.
+    :rtype: :class:`pymemesuite.common.Background`
+    """
+
+    at = counts["A"] + counts["T"]
+    cg = counts["C"] + counts["G"]
+    profiling.add_counts(bases=at + cg)
+    total = 2 * (at + cg) + 0.1
+    a = (at + 0.1 * 0.25) / total
+    c = (cg + 0.1 * 0.25) / total
+
+    return Background(Alphabet.dna(), Array([a, c, c, a]))
+
+
+def _join_by_row(rows, values):
+    """
+    Comma-join values sharing a row label.
+
+    :param rows: Row labels, grouped so that equal labels are adjacent.
+    :type rows: :class:`numpy.ndarray`
+    :param values: String values, one per row label.
+    :type values: :class:`numpy.ndarray`
+    ...
+    :return: Joined values indexed by row label.
+    :rtype: :class:`pandas.Series`
+    """
+
+    bounds = np.flatnonzero(np.diff(rows)) + 1
+    starts = np.concatenate(([0], bounds)).tolist()
+    ends = np.concatenate((bounds, [len(rows)])).tolist()
+    values = values.tolist()
+
+    return pd.Series(
+        [",".join(values[i:j]) for i, j in zip(starts, ends)],
+        index=rows[starts] if len(rows) else rows,
+        dtype=object,
+    )
+
+
+def enhancer_gene_ids(enh_df, id_cols):
+    """
+    Get the distinct genes associated with each enhancer, as integer codes.
+
+    :param enh_df: Enhancer table, with a default integer index.
+    :type enh_df: :class:`pandas.DataFrame`
+    :param id_cols: Columns of comma-delimited gene IDs, in order of precedence.
+    :type id_cols: list
+    ...
+    :return: Row number and gene code of each (enhancer, gene) pair, sorted by row
+        and in column order within a row, and the gene IDs the codes refer to.
+    :rtype: tuple
+    """
+
+    # One row per (enhancer, gene), in column order, keeping the first occurrence of each gene.
+    genes = (
+        enh_df[id_cols]
+        .stack()
+        .dropna()
+        .astype(str)
+        .str.split(",")
+        .explode()
+        .str.strip()
+        .droplevel(-1)
+    )
+    genes = genes[genes != ""]
+
+    # Integer-code genes, so de-duplication works on codes.
+    codes, uniques = pd.factorize(genes)
+    rows = genes.index.to_numpy()
+    first = ~pd.Series(rows * len(uniques) + codes).duplicated().to_numpy()
 
-    bg_seq = Background.from_sequences(alphabet, *sequences)
-    return bg_seq
+    return rows[first], codes[first], uniques
 
 
 def filter_enhancers_to_active_genes(
@@ -101,7 +440,7 @@ def filter_enhancers_to_active_genes(
     :type enhancers_file: str
     :param id_cols: List of column names in the enhancers file that contain
         the gene IDs that should be concatenated and uniquified to form the
-        "all_genes" column.
+        "all_genes" column. Genes are matched to the active gene list exactly.
     :type id_cols: list
     ...
     :return: pandas dataframe of enhancers associated with active genes.
@@ -110,33 +449,242 @@ def filter_enhancers_to_active_genes(
 
     # Read in active genes.
     with open(active_gene_file) as f:
-        active_genes = f.readlines()
+        active_genes = {line.strip() for line in f if line.strip()}
 
     # Read enhancers.
     enh_df = pd.read_table(enhancers_file)
 
-    # TODO - Test, this may not actually work. 
+    # Each distinct gene is only checked against the active list once.
+    rows, codes, uniques = enhancer_gene_ids(enh_df, id_cols)
+    is_active = pd.Index(uniques).isin(active_genes)[codes]
 
-    # concatenate and uniquify values across columns
-    enh_df["all_genes"] = (
-        enh_df[id_cols]
-        .astype(str)
-        .T.apply(lambda x: x.str.split(","))
-        .apply(lambda x: ",".join(pd.Series(sum(x, [])).drop_duplicates()))
-    )
+    names = np.asarray(uniques, dtype=object)
+    enh_df["all_genes"] = _join_by_row(rows, names[codes])
+    enh_df["active_genes"] = _join_by_row(rows[is_active], names[codes[is_active]])
+
+    # pandas dataframe of enhancers associated with active genes
+    active = enh_df[enh_df["active_genes"].notna()].copy()
+    profiling.add_counts(enhancers=len(enh_df), active_enhancers=len(active))
+    return active
+
+
+def _score_motif(fimo, motif, sequences, background):
+    """
+    Score sequences with a motif, reseeding the FIMO q-value RNG beforehand.
+
+    This makes the result for a motif independent of which process scanned it
+    and of the motifs scanned before it.
+    """
+
+    _libmeme.srand_mt(ctypes.c_uint32(FIMO_SEED))
+    return fimo.score_motif(motif, sequences, background)
+
+
+def _new_scanner(engine, threshold):
+    """Create the motif scanner for an engine, "fimo" or "numpy"."""
+    if engine == "numpy":
+        return PWMScanner(threshold=threshold)
+    if engine == "fimo":
+        return FIMO(both_strands=True, threshold=threshold)
+    raise ValueError(f"Unknown scanning engine: {engine}")
+
+
+def _prepare_motifs(engine, motifs, background):
+    """Build the scoring matrices of the numpy engine once, rather than for every scan."""
+    if engine == "numpy":
+        return {idx: PWM.from_motif(motif, background) for idx, motif in motifs.items()}
+    return motifs
+
+
+def _prepare_sequences(engine, fasta):
+    """
+    Load sequences in the form the engine scans.
+
+    :param fasta: Path to a FASTA file, a :class:`SequenceCollection`, or a list of
+        (name, sequence) string tuples.
+    """
+
+    if engine == "numpy":
+        if isinstance(fasta, SequenceCollection):
+            return EncodedSequences(fasta.names, fasta.buffer, fasta.offsets)
+        if isinstance(fasta, str):
+            return EncodedSequences.from_records(
+                (record.id, str(record.seq)) for record in Bio.SeqIO.parse(fasta, "fasta")
+            )
+        return EncodedSequences.from_records(fasta)
+
+    if isinstance(fasta, list):
+        return [Sequence(seq, name=name.encode()) for name, seq in fasta]
+    return _load_sequences(fasta)
+
+
+def _scan_motif(scanner, motif, sequences, background, motif_id):
+    """
+    Scan sequences prepared by :func:`_prepare_sequences` with a motif.
+
+    :return: The matches, reported under ``motif_id``.
+    :rtype: :class:`crcminer.hits.HitBlock`
+    """
+
+    if isinstance(scanner, PWMScanner):
+        hits = scanner.score_motif(motif, sequences, background)
+        return HitBlock(
+            motif_id, sequences.names, hits["record"], hits["start"], hits["stop"],
+            hits["score"], hits["strand"], hits["pvalue"], hits["qvalue"],
+        )
+    return HitBlock.from_pattern(_score_motif(scanner, motif, sequences, background), motif_id)
+
+
+# Per-process state for scanning workers, set by _init_scan_worker.
+_worker_state = {}
+
+
+def _init_scan_worker(catalog, selected, fasta_file, bg_frequencies, threshold, engine="fimo"):
+    """
+    Load motifs, sequences and background once per scanning worker process.
+
+    pymemesuite objects cannot be pickled, so each worker parses the selected motifs
+    from the catalog and rebuilds the background from its letter frequencies. In streaming mode,
+    ``fasta_file`` is None and sequence batches are sent with each task instead.
+    """
+
+    background = Background(Alphabet.dna(), Array(bg_frequencies))
+    motifs = catalog.motifs(idx for idx, _ in selected)
+    _worker_state["motifs"] = _prepare_motifs(engine, motifs, background)
+    if fasta_file is not None:
+        _worker_state["sequences"] = _prepare_sequences(engine, fasta_file)
+    _worker_state["background"] = background
+    _worker_state["scanner"] = _new_scanner(engine, threshold)
+    _worker_state["engine"] = engine
+    _worker_state["selected"] = selected
+
+
+def _scan_motif_shard(shard):
+    """
+    Scan a shard of motifs in a worker process.
+
+    :param shard: List of (motif index, motif ID) tuples.
+    :type shard: list
+    ...
+    :return: Matches of each motif, in shard order.
+    :rtype: list
+    """
 
-    enh_df = (
-        enh_df[enh_df["all_genes"].str.contains("|".join(active_genes))].copy()
+    out = []
+    for idx, motif_id in shard:
+        # Write each line at once, newline included, so lines from different workers
+        # do not interleave, even with unbuffered output.
+        print("Scanning for occurrences of " + motif_id + "\n", end="", flush=True)
+        out.append(
+            _scan_motif(
+                _worker_state["scanner"],
+                _worker_state["motifs"][idx],
+                _worker_state["sequences"],
+                _worker_state["background"],
+                motif_id,
+            )
+        )
+
+    return out
+
+
+def _scan_batch(scanner, engine, motifs, selected, records, background):
+    """
+    Scan one batch of sequences against all selected motifs.
+
+    :param scanner: Motif scanner, as created by :func:`_new_scanner`.
+    :type scanner: :class:`pymemesuite.fimo.FIMO` or :class:`crcminer.pwm.PWMScanner`
+    :param engine: Scanning engine, "fimo" or "numpy".
+    :type engine: str
+    :param motifs: Selected motifs keyed by motif index.
+    :type motifs: dict
+    :param selected: List of (motif index, motif ID) tuples to scan.
+    :type selected: list
+    :param records: List of (name, sequence) string tuples.
+    :type records: list
+    :param background: Background nucleotide frequencies.
+    :type background: :class:`pymemesuite.common.Background`
+    ...
+    :return: Matches of each motif, in motif order.
+    :rtype: list
+    """
+
+    sequences = _prepare_sequences(engine, records)
+    out = []
+    for idx, motif_id in selected:
+        out.append(_scan_motif(scanner, motifs[idx], sequences, background, motif_id))
+
+    return out
+
+
+def _scan_sequence_batch(records):
+    """
+    Scan a batch of sequences in a worker process.
+
+    :param records: List of (name, sequence) string tuples.
+    :type records: list
+    ...
+    :return: Matches of each motif, in motif order.
+    :rtype: list
+    """
+
+    return _scan_batch(
+        _worker_state["scanner"],
+        _worker_state["engine"],
+        _worker_state["motifs"],
+        _worker_state["selected"],
+        records,
+        _worker_state["background"],
     )
 
-    enh_df["active_genes"] = (
-        enh_df["active_genes"]
-        .apply(lambda x: x.split(","))
-        .apply(lambda x: ",".join([y for y in x if y in active_genes]))
+
+def _iter_fasta_batches(fasta_file, batch_size):
+    """
+    Read a FASTA file in batches of records.
+
+    :param fasta_file: Path to the FASTA file.
+    :type fasta_file: str
+    :param batch_size: Number of records per batch.
+    :type batch_size: int
+    ...
+    :return: Generator of lists of (name, sequence) string tuples.
+    :rtype: generator
+    """
+
+    records = (
+        (record.id, str(record.seq))
+        for record in Bio.SeqIO.parse(fasta_file, "fasta")
     )
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _count_batches(batches, motifs):
+    """Pass sequence batches through, adding their size to the running profiling stage."""
+    for records in batches:
+        bases = sum(len(seq) for _, seq in records)
+        profiling.add_counts(sequences=len(records), bases=bases, motif_bases=bases * motifs)
+        yield records
 
-    # pandas dataframe of enhancers associated with active genes
-    return enh_df
+
+def _bounded_map(pool, fn, iterable, max_pending):
+    """
+    Like ``pool.map``, but only keep ``max_pending`` tasks in flight.
+
+    ``Executor.map`` consumes its whole input up front, which would read the
+    entire FASTA into memory. Results are yielded in submission order.
+    """
+
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
 
 
 def scan_for_motifs(
@@ -148,10 +696,14 @@ def scan_for_motifs(
     motif_id_map=None,
     active_genes=None,
     threshold=1e-4,
-    occurence_cutoff=1
+    occurence_cutoff=1,
+    workers=1,
+    batch_size=None,
+    engine="fimo",
+    output_format="tsv"
 ):
     """
-    Scan for motif occurrences in a FASTA file using FIMO.
+    Scan for motif occurrences in a FASTA file using FIMO, or its vectorized NumPy equivalent.
 
     The output file will contain a list of motif occurrences, one per line, with the following columns:
     * sequence_record: The name of the sequence in which the motif was found, e.g. chr1:100-200.
@@ -164,10 +716,29 @@ def scan_for_motifs(
     * p-value: The p-value of the motif occurrence.
     * q-value: The q-value of the motif occurrence.
 
-    :param motif_file: Path to the motif file.
-    :type motif_file: str
-    :param fasta_file: Path to the FASTA file.
-    :type fasta_file: str
+    By default, the output is tab-delimited text without a header. It can also be written
+    as Parquet or Arrow IPC, with one row group (or record batch) per motif and the record
+    names and motif IDs dictionary-encoded, which is smaller and much faster to read back
+    with :func:`crcminer.hits.read_hits`.
+
+    Motifs are written in the order they appear in the motif file, regardless of
+    the number of workers used, so parallel runs produce the same output as serial ones.
+
+    If ``batch_size`` is set, the FASTA file is streamed in batches of that many
+    sequences, each of which is scanned against all motifs and written out before
+    the next is read, so memory use is bounded by the batch size rather than the
+    number of sequences. Output is then ordered by batch, then motif, and q-values
+    are computed within each batch rather than across all sequences.
+
+    The "numpy" engine (:class:`crcminer.pwm.PWMScanner`) scores every motif over all
+    sequences at once with array operations. It reports the same matches, scores and
+    p-values as FIMO, but exact Benjamini-Hochberg q-values rather than FIMO's estimates.
+
+    :param motif_file: Path to the motif file, or a catalog built from it. If a catalog is
+        given, its own motif ID map is used and ``motif_id_map`` is ignored.
+    :type motif_file: str or :class:`crcminer.catalog.MotifCatalog`
+    :param fasta_file: Path to the FASTA file, or the sequences already read from it.
+    :type fasta_file: str or :class:`SequenceCollection`
     :param fimo_background: Background nucleotide sequences as a pymemesuite Background object.
     :type fimo_background: :class:`pymemesuite.common.Background`
     :param output_file: Path to the output file.
@@ -178,76 +749,119 @@ def scan_for_motifs(
     :type active_genes: list
     :param threshold: Threshold for FIMO p-value. Matches must have a p-value less than this threshold to be retained.
     :type threshold: float
-    :param occurence_cutoff: Minimum number of motif occurences to count as an edge connection downstream.
+    :param occurence_cutoff: Unused, all matches are written. Overlapping matches are collapsed
+        and counted against the cutoff downstream, by :func:`crcminer.hits.count_occurrences`.
     :type occurence_cutoff: int
-    ...
-    :return: pandas dataframe of enhancers associated with active genes.
-    :rtype: :class:`pandas.DataFrame`
+    :param workers: Number of worker processes to shard motifs (or sequence batches) across.
+        If 1, motifs are scanned in this process.
+    :type workers: int
+    :param batch_size: Number of sequences per batch in streaming mode. If None, all
+        sequences are loaded at once.
+    :type batch_size: int
+    :param engine: Scanning engine, "fimo" or "numpy".
+    :type engine: str
+    :param output_format: Output format, "tsv", "parquet" or "arrow". See :class:`crcminer.hits.HitWriter`.
+    :type output_format: str
     """
 
-    sequences = [
-        Sequence(str(record.seq), name=record.id.encode())
-        for record in Bio.SeqIO.parse(fasta_file, "fasta")
-    ]
+    # Determine which motifs to scan and the ID to report for each, and only parse those.
+    if isinstance(motif_file, MotifCatalog):
+        catalog = motif_file
+    else:
+        catalog = MotifCatalog.from_files(motif_file, motif_id_map)
+
+    selected = catalog.select(id_map_col, active_genes)
+    motifs = catalog.motifs(idx for idx, _ in selected)
+    scanner = _new_scanner(engine, threshold)
+    profiling.add_counts(motifs=len(selected))
+    if batch_size is None and isinstance(fasta_file, SequenceCollection):
+        bases = fasta_file.offsets[-1]
+        profiling.add_counts(
+            sequences=len(fasta_file), bases=bases, motif_bases=bases * len(selected)
+        )
+
+    with HitWriter(output_file, output_format) as out:
+        if batch_size is not None:
+            _stream_scan(
+                catalog, fasta_file, fimo_background, out, motifs, selected,
+                threshold, workers, batch_size, engine
+            )
+            return
+
+        if workers <= 1:
+            sequences = _prepare_sequences(engine, fasta_file)
+            motifs = _prepare_motifs(engine, motifs, fimo_background)
+
+            for idx, motif_id in selected:
+                print("Scanning for occurrences of " + motif_id)
+                out.write(_scan_motif(scanner, motifs[idx], sequences, fimo_background, motif_id))
+            return
+
+        # Several small shards per worker keeps the pool balanced, as motif widths vary.
+        shard_size = max(1, -(-len(selected) // (workers * 4)))
+        shards = [
+            selected[i:i + shard_size] for i in range(0, len(selected), shard_size)
+        ]
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_scan_worker,
+            initargs=(
+                catalog,
+                selected,
+                fasta_file,
+                list(fimo_background.frequencies),
+                threshold,
+                engine,
+            ),
+        ) as pool:
+            # map() yields results in submission order, keeping output deterministic.
+            for blocks in pool.map(_scan_motif_shard, shards):
+                for block in blocks:
+                    out.write(block)
+
+
+def _stream_scan(
+    catalog, fasta_file, fimo_background, out, motifs, selected,
+    threshold, workers, batch_size, engine="fimo"
+):
+    """
+    Scan a FASTA file in batches of sequences, writing hits after each batch.
 
-    fimo = FIMO(both_strands=True, threshold=threshold)
-
-    # Read in motif mappings and use motif accession as key.
-    motif_mappings = {}
-    if motif_id_map is not None:
-        with open(motif_id_map) as r:
-            for line in r:
-                lines = line.strip().split(",")
-                motif_accession = lines[0]
-                gene_symbol = lines[1]
-                entrez = lines[3]
-                ensemble = lines[4]
-                motif_mappings[motif_accession] = {
-                    "symbol": gene_symbol,
-                    "entrez": entrez,
-                    "ensemble": ensemble,
-                }
-
-    # Iterate through motifs in PWM file and find instances.
-    # TODO - Multiprocessing, see https://stackoverflow.com/a/29640590/4438552
-    with MotifFile(motif_file) as motif_file, open(output_file, "w") as out:
-        for motif in motif_file:
-            motif_id = motif.accession.decode()
-
-            # If active genes provided, check if PWM gene/ID matches any of active genes.
-            if active_genes is not None:
-                # If provided, pull appropriate ID from motif ID map.
-                if len(motif_mappings) != 0:
-                    motif_ids = motif_mappings[motif.accession.decode()]
-                    motif_id = motif_ids[id_map_col]
-                else:
-                    motif_id = motif.accession.decode()
-
-                # Deal with multiple gene IDs here.
-                motif_id = [s in active_genes for s in motif_id.split(";")]
-                
-                if len(motif_id) == 0:
-                    continue
-
-            print("Scanning for occurrences of " + ";".join(motif_id))
-
-            # Scan for motif instances.
-            pattern = fimo.score_motif(motif, sequences, fimo_background)
-
-            # TODO - Implement occurence_cutoff filtering. If > 1, need to collapse overlapping matched elements and count them as one.
-            # Then only need to report the match if the number of occurences is >= occurence_cutoff.
-            # This should probably be done downstream from this function.
-
-            for m in pattern.matched_elements:
-                print(
-                    m.source.accession.decode(),
-                    m.start,
-                    m.stop,
-                    motif_id,
-                    m.score,
-                    m.strand,
-                    m.pvalue,
-                    m.qvalue,
-                    file=out,
-                    sep="\t",
-                )
+    See :func:`scan_for_motifs` for parameter descriptions.
+    """
+
+    if isinstance(fasta_file, SequenceCollection):
+        batches = fasta_file.batches(batch_size)
+    else:
+        batches = _iter_fasta_batches(fasta_file, batch_size)
+    batches = _count_batches(batches, len(selected))
+
+    if workers <= 1:
+        scanner = _new_scanner(engine, threshold)
+        motifs = _prepare_motifs(engine, motifs, fimo_background)
+        for n, records in enumerate(batches, 1):
+            for block in _scan_batch(scanner, engine, motifs, selected, records, fimo_background):
+                out.write(block)
+            print(f"Scanned batch {n}")
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_scan_worker,
+        initargs=(
+            catalog,
+            selected,
+            None,
+            list(fimo_background.frequencies),
+            threshold,
+            engine,
+        ),
+    ) as pool:
+        # Two batches per worker keeps the pool busy while bounding memory.
+        for n, blocks in enumerate(
+            _bounded_map(pool, _scan_sequence_batch, batches, workers * 2), 1
+        ):
+            print(f"Scanned batch {n}")
+            for block in blocks:
+                out.write(block)
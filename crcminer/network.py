@@ -1,25 +1,29 @@
 import os
 import logging
 import argparse
+import heapq
+from concurrent.futures import ProcessPoolExecutor
+
 import networkx as nx
+import numpy as np
 import pandas as pd
-from itertools import product
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from crcminer import profiling
+from crcminer.edges import EdgeList, read_edge_table
 
 
 SCRIPT_PATH = os.path.abspath(__file__)
 FORMAT = "[%(asctime)s] %(levelname)s %(message)s"
 l = logging.getLogger()
-lh = logging.StreamHandler()
-lh.setFormatter(logging.Formatter(FORMAT))
-l.addHandler(lh)
-l.setLevel(logging.INFO)
 debug = l.debug
 info = l.info
 warning = l.warning
 error = l.error
 
 
-def parse_enhancers(enhancer_bedfile, gene_col="gene", motif_col="motif"):
+def parse_enhancers(enhancer_bedfile, gene_col="gene", motif_col="motif", weights=False):
     """
     Parse enhancer bed file with gene associations and motifs found in enhancer.
 
@@ -33,25 +37,315 @@ def parse_enhancers(enhancer_bedfile, gene_col="gene", motif_col="motif"):
     chr1	11131	11421		FOO1
     chr1	11151	11521	BAR1
     output:
-    edgelist: [['A', 'BAR'], ['B', 'BAR'], ['C', 'BAR'], ['FOO', 'X'], ['FOO', 'Y'], ['FOO', 'Z'], ['JANE1', 'DOE']]
+    EdgeList of the distinct edges, as integer codes into its nodes:
+    [('A', 'BAR'), ('B', 'BAR'), ('C', 'BAR'), ('FOO', 'X'), ('FOO', 'Y'), ('FOO', 'Z'), ('JANE1', 'DOE')]
+
+    weights: also count how many times each edge appears.
+    """
+    return read_edge_table(enhancer_bedfile, gene_col, motif_col, weights=weights)
+
+
+class TFNetwork:
+    """
+    Directed network as a sparse boolean adjacency matrix over integer node codes.
+
+    Duplicate edges are collapsed, as in a :class:`networkx.DiGraph`, so degrees
+    count distinct neighbours and a self-loop adds one to both in- and out-degree.
+
+    :param nodes: Node names, indexed by code.
+    :type nodes: :class:`numpy.ndarray`
+    :param adjacency: Adjacency matrix, with a row per source and a column per target node.
+    :type adjacency: :class:`scipy.sparse.csr_matrix`
+    """
 
+    def __init__(self, nodes, adjacency):
+        self.nodes = np.asarray(nodes, dtype=object)
+        self.adjacency = adjacency
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @classmethod
+    def from_edges(cls, edges):
+        """
+        Build a network from an edge list.
+
+        :param edges: Edges as an :class:`crcminer.edges.EdgeList`, or as (source, target)
+            name pairs, e.g. from :func:`parse_enhancers`.
+        :type edges: :class:`crcminer.edges.EdgeList` or list
+        ...
+        :return: The network.
+        :rtype: :class:`TFNetwork`
+        """
+
+        if isinstance(edges, EdgeList):
+            nodes, source, target = edges.nodes, edges.source, edges.target
+        else:
+            # Code nodes in order of first appearance, as networkx adds them.
+            pairs = np.asarray(edges, dtype=object).reshape(-1, 2)
+            codes, nodes = pd.factorize(pairs.ravel())
+            source, target = codes[0::2], codes[1::2]
+
+        n = len(nodes)
+        adjacency = sparse.csr_matrix(
+            (np.ones(len(source), dtype=bool), (source, target)), shape=(n, n)
+        )
+        # Duplicate entries are summed on conversion; any nonzero is one edge.
+        adjacency.sum_duplicates()
+        adjacency.data[:] = True
+        return cls(nodes, adjacency)
+
+    def out_degree(self):
+        """Number of distinct successors of each node."""
+        return np.diff(self.adjacency.indptr)
+
+    def in_degree(self):
+        """Number of distinct predecessors of each node."""
+        return np.bincount(self.adjacency.indices, minlength=len(self))
+
+    def self_loops(self):
+        """Codes of the nodes with a self-loop, in code order."""
+        return np.flatnonzero(self.adjacency.diagonal())
+
+    def mutual_pairs(self, nodes=None):
+        """
+        Get the pairs of distinct nodes with edges in both directions.
+
+        :param nodes: Codes of the nodes to consider. Defaults to all nodes.
+        :type nodes: :class:`numpy.ndarray`
+        ...
+        :return: Codes of the first and second node of each ordered pair, so each
+            pair appears in both directions, sorted by first then second node.
+        :rtype: tuple
+        """
+
+        # A AND A^T, without the diagonal.
+        mutual = self.adjacency.multiply(self.adjacency.T).tocoo()
+        keep = mutual.row != mutual.col
+        if nodes is not None:
+            selected = np.zeros(len(self), dtype=bool)
+            selected[nodes] = True
+            keep &= selected[mutual.row] & selected[mutual.col]
+
+        first, second = mutual.row[keep].astype(np.int64), mutual.col[keep].astype(np.int64)
+        order = np.lexsort((second, first))
+        return first[order], second[order]
+
+    def degree_table(self):
+        """
+        Get the in-, out- and total degree of each node.
+
+        :return: pandas dataframe with "TF", "Out", "In" and "Total" columns, sorted by TF.
+        :rtype: :class:`pandas.DataFrame`
+        """
+
+        out_degree = self.out_degree().astype(np.int64)
+        in_degree = self.in_degree().astype(np.int64)
+        table = pd.DataFrame({
+            "TF": self.nodes,
+            "Out": out_degree,
+            "In": in_degree,
+            "Total": out_degree + in_degree,
+        })
+        return table.sort_values("TF", kind="stable").reset_index(drop=True)
+
+
+def _mutual_components(network, nodes=None):
     """
-    df = pd.read_csv(enhancer_bedfile, sep="\t")
-    df = df[[gene_col, motif_col]]  # these names are mocked.
-    df2 = df.dropna()
-    df2 = (
-        df2.assign(gene=df2[gene_col].str.split(","), motif=df2[motif_col].str.split(","))
-        .explode(gene_col)
-        .explode(motif_col)
-        .reset_index(drop=True)
+    Split the pairs of nodes that regulate each other into connected components.
+
+    :return: Node codes of each component, in ascending order, and its edges as
+        (first, second) code pairs, or None if it is complete. Components are in order
+        of their lowest node code.
+    :rtype: list
+    """
+
+    first, second = network.mutual_pairs(nodes)
+    upper = first < second
+    first, second = first[upper], second[upper]
+
+    n = len(network)
+    graph = sparse.csr_matrix((np.ones(len(first), dtype=bool), (first, second)), shape=(n, n))
+    # Components are labelled in order of their lowest node code.
+    _, labels = csgraph.connected_components(graph, directed=False)
+    component = labels[first]
+    order = np.argsort(component, kind="stable")
+    first, second, component = first[order], second[order], component[order]
+    bounds = np.flatnonzero(np.r_[True, component[1:] != component[:-1], True]) if len(first) else [0]
+
+    components = []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        members = np.union1d(first[lo:hi], second[lo:hi])
+        edges = None
+        if hi - lo < len(members) * (len(members) - 1) // 2:
+            edges = list(zip(first[lo:hi].tolist(), second[lo:hi].tolist()))
+        components.append((members.tolist(), edges))
+    return components
+
+
+def _map_components(func, components, workers, *args):
+    """
+    Call ``func(edges, *args)`` on each component that is not complete, in a process
+    pool if ``workers`` > 1.
+
+    :return: Results by component, None for complete components.
+    :rtype: list
+    """
+
+    # Search the largest components first, so they do not hold up the pool at the end.
+    search = sorted(
+        (i for i, (_, edges) in enumerate(components) if edges is not None),
+        key=lambda i: len(components[i][1]),
+        reverse=True,
     )
-    # print(df.head())
-    node_edge_list = df2.values.tolist()  # edgelist
+    edges = [components[i][1] for i in search]
+    if workers <= 1 or len(search) <= 1:
+        found = [func(e, *args) for e in edges]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            found = list(pool.map(func, edges, *[[a] * len(edges) for a in args]))
+
+    results = [None] * len(components)
+    for i, result in zip(search, found):
+        results[i] = result
+    return results
+
+
+def _component_cliques(edges):
+    """Enumerate the maximal cliques of one connected component, given by its edges."""
+    graph = nx.Graph()
+    graph.add_edges_from(edges)
+    return [sorted(clique) for clique in nx.find_cliques(graph)]
 
-    return node_edge_list
 
+def find_crc_cliques(network, nodes=None, workers=1):
+    """
+    Find the maximal cliques of nodes that regulate each other.
+
+    Mutual pairs are split into connected components, and the cliques of each are
+    enumerated separately, in a process pool if ``workers`` > 1. Components that are
+    already complete, such as single pairs, are their own clique and are not searched.
+
+    :param network: The network.
+    :type network: :class:`TFNetwork`
+    :param nodes: Codes of the nodes to consider, e.g. those with self-loops. Defaults to all nodes.
+    :type nodes: :class:`numpy.ndarray`
+    :param workers: Number of worker processes.
+    :type workers: int
+    ...
+    :return: The cliques, as lists of node codes in ascending order, grouped by component
+        in order of their lowest node code, and the number of cliques containing each node.
+    :rtype: tuple
+    """
+
+    components = _mutual_components(network, nodes)
+    found = _map_components(_component_cliques, components, workers)
+
+    cliques = []
+    for (members, _), result in zip(components, found):
+        cliques.extend([members] if result is None else result)
+
+    members = np.fromiter((code for clique in cliques for code in clique), dtype=np.int64)
+    return cliques, np.bincount(members, minlength=len(network))
+
+
+def _score_bound(total, size, degrees):
+    """
+    Get the highest mean out-degree of a clique of at least 3 nodes extending one with
+    the given out-degree ``total`` and ``size`` by some of the out-degrees ``degrees``.
+    """
+
+    best = -np.inf
+    for i, degree in enumerate(sorted(degrees, reverse=True), 1):
+        total += degree
+        if size + i > 2:
+            best = max(best, total / (size + i))
+    return best
 
-def networkX_helpers(input_nodelist):
+
+def _component_top_cliques(edges, out_degree, k):
+    """
+    Find the ``k`` best scoring maximal cliques of one connected component.
+
+    Cliques are enumerated by Bron-Kerbosch with pivoting, visiting high out-degree
+    nodes first. A branch is dropped once no clique within it can reach the score of
+    the worst clique kept, so only part of the cliques are ever enumerated.
+
+    :return: (score, clique) tuples, with clique node codes in ascending order.
+    :rtype: list
+    """
+
+    neighbours = {}
+    for u, v in edges:
+        neighbours.setdefault(u, set()).add(v)
+        neighbours.setdefault(v, set()).add(u)
+
+    # Min-heap of the best cliques, with the worst on top. Ties are ranked by node codes;
+    # maximal cliques never contain one another, so negated codes reverse that order.
+    heap = []
+
+    def expand(clique, total, candidates, excluded):
+        if not candidates and not excluded:
+            if len(clique) > 2 and total > 0:
+                entry = (total / len(clique), tuple(-c for c in sorted(clique)))
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+            return
+
+        bound = _score_bound(total, len(clique), [out_degree[c] for c in candidates])
+        if bound <= 0 or (len(heap) == k and bound < heap[0][0]):
+            return
+
+        pivot = max(candidates | excluded, key=lambda u: len(candidates & neighbours[u]))
+        for v in sorted(candidates - neighbours[pivot], key=lambda v: -out_degree[v]):
+            expand(clique + [v], total + out_degree[v], candidates & neighbours[v], excluded & neighbours[v])
+            candidates.remove(v)
+            excluded.add(v)
+
+    expand([], 0, set(neighbours), set())
+    return [(score, [-c for c in codes]) for score, codes in heap]
+
+
+def top_crc_cliques(network, k, nodes=None, workers=1):
+    """
+    Find the ``k`` maximal cliques of nodes that regulate each other with the highest
+    mean out-degree, without enumerating every clique.
+
+    Gives the same cliques as the top of the ranking of :func:`find_crc_cliques`, with
+    cliques of fewer than 3 nodes or a score of 0 left out, and ties ranked by node codes.
+
+    :param network: The network.
+    :type network: :class:`TFNetwork`
+    :param k: Number of cliques to keep.
+    :type k: int
+    :param nodes: Codes of the nodes to consider, e.g. those with self-loops. Defaults to all nodes.
+    :type nodes: :class:`numpy.ndarray`
+    :param workers: Number of worker processes.
+    :type workers: int
+    ...
+    :return: (clique, score) tuples, best first, with clique node codes in ascending order.
+    :rtype: list
+    """
+
+    components = _mutual_components(network, nodes)
+    out_degree = network.out_degree().astype(np.int64)
+    found = _map_components(_component_top_cliques, components, workers, out_degree.tolist(), k)
+
+    ranked = []
+    for (members, _), result in zip(components, found):
+        if result is None:
+            total = int(out_degree[members].sum())
+            if len(members) > 2 and total > 0:
+                ranked.append((members, total / len(members)))
+        else:
+            ranked.extend((clique, score) for score, clique in result)
+
+    return heapq.nsmallest(k, ranked, key=lambda x: (-x[1], x[0]))
+
+
+def networkX_helpers(input_nodelist, workers=1, top_k=None, outdir="."):
     """
     Input is a node edge list
     These will have both node and edge list
@@ -72,121 +366,102 @@ def networkX_helpers(input_nodelist):
                               ('A', 'A'),('H','H'),('D','D'),('H','A'),('H','D')])
     Output:
     text file with indegree, outdegree counts and CRC TF clique fractions.
+    Returns the network as a :class:`TFNetwork`.
 
-    """
-    # Create a networkx graph object
-    info("Initializing Graph.")
-    _graph = nx.DiGraph()
-
-    # Add edges to to the graph object
-    info("Add edges to graph object.")
-    _graph.add_edges_from(input_nodelist)
-
-    info("Calculating in-degree & out-degree stats.")
-
-    # degrees_dict = {node:deg for (node, deg) in _graph.degree()}
-    out_degree_dict = {node: deg for (node, deg) in _graph.out_degree()}
-    in_degree_dict = {node: deg for (node, deg) in _graph.in_degree()}
+    workers: number of processes used to search for cliques.
+    top_k: only find and report the top_k best scoring cliques, which is much faster
+    in dense networks. The cliques reported are the same as the first top_k of a full
+    run, but TF clique fractions can only be over those cliques, so they are written
+    as TF_TopCliqueFraction rather than TF_CliqueFraction.
 
-    out_degree = pd.DataFrame(
-        data={"TF": out_degree_dict.keys(), "Out": out_degree_dict.values()}
-    )
-    in_degree = pd.DataFrame(
-        data={"TF": in_degree_dict.keys(), "In": in_degree_dict.values()}
-    )
+    outdir: directory to write TF_Degrees.csv and Putative_CRC_Cliques.csv to.
 
-    NetworkMetricsOutput = pd.merge(
-        out_degree, in_degree, left_on="TF", right_on="TF", how="outer"
-    )
-    # TOTAL DEGREE
-    NetworkMetricsOutput["Total"] = (
-        NetworkMetricsOutput["Out"] + NetworkMetricsOutput["In"]
-    )
-
-    info("Fetching self-loops.")
-    # Self loops
-    # autoregulatoryLoops = nx.selfloop_edges(_graph) # not needed?
-
-    selfLoops = list(nx.nodes_with_selfloops(_graph))
-
-    info("Fetch self-regulatory loops.")
-
-    nodePairs = []
-    for ele in list(product(selfLoops, repeat=2)):
-        if (
-            ele[0] != ele[1]
-            and _graph.has_edge(ele[0], ele[1])
-            and _graph.has_edge(ele[1], ele[0])
-        ):
-            nodePairs.append(ele)
-
-    info("Fetch self-regulating cliques.")
-    unDirGraph = nx.from_edgelist(nodePairs)
-    cliqueGen = nx.find_cliques_recursive(unDirGraph)
-    cliqueList = list(cliqueGen)
-
-    # I am not sure what this does at this point but
-    # this is a place holder until SV confirms
-    # All cliques - not needed right now (SV)
-    # cliqueGen_ALL = list(nx.find_cliques_recursive(_graph))
-
-    print("hi", len(cliqueList))
-    info("Scoring all CRCs by average outdegree of members.")
-    """
-    ## SCORING THE CRCs using sum outdegree for each TF and dividing by
-    ## the number of TFs in the clique
-    """
-    cliqueRanking = []
-    outDegreeDict = _graph.out_degree()
-
-    for crcs in cliqueList:
-        score = 0
-        for gene in crcs:
-            score += outDegreeDict[gene]
-        score = score / len(crcs)
-        if score > 0 and len(crcs) > 2:
-            cliqueRanking.append((crcs, score))
-
-    sortedRankedCliques = pd.DataFrame(
-        sorted(cliqueRanking, reverse=True, key=lambda x: x[1])
-    )
-
-    factorEnrichmentDict = dict.fromkeys(selfLoops, 0)
-
-    info("Calculating clique membership fraction for each TF.")
     """
-    ## Enrichment of each TF calculated as (number of CRC cliques with the given TF)/(number of CRC cliques)
-    """
-    for crcClique in cliqueList:
-        for TF in crcClique:
-            factorEnrichmentDict[TF] += 1
-
-    factorRankingTable = dict.fromkeys(selfLoops, 0)
-    for TF in selfLoops:
-        factorRankingTable[TF] = factorEnrichmentDict[TF] / float(len(cliqueRanking))
+    info("Building adjacency matrix.")
+    with profiling.stage("adjacency"):
+        network = TFNetwork.from_edges(input_nodelist)
+        profiling.add_counts(edges=len(input_nodelist), nodes=len(network))
 
-    FactorRank = pd.DataFrame(
-        data={
-            "TF": factorRankingTable.keys(),
-            "TF_CliqueFraction": factorRankingTable.values(),
-        }
-    )
+    info("Calculating in-degree & out-degree stats.")
+    with profiling.stage("degrees"):
+        NetworkMetricsOutput = network.degree_table()
 
-    TFSpecificCliques = nx.cliques_containing_node(unDirGraph)
+    info("Fetching self-loops.")
+    loops = network.self_loops()
+    selfLoops = network.nodes[loops].tolist()
+
+    if top_k is not None:
+        info(f"Fetch the {top_k} best scoring self-regulating cliques.")
+        with profiling.stage("cliques"):
+            ranked = top_crc_cliques(network, top_k, loops, workers=workers)
+            profiling.add_counts(self_loops=len(selfLoops), cliques=len(ranked))
+        sortedRankedCliques = pd.DataFrame(
+            [(network.nodes[crcs].tolist(), score) for crcs, score in ranked]
+        )
+
+        info("Calculating clique membership fraction for each TF.")
+        """
+        ## Only the top cliques are known, so enrichment is over those, under its own
+        ## column name so it is not mistaken for the fraction over all cliques
+        """
+        members = np.fromiter((code for crcs, _ in ranked for code in crcs), dtype=np.int64)
+        cliqueMembership = np.bincount(members, minlength=len(network))
+        FactorRank = pd.DataFrame(
+            data={
+                "TF": selfLoops,
+                "TF_TopCliqueFraction": cliqueMembership[loops] / float(max(len(ranked), 1)),
+            }
+        )
+    else:
+        info("Fetch self-regulating cliques.")
+        with profiling.stage("cliques"):
+            cliqueList, cliqueMembership = find_crc_cliques(network, loops, workers=workers)
+            profiling.add_counts(self_loops=len(selfLoops), cliques=len(cliqueList))
+
+        info("Scoring all CRCs by average outdegree of members.")
+        """
+        ## SCORING THE CRCs using sum outdegree for each TF and dividing by
+        ## the number of TFs in the clique
+        """
+        outDegree = network.out_degree().astype(np.int64)
+        cliqueRanking = []
+        for crcs in cliqueList:
+            score = outDegree[crcs].sum() / len(crcs)
+            if score > 0 and len(crcs) > 2:
+                cliqueRanking.append((crcs, float(score)))
+
+        # Ties are ranked by node codes, as in top_crc_cliques.
+        sortedRankedCliques = pd.DataFrame(
+            [
+                (network.nodes[crcs].tolist(), score)
+                for crcs, score in sorted(cliqueRanking, key=lambda x: (-x[1], x[0]))
+            ]
+        )
+
+        info("Calculating clique membership fraction for each TF.")
+        """
+        ## Enrichment of each TF calculated as (number of CRC cliques with the given TF)/(number of CRC cliques)
+        """
+        FactorRank = pd.DataFrame(
+            data={
+                "TF": selfLoops,
+                "TF_CliqueFraction": cliqueMembership[loops] / float(max(len(cliqueRanking), 1)),
+            }
+        )
 
     NetworkMetricsOutput = pd.merge(
         NetworkMetricsOutput, FactorRank, left_on="TF", right_on="TF", how="outer"
     )
 
     info("Write to file")
-    NetworkMetricsOutput.to_csv("TF_Degrees.csv", index=False)
-    sortedRankedCliques.to_csv("Putative_CRC_Cliques.csv", index=False, header=False)
+    with profiling.stage("write"):
+        NetworkMetricsOutput.to_csv(os.path.join(outdir, "TF_Degrees.csv"), index=False)
+        sortedRankedCliques.to_csv(
+            os.path.join(outdir, "Putative_CRC_Cliques.csv"), index=False, header=False
+        )
+        profiling.add_counts(cliques=len(sortedRankedCliques))
 
-    # print(nx.cliques_containing_node(unDirGraph,"RFX3"))
-    # print(len(nx.cliques_containing_node(unDirGraph,"RFX3")))
-    # print(TFSpecificCliques)
-
-    return _graph
+    return network
 
 
 DESCRIPTION = """
@@ -209,17 +484,38 @@ parser = argparse.ArgumentParser(
 )
 
 parser.add_argument("arg")
+parser.add_argument(
+    "-t", "--threads", type=int, default=1, help="Number of processes used to search for cliques"
+)
+parser.add_argument(
+    "-k", "--top-k", type=int, default=None, help="Only report the best scoring cliques"
+)
+parser.add_argument(
+    "-p", "--profile", default=None, help="Write per-stage timings, memory use and counts to this JSON file"
+)
 parser.add_argument(
     "-v", "--verbose", action="store_true", help="Set logging level to DEBUG"
 )
 
-args = parser.parse_args()
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    # Only configure logging when run as a script, so importing the module leaves it alone.
+    lh = logging.StreamHandler()
+    lh.setFormatter(logging.Formatter(FORMAT))
+    l.addHandler(lh)
+    l.setLevel(logging.INFO)
+
+    if args.verbose:
+        l.setLevel(logging.DEBUG)
 
-edge_list = parse_bed(args.arg)
-networkX_helpers(edge_list)
+    debug("%s begin", SCRIPT_PATH)
 
+    if args.profile:
+        profiling.start_profiling()
 
-if args.verbose:
-    l.setLevel(logging.DEBUG)
+    edge_list = parse_enhancers(args.arg)
+    networkX_helpers(edge_list, workers=args.threads, top_k=args.top_k)
 
-debug("%s begin", SCRIPT_PATH)
+    if args.profile:
+        profiling.stop_profiling().write(args.profile)
@@ -0,0 +1,533 @@
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from pymemesuite.common import Alphabet, Array, Background
+
+from crcminer import profiling
+from crcminer.catalog import MOTIF_FILE, MotifCatalog
+from crcminer.edges import EdgeList, join_hits_to_enhancers
+from crcminer.genome import has_genome_cache, open_genome
+from crcminer.hits import HIT_FORMATS, count_occurrences, read_hits
+from crcminer.motifs import (
+    SequenceCollection,
+    extract_sequences_from_fasta,
+    filter_enhancers_to_active_genes,
+    get_background,
+    intersect_beds,
+    scan_for_motifs,
+    write_enhancer_bed,
+)
+from crcminer.network import networkX_helpers
+
+
+class StageCache:
+    """
+    Content-addressed store of pipeline stage outputs.
+
+    Each stage writes its outputs to a directory named after a hash of the stage
+    name, its parameters, the contents of its input files and the keys of the
+    stages it depends on. Rerunning a stage with the same inputs finds that
+    directory and skips the work, so only stages downstream of a change are rerun.
+
+    :param cache_dir: Directory holding the stage outputs.
+    :type cache_dir: str
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # File digests keyed by path, size and modification time, so large inputs
+        # such as the genome FASTA are only hashed once.
+        self._digest_file = os.path.join(cache_dir, "digests.json")
+        self._digests = {}
+        if os.path.exists(self._digest_file):
+            with open(self._digest_file) as f:
+                self._digests = json.load(f)
+
+    def file_digest(self, path):
+        """
+        Get the SHA-256 digest of a file's contents.
+
+        :param path: Path to the file.
+        :type path: str
+        ...
+        :return: Hex digest of the file.
+        :rtype: str
+        """
+
+        st = os.stat(path)
+        memo_key = f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+        if memo_key not in self._digests:
+            h = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 24), b""):
+                    h.update(chunk)
+            self._digests[memo_key] = h.hexdigest()
+
+            tmp = f"{self._digest_file}.{os.getpid()}"
+            with open(tmp, "w") as f:
+                json.dump(self._digests, f)
+            os.replace(tmp, self._digest_file)
+
+        return self._digests[memo_key]
+
+    def key(self, name, files=(), upstream=(), params=None):
+        """
+        Get the key of a stage.
+
+        :param name: Stage name.
+        :type name: str
+        :param files: Input file paths. None entries are allowed for optional inputs.
+        :type files: list
+        :param upstream: Keys of the stages whose outputs this stage uses.
+        :type upstream: list
+        :param params: JSON-serializable stage parameters.
+        :type params: dict
+        ...
+        :return: Hex digest identifying the stage outputs.
+        :rtype: str
+        """
+
+        payload = {
+            "stage": name,
+            "files": [None if f is None else self.file_digest(f) for f in files],
+            "upstream": list(upstream),
+            "params": params or {},
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def run(self, name, key, outputs, func):
+        """
+        Run a stage, unless its outputs already exist for this key.
+
+        :param name: Stage name.
+        :type name: str
+        :param key: Stage key, as returned by :meth:`key`.
+        :type key: str
+        :param outputs: File names of the stage outputs.
+        :type outputs: list
+        :param func: Called with the output paths to produce them.
+        :type func: callable
+        ...
+        :return: Paths to the stage outputs, in the same order as ``outputs``.
+        :rtype: list
+        """
+
+        stage_dir = os.path.join(self.cache_dir, f"{name}-{key[:16]}")
+        paths = [os.path.join(stage_dir, o) for o in outputs]
+        with profiling.stage(name) as record:
+            if os.path.isdir(stage_dir):
+                print(f"Reusing cached {name} stage ({key[:16]})")
+                record.cached = True
+                return paths
+
+            # Write to a temporary directory and rename it, so interrupted stages are never reused.
+            tmp_dir = f"{stage_dir}.tmp-{os.getpid()}"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            func(*[os.path.join(tmp_dir, o) for o in outputs])
+            try:
+                os.rename(tmp_dir, stage_dir)
+            except OSError:
+                # Another run finished the same stage first.
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        return paths
+
+
+def _publish(path, dest):
+    """Make a cached stage output available under its name in the run directory."""
+    if os.path.lexists(dest):
+        os.remove(dest)
+    try:
+        os.link(path, dest)
+    except OSError:
+        shutil.copyfile(path, dest)
+
+
+def _write_background(fasta, output):
+    with open(output, "w") as f:
+        f.write("\n".join(repr(x) for x in get_background(fasta).frequencies) + "\n")
+
+
+def _read_background(path):
+    with open(path) as f:
+        return Background(Alphabet.dna(), Array([float(x) for x in f]))
+
+
+def _write_edges(hits, counts, enhancer, npz_output, txt_output):
+    edges = join_hits_to_enhancers(
+        read_hits(hits, columns=["sequence_record", "start", "end", "motif_id"]),
+        pd.read_table(enhancer),
+        counts=pd.read_table(counts, dtype={"sequence_record": str, "motif_id": str}),
+    )
+    profiling.add_counts(edges=len(edges))
+    edges.save(npz_output)
+    edges.to_frame().to_csv(txt_output, sep="\t", index=False)
+
+
+def _write_network(edges, top_k, workers, degrees_output, cliques_output):
+    outdir = os.path.dirname(degrees_output)
+    networkX_helpers(EdgeList.load(edges), workers=workers, top_k=top_k, outdir=outdir)
+    os.replace(os.path.join(outdir, "TF_Degrees.csv"), degrees_output)
+    os.replace(os.path.join(outdir, "Putative_CRC_Cliques.csv"), cliques_output)
+
+
+def run_mine(
+    fasta,
+    enhancer,
+    name="CRCminer",
+    mapping=None,
+    threshold=1e-4,
+    subpeaks=None,
+    active=None,
+    threads=1,
+    batch_size=None,
+    merge_overlaps=False,
+    cache_dir=None,
+    motif_file=MOTIF_FILE,
+    engine="fimo",
+    hits_format="tsv",
+    occurrence_cutoff=1,
+    top_k=None,
+    catalog=None,
+    genome=None
+):
+    """
+    Run the 'mine' pipeline for a sample, reusing cached stage outputs where possible.
+
+    Outputs are written to a directory named ``name``, with file names prefixed by it.
+
+    :param fasta: Path to the genome FASTA file.
+    :type fasta: str
+    :param enhancer: Path to the ROSE2 table of annotated (super)enhancers.
+    :type enhancer: str
+    :param name: Analysis name, used to name the output files and directory.
+    :type name: str
+    :param mapping: Path to the motif accession to gene ID mapping file.
+    :type mapping: str
+    :param threshold: p-value threshold for significant motif matches.
+    :type threshold: float
+    :param subpeaks: Path to a BED file of regions to limit motif scanning to.
+    :type subpeaks: str
+    :param active: Path to a file of active genes, one per line.
+    :type active: str
+    :param threads: Number of worker processes used for motif scanning.
+    :type threads: int
+    :param batch_size: Sequences per batch in streaming scan mode, if any.
+    :type batch_size: int
+    :param merge_overlaps: Whether to merge overlapping regions before scanning.
+    :type merge_overlaps: bool
+    :param cache_dir: Directory for cached stage outputs. Defaults to "cache" in the
+        output directory; point several runs at the same one to share stages.
+    :type cache_dir: str
+    :param motif_file: Path to the MEME motif file.
+    :type motif_file: str
+    :param engine: Motif scanning engine, "fimo" or "numpy".
+    :type engine: str
+    :param hits_format: Format of the motif hit output, "tsv", "parquet" or "arrow".
+    :type hits_format: str
+    :param occurrence_cutoff: Minimum number of distinct occurrences of a motif in a region
+        for it to be kept. Overlapping matches count as one occurrence.
+    :type occurrence_cutoff: int
+    :param top_k: Only find and report the ``top_k`` best scoring CRC cliques, see
+        :func:`crcminer.network.networkX_helpers`.
+    :type top_k: int
+    :param catalog: Motif catalog already loaded from ``motif_file`` and ``mapping``, if any.
+    :type catalog: :class:`crcminer.catalog.MotifCatalog`
+    :param genome: Genome already opened from ``fasta`` with :func:`crcminer.genome.open_genome`, if any.
+    :type genome: :class:`crcminer.genome.PackedGenome` or :class:`crcminer.genome.FastaGenome`
+    """
+
+    os.makedirs(name, exist_ok=True)
+    prefix = os.path.join(name, os.path.basename(name))
+    cache = StageCache(cache_dir or os.path.join(name, "cache"))
+
+    # Limit enhancers to those associated with active genes, if provided.
+    upstream = []
+    if active is not None:
+        key = cache.key("filter", files=[active, enhancer])
+        (enhancer,) = cache.run(
+            "filter",
+            key,
+            ["enhancers_active.txt"],
+            lambda out: filter_enhancers_to_active_genes(active, enhancer).to_csv(
+                out, sep="\t", index=False
+            ),
+        )
+        _publish(enhancer, prefix + "_enhancers_active.txt")
+        upstream = [key]
+
+    # Limit motif scanning to subpeaks within enhancers, if provided.
+    key = cache.key("enhancers", files=[enhancer], upstream=upstream)
+    (regions,) = cache.run(
+        "enhancers", key, ["enhancers.bed"], lambda out: write_enhancer_bed(enhancer, out)
+    )
+    _publish(regions, prefix + "_enhancers.bed")
+
+    if subpeaks is not None:
+        key = cache.key("intersect", files=[subpeaks], upstream=[key])
+        (regions,) = cache.run(
+            "intersect", key, ["subpeaks.bed"], lambda out: intersect_beds(subpeaks, regions, out)
+        )
+        _publish(regions, prefix + "_subpeaks.bed")
+
+    # The packed genome and the FASTA differ in IUPAC codes, so extracts from either are kept apart.
+    source = genome.source if genome is not None else ("packed" if has_genome_cache(fasta) else "fasta")
+    key = cache.key(
+        "extract", files=[fasta], upstream=[key], params={"merge": merge_overlaps, "genome": source}
+    )
+    sequences, regions_map = cache.run(
+        "extract",
+        key,
+        ["regions.fa", "regions_map.txt"],
+        lambda out, map_out: extract_sequences_from_fasta(
+            genome or fasta, regions, out, merge=merge_overlaps, mapping_path=map_out
+        ),
+    )
+    _publish(sequences, prefix + "_regions.fa")
+    _publish(regions_map, prefix + "_regions_map.txt")
+    extract_key = key
+
+    # Streaming mode reads the FASTA in batches, otherwise parse it once and share it.
+    # Parsing is deferred until a stage that needs the sequences actually runs.
+    loaded = {}
+
+    def load_sequences():
+        if "seqs" not in loaded:
+            loaded["seqs"] = sequences if batch_size is not None else SequenceCollection.from_fasta(sequences)
+        return loaded["seqs"]
+
+    bg_key = cache.key("background", upstream=[extract_key])
+    (background,) = cache.run(
+        "background", bg_key, ["background.txt"], lambda out: _write_background(load_sequences(), out)
+    )
+
+    active_genes = None
+    if active is not None:
+        with open(active) as f:
+            active_genes = [line.strip() for line in f if line.strip()]
+
+    key = cache.key(
+        "scan",
+        files=[motif_file, mapping, active],
+        upstream=[extract_key, bg_key],
+        params={
+            "threshold": threshold,
+            "batch_size": batch_size,
+            "engine": engine,
+            "format": hits_format,
+        },
+    )
+    hits_file = "motifs" + HIT_FORMATS[hits_format]
+    (motifs,) = cache.run(
+        "scan",
+        key,
+        [hits_file],
+        lambda out: scan_for_motifs(
+            catalog or MotifCatalog.load(motif_file, mapping),
+            load_sequences(),
+            _read_background(background),
+            out,
+            active_genes=active_genes,
+            threshold=threshold,
+            workers=threads,
+            batch_size=batch_size,
+            engine=engine,
+            output_format=hits_format,
+        ),
+    )
+    _publish(motifs, prefix + "_" + hits_file)
+    scan_key = key
+
+    # Collapse overlapping matches and count the occurrences of each motif per region.
+    key = cache.key("occurrences", upstream=[scan_key], params={"cutoff": occurrence_cutoff})
+    (counts,) = cache.run(
+        "occurrences",
+        key,
+        ["motif_counts.txt"],
+        lambda out: count_occurrences(
+            read_hits(motifs, columns=["sequence_record", "start", "end", "motif_id"]),
+            occurrence_cutoff,
+        ).to_csv(out, sep="\t", index=False),
+    )
+    _publish(counts, prefix + "_motif_counts.txt")
+
+    # Join the motif occurrences to the enhancers they fall in, giving TF to target gene edges.
+    key = cache.key("edges", files=[enhancer], upstream=[scan_key, key])
+    edges_npz, edges_txt = cache.run(
+        "edges", key, ["edges.npz", "edges.txt"], lambda *out: _write_edges(motifs, counts, enhancer, *out)
+    )
+    _publish(edges_npz, prefix + "_edges.npz")
+    _publish(edges_txt, prefix + "_edges.txt")
+
+    # Degrees and CRC cliques of the TF to target network, so changing only network
+    # parameters reuses the scan.
+    key = cache.key("network", upstream=[key], params={"top_k": top_k})
+    degrees, cliques = cache.run(
+        "network",
+        key,
+        ["TF_Degrees.csv", "Putative_CRC_Cliques.csv"],
+        lambda *out: _write_network(edges_npz, top_k, threads, *out),
+    )
+    _publish(degrees, prefix + "_TF_Degrees.csv")
+    _publish(cliques, prefix + "_Putative_CRC_Cliques.csv")
+
+
+# Columns of a mine-batch manifest. Only "name" and "enhancer" are required.
+MANIFEST_COLUMNS = ["name", "enhancer", "subpeaks", "active"]
+
+
+def read_manifest(manifest):
+    """
+    Read a tab-delimited manifest of samples, with a header line and a row per sample.
+
+    Columns are "name", "enhancer", and optionally "subpeaks" and "active", as for
+    :func:`run_mine`. Empty cells are None. Relative paths are relative to the manifest.
+
+    :param manifest: Path to the manifest.
+    :type manifest: str
+    ...
+    :return: Sample parameters, one dict per sample, in manifest order.
+    :rtype: list
+    """
+
+    df = pd.read_csv(manifest, sep="\t", dtype=str, comment="#")
+    missing = [c for c in MANIFEST_COLUMNS[:2] if c not in df.columns]
+    if missing:
+        raise ValueError(f"Manifest is missing required columns: {', '.join(missing)}")
+    unknown = [c for c in df.columns if c not in MANIFEST_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown manifest columns: {', '.join(unknown)}")
+    if df["name"].isna().any() or df["enhancer"].isna().any():
+        raise ValueError("Every sample in the manifest needs a name and an enhancer file")
+    duplicated = df["name"][df["name"].duplicated()].unique().tolist()
+    if duplicated:
+        raise ValueError(f"Duplicate sample names in manifest: {', '.join(duplicated)}")
+
+    base = os.path.dirname(os.path.abspath(manifest))
+    samples = []
+    for row in df.to_dict("records"):
+        sample = {"name": row["name"]}
+        for col in MANIFEST_COLUMNS[1:]:
+            path = row.get(col)
+            sample[col] = None if pd.isna(path) else os.path.join(base, path)
+        samples.append(sample)
+
+    return samples
+
+
+# Per-process state for batch workers, set by _init_batch_worker.
+_batch_state = {}
+
+
+def _init_batch_worker(catalog, fasta):
+    """Keep the motif catalog and open the genome once per batch worker process."""
+    _batch_state["catalog"] = catalog
+    _batch_state["genome"] = open_genome(fasta)
+
+
+def _run_batch_sample(kwargs):
+    """Run the 'mine' pipeline for one sample in a batch worker process."""
+    run_mine(catalog=_batch_state["catalog"], genome=_batch_state["genome"], **kwargs)
+    return kwargs["name"]
+
+
+def run_mine_batch(
+    manifest,
+    fasta,
+    outdir=".",
+    mapping=None,
+    threads=1,
+    cache_dir=None,
+    motif_file=MOTIF_FILE,
+    **options
+):
+    """
+    Run the 'mine' pipeline for every sample in a manifest.
+
+    The motif catalog is loaded and the genome opened once per worker process, rather
+    than once per sample. Work is scheduled per sample rather than per stage: samples are
+    spread over a pool of up to ``threads`` workers, each running every stage of one
+    sample at a time, and with fewer samples than ``threads``, each sample scans motifs
+    with its own pool of the remaining workers. Samples share a stage cache, so stages
+    with the same inputs, e.g. samples with the same enhancer set, only run once.
+
+    :param manifest: Path to the sample manifest, see :func:`read_manifest`.
+    :type manifest: str
+    :param fasta: Path to the genome FASTA file.
+    :type fasta: str
+    :param outdir: Directory to write a subdirectory per sample to, named after the sample.
+    :type outdir: str
+    :param mapping: Path to the motif accession to gene ID mapping file.
+    :type mapping: str
+    :param threads: Number of worker processes. If there are fewer samples than workers,
+        the remaining workers are split between samples for motif scanning.
+    :type threads: int
+    :param cache_dir: Directory for cached stage outputs. Defaults to "cache" in ``outdir``.
+    :type cache_dir: str
+    :param motif_file: Path to the MEME motif file.
+    :type motif_file: str
+    :param options: Other :func:`run_mine` parameters, applied to every sample.
+    :type options: dict
+    """
+
+    samples = read_manifest(manifest)
+    catalog = MotifCatalog.load(motif_file, mapping)
+    cache_dir = cache_dir or os.path.join(outdir, "cache")
+
+    workers = max(1, min(threads, len(samples)))
+    tasks = [
+        dict(
+            options,
+            fasta=fasta,
+            name=os.path.join(outdir, sample["name"]),
+            enhancer=sample["enhancer"],
+            subpeaks=sample["subpeaks"],
+            active=sample["active"],
+            mapping=mapping,
+            cache_dir=cache_dir,
+            motif_file=motif_file,
+        )
+        for sample in samples
+    ]
+    # Start with the largest enhancer sets, so they do not hold up the pool at the end.
+    tasks.sort(key=lambda t: os.path.getsize(t["enhancer"]), reverse=True)
+    # Split the workers between samples, the largest ones getting any left over.
+    share, extra = divmod(threads, len(tasks))
+    for n, task in enumerate(tasks):
+        task["threads"] = max(1, share + (n < extra))
+
+    failed = []
+    if workers == 1:
+        genome = open_genome(fasta)
+        for task in tasks:
+            name = os.path.basename(task["name"])
+            print(f"Mining sample {name}")
+            try:
+                with profiling.stage("sample", label=name):
+                    run_mine(catalog=catalog, genome=genome, **task)
+            except Exception as e:
+                print(f"Sample {name} failed: {e!r}")
+                failed.append(name)
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_batch_worker, initargs=(catalog, fasta)
+        ) as pool:
+            futures = {pool.submit(_run_batch_sample, task): task["name"] for task in tasks}
+            for n, future in enumerate(as_completed(futures), 1):
+                name = os.path.basename(futures[future])
+                try:
+                    future.result()
+                    print(f"Finished sample {name} ({n}/{len(tasks)})")
+                except Exception as e:
+                    print(f"Sample {name} failed: {e!r}")
+                    failed.append(name)
+
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(tasks)} samples failed: {', '.join(failed)}")
@@ -0,0 +1,442 @@
+"""
+Per-stage timing, memory and throughput records for CRCminer runs.
+
+Code marks its stages with :func:`stage` and reports what it processed with
+:func:`add_counts` and :func:`tally`. These are no-ops until a :class:`Profiler` is
+started with :func:`start_profiling`, e.g. by the ``--profile`` option of the CLI.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+CAPTURE_MODES = ["cprofile", "sample"]
+
+# Functions listed in a stage capture, by cumulative time or samples.
+CAPTURE_TOP = 40
+
+SAMPLE_INTERVAL = 0.005
+
+_STATUS = "/proc/self/status"
+_CLEAR_REFS = "/proc/self/clear_refs"
+
+
+def _rusage_mb(who):
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+
+def _peak_rss_mb():
+    """Get the peak resident set size of this process since it was last reset, in megabytes."""
+    try:
+        with open(_STATUS) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return _rusage_mb(resource.RUSAGE_SELF)
+
+
+def _reset_peak_rss():
+    """Reset the peak resident set size to the current one, where the OS allows it."""
+    try:
+        with open(_CLEAR_REFS, "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _cpu_times():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime, children.ru_utime + children.ru_stime
+
+
+class StageRecord:
+    """
+    Measurements of one run of a stage.
+
+    Peak RSS is the high-water mark of the process during the stage, where the OS
+    allows resetting it (Linux), otherwise since the process started. CPU time of
+    worker processes is only counted once they have exited, as for a process pool
+    closed within the stage.
+
+    :param name: Stage name.
+    :type name: str
+    :param label: What the stage ran on, e.g. the sample name.
+    :type label: str
+    :param parent: Index of the enclosing stage's record, if any.
+    :type parent: int
+    """
+
+    def __init__(self, name, label=None, parent=None):
+        self.name = name
+        self.label = label
+        self.parent = parent
+        self.cached = False
+        self.counts = {}
+        self.tallies = {}
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.cpu_children = 0.0
+        self.peak_rss = 0.0
+
+    def add(self, **counts):
+        """Add to the stage's item counts, e.g. ``add(regions=100)``."""
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    def tally(self, counter, key, value=1):
+        """Add to one entry of a keyed count, e.g. ``tally("hits_per_motif", motif_id, 12)``."""
+        counts = self.tallies.setdefault(counter, {})
+        counts[key] = counts.get(key, 0) + value
+
+    def to_dict(self):
+        """
+        Get the record as JSON-serializable data, with the throughput of each count.
+
+        :return: The record.
+        :rtype: dict
+        """
+
+        return {
+            "name": self.name,
+            "label": self.label,
+            "parent": self.parent,
+            "cached": self.cached,
+            "wall_s": round(self.wall, 6),
+            "cpu_s": round(self.cpu, 6),
+            "cpu_children_s": round(self.cpu_children, 6),
+            "peak_rss_mb": round(self.peak_rss, 1),
+            "counts": self.counts,
+            "throughput_per_s": {
+                key: value / self.wall for key, value in self.counts.items() if self.wall > 0
+            },
+            "tallies": self.tallies,
+        }
+
+
+class _NullRecord:
+    """Stands in for a :class:`StageRecord` when no profiler is active."""
+
+    cached = False
+
+    def __setattr__(self, name, value):
+        pass
+
+    def add(self, **counts):
+        pass
+
+    def tally(self, counter, key, value=1):
+        pass
+
+
+_NULL_RECORD = _NullRecord()
+
+
+class _Sampler:
+    """
+    Statistical profiler sampling the stack of one thread from a background thread.
+
+    Unlike cProfile, it adds next to no overhead to the profiled code, so timings of
+    fine-grained Python code are not distorted, at the cost of missing short calls.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self.own = Counter()
+        self.total = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        target = threading.get_ident()
+        # Frames enclosing the stage are in every sample, so stop walking the stack there.
+        outer = set()
+        frame = sys._getframe(1)
+        while frame is not None:
+            outer.add(id(frame))
+            frame = frame.f_back
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(target, outer), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self, target, outer):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            if frame is None:
+                continue
+            self.samples += 1
+            self.own[_frame_key(frame)] += 1
+            # Count each function once per sample, however deep it recurses.
+            seen = set()
+            while frame is not None and id(frame) not in outer:
+                seen.add(_frame_key(frame))
+                frame = frame.f_back
+            self.total.update(seen)
+
+    def report(self):
+        return {
+            "samples": self.samples,
+            "interval_s": self.interval,
+            "functions": [
+                {
+                    "function": key,
+                    "own_samples": self.own[key],
+                    "total_samples": total,
+                    "total_fraction": total / max(self.samples, 1),
+                }
+                for key, total in self.total.most_common(CAPTURE_TOP)
+            ],
+        }
+
+
+def _frame_key(frame):
+    code = frame.f_code
+    return f"{code.co_filename}:{code.co_firstlineno}({code.co_name})"
+
+
+class _CProfileCapture:
+    """Deterministic profile of the stage with cProfile, also dumped for pstats or snakeviz."""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.ran = False
+
+    def start(self):
+        self.ran = True
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def report(self):
+        if not self.ran:
+            return {"functions": []}
+        stats = pstats.Stats(self.profile, stream=io.StringIO())
+        stats.sort_stats("cumulative")
+        functions = []
+        for func in stats.fcn_list[:CAPTURE_TOP]:
+            calls, primitive, own, total, _ = stats.stats[func]
+            filename, line, name = func
+            functions.append({
+                "function": f"{filename}:{line}({name})",
+                "calls": calls,
+                "own_s": own,
+                "total_s": total,
+            })
+        return {"functions": functions}
+
+    def dump(self, path):
+        self.profile.dump_stats(path)
+
+
+class Profiler:
+    """
+    Collects a :class:`StageRecord` for each stage run while it is active.
+
+    :param capture: Name of a stage to also profile function by function, if any.
+        Every run of the stage in the main thread is captured, and the results combined.
+    :type capture: str
+    :param mode: How to capture the stage, "cprofile" or "sample".
+    :type mode: str
+    :param interval: Seconds between stack samples in "sample" mode.
+    :type interval: float
+    """
+
+    def __init__(self, capture=None, mode="cprofile", interval=SAMPLE_INTERVAL):
+        if mode not in CAPTURE_MODES:
+            raise ValueError(f"Unknown profile capture mode: {mode}")
+        self.capture = capture
+        self.mode = mode
+        self.records = []
+        self._capturer = None
+        if capture is not None:
+            self._capturer = _CProfileCapture() if mode == "cprofile" else _Sampler(interval)
+        self._capturing = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started = datetime.now(timezone.utc)
+        self._start_wall = time.perf_counter()
+        self._start_cpu = _cpu_times()
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def current(self):
+        """
+        Get the record of the innermost running stage of this thread.
+
+        :return: The record, or a no-op stand-in outside any stage.
+        :rtype: :class:`StageRecord`
+        """
+
+        stack = self._stack()
+        return stack[-1][0] if stack else _NULL_RECORD
+
+    @contextmanager
+    def stage(self, name, label=None):
+        """
+        Measure a stage. See :func:`stage`.
+        """
+
+        stack = self._stack()
+        if stack:
+            # Stages reset the peak RSS, so keep the enclosing stage's peak so far.
+            outer = stack[-1][0]
+            outer.peak_rss = max(outer.peak_rss, _peak_rss_mb())
+
+        with self._lock:
+            record = StageRecord(name, label, stack[-1][1] if stack else None)
+            index = len(self.records)
+            self.records.append(record)
+
+        capture = (
+            name == self.capture
+            and not self._capturing
+            and threading.current_thread() is threading.main_thread()
+        )
+        stack.append((record, index))
+        _reset_peak_rss()
+        wall = time.perf_counter()
+        cpu, cpu_children = _cpu_times()
+        if capture:
+            self._capturing = True
+            self._capturer.start()
+        try:
+            yield record
+        finally:
+            if capture:
+                self._capturer.stop()
+                self._capturing = False
+            end_cpu, end_children = _cpu_times()
+            record.wall = time.perf_counter() - wall
+            record.cpu = end_cpu - cpu
+            record.cpu_children = end_children - cpu_children
+            record.peak_rss = max(record.peak_rss, _peak_rss_mb())
+            stack.pop()
+            if stack:
+                stack[-1][0].peak_rss = max(stack[-1][0].peak_rss, record.peak_rss)
+
+    def report(self):
+        """
+        Get the measurements of all stages, in the order they started.
+
+        :return: JSON-serializable report.
+        :rtype: dict
+        """
+
+        cpu, cpu_children = _cpu_times()
+        report = {
+            "command": sys.argv,
+            "started": self._started.isoformat(),
+            "pid": os.getpid(),
+            "wall_s": time.perf_counter() - self._start_wall,
+            "cpu_s": cpu - self._start_cpu[0],
+            "cpu_children_s": cpu_children - self._start_cpu[1],
+            "max_rss_mb": _rusage_mb(resource.RUSAGE_SELF),
+            "max_rss_children_mb": _rusage_mb(resource.RUSAGE_CHILDREN),
+            "stages": [record.to_dict() for record in self.records],
+        }
+        if self._capturer is not None:
+            report["capture"] = dict(
+                stage=self.capture, mode=self.mode, **self._capturer.report()
+            )
+        return report
+
+    def write(self, path):
+        """
+        Write the report as JSON. A cProfile capture is also dumped next to it, to
+        ``<path without extension>.<stage>.prof``, for pstats or snakeviz.
+
+        :param path: Output path.
+        :type path: str
+        """
+
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        if isinstance(self._capturer, _CProfileCapture) and self._capturer.ran:
+            self._capturer.dump(f"{os.path.splitext(path)[0]}.{self.capture}.prof")
+
+
+_active = None
+
+
+def start_profiling(capture=None, mode="cprofile", interval=SAMPLE_INTERVAL):
+    """
+    Start recording stages, replacing any profiler already active.
+
+    See :class:`Profiler` for parameter descriptions.
+    ...
+    :return: The active profiler.
+    :rtype: :class:`Profiler`
+    """
+
+    global _active
+    _active = Profiler(capture, mode, interval)
+    return _active
+
+
+def stop_profiling():
+    """
+    Stop recording stages.
+
+    :return: The profiler that was active, if any.
+    :rtype: :class:`Profiler`
+    """
+
+    global _active
+    profiler, _active = _active, None
+    return profiler
+
+
+@contextmanager
+def stage(name, label=None):
+    """
+    Measure wall time, CPU time and peak RSS of a block of code, if profiling.
+
+    Stages can be nested, and yield their record so counts can be added to it.
+
+    :param name: Stage name.
+    :type name: str
+    :param label: What the stage runs on, e.g. the sample name.
+    :type label: str
+    ...
+    :return: Context manager yielding the stage's :class:`StageRecord`.
+    :rtype: contextmanager
+    """
+
+    if _active is None:
+        yield _NULL_RECORD
+        return
+    with _active.stage(name, label) as record:
+        yield record
+
+
+def add_counts(**counts):
+    """Add item counts to the innermost running stage, if profiling."""
+    if _active is not None:
+        _active.current().add(**counts)
+
+
+def tally(counter, key, value=1):
+    """Add to one entry of a keyed count of the innermost running stage, if profiling."""
+    if _active is not None:
+        _active.current().tally(counter, key, value)
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from crcminer.compare import compare_networks, network_jaccard, parse_bed
+from crcminer.edges import EdgeList
+
+N_SAMPLES = 4
+
+
+def edge_list(pairs):
+    codes, nodes = pd.factorize(np.asarray(pairs, dtype=object).ravel())
+    return EdgeList(nodes, codes[0::2], codes[1::2])
+
+
+@pytest.fixture(scope="module")
+def samples():
+    """Overlapping edge sets, each with its own node codes and some duplicate edges."""
+    rng = np.random.default_rng(0)
+    shared = [(f"TF{i % 50}", f"G{i}") for i in range(3000)]
+    pairs = []
+    for n in range(N_SAMPLES):
+        keep = rng.random(len(shared)) < 0.5 + 0.1 * n
+        own = [(f"TF{i % 50}", f"S{n}_{i}") for i in range(500 * n)]
+        edges = [p for p, k in zip(shared, keep) if k] + own
+        rng.shuffle(edges)
+        pairs.append(edges + edges[:100])
+    return pairs
+
+
+def jaccard(a, b):
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b)
+
+
+def test_network_jaccard(samples):
+    for a in samples:
+        for b in samples:
+            assert network_jaccard(edge_list(a), edge_list(b)) == pytest.approx(jaccard(a, b))
+
+
+def test_network_jaccard_empty(samples):
+    empty = EdgeList([], [], [])
+    assert network_jaccard(empty, empty) == 0.0
+    assert network_jaccard(empty, edge_list(samples[0])) == 0.0
+
+
+def test_compare_networks(samples):
+    names = [f"s{n}" for n in range(N_SAMPLES)]
+    jaccard_df, overlap_df = compare_networks([edge_list(p) for p in samples], names)
+    for i, a in enumerate(samples):
+        for j, b in enumerate(samples):
+            assert jaccard_df.iloc[i, j] == pytest.approx(jaccard(a, b))
+            shared = len(set(a) & set(b)) / min(len(set(a)), len(set(b)))
+            assert overlap_df.iloc[i, j] == pytest.approx(shared)
+
+
+def test_compare_networks_minhash(samples):
+    edgelists = [edge_list(p) for p in samples]
+    exact, _ = compare_networks(edgelists)
+    estimate, overlap = compare_networks(edgelists, minhash=4096)
+    np.testing.assert_allclose(estimate.to_numpy(), exact.to_numpy(), atol=0.05)
+    assert ((overlap.to_numpy() >= 0) & (overlap.to_numpy() <= 1)).all()
+
+
+def test_parse_bed(tmp_path):
+    bed = tmp_path / "enhancers.bed"
+    bed.write_text(
+        "chr\tst\ten\tgene\tmotif\n"
+        "chr1\t10\t20\tA,B,C\tBAR\n"
+        "chr1\t11\t21\tFOO\tX,Y,Z\n"
+        "chr1\t1111\t1121\tJANE1\tDOE\n"
+        "chr1\t11131\t11421\t\tFOO1\n"
+        "chr1\t11151\t11521\tBAR1\t\n"
+    )
+    df = parse_bed(str(bed)).to_frame()
+    # Edges go from TF (motif) to target (gene), as written by 'mine'.
+    assert set(zip(df["TF"], df["target"])) == {
+        ("BAR", "A"), ("BAR", "B"), ("BAR", "C"), ("X", "FOO"), ("Y", "FOO"), ("Z", "FOO"), ("DOE", "JANE1"),
+    }
@@ -0,0 +1,61 @@
+import pandas as pd
+
+from crcminer.edges import join_hits_to_enhancers
+
+# Records are chrom:start-end with a 0-based start, and hits 1-based within them.
+HITS = pd.DataFrame(
+    [
+        # chr1:100-110, in E0.
+        ("chr1:100-200", 1, 10, "TFA"),
+        # Reverse strand, chr1:150-160, in E0 and E1.
+        ("chr1:100-200", 60, 51, "TFB;TFC"),
+        # chr1:190-200, in no enhancer.
+        ("chr1:100-200", 91, 100, "TFD"),
+        # chr2:4-14, in E3 and ending where E2 starts.
+        ("chr2:0-50", 5, 14, "TFA"),
+        # No motif ID, e.g. a motif mapped to no gene.
+        ("chr2:0-50", 20, 30, None),
+    ],
+    columns=["sequence_record", "start", "end", "motif_id"],
+)
+
+ENHANCERS = pd.DataFrame(
+    [
+        ("E0", "chr1", 105, 155, "G1,G2", "G2", "G3"),
+        ("E1", "chr1", 158, 170, "TFA", None, None),
+        ("E2", "chr2", 14, 40, "G4", None, None),
+        ("E3", "chr2", 0, 10, "G5", None, "G5"),
+        ("E4", "chr1", 300, 400, "AAK1", None, None),
+    ],
+    columns=["REGION_ID", "CHROM", "START", "STOP", "OVERLAP_GENES", "PROXIMAL_GENES", "CLOSEST_GENE"],
+)
+
+
+def edge_set(edges):
+    df = edges.to_frame()
+    return set(zip(df["TF"], df["target"]))
+
+
+def test_join_hits_to_enhancers():
+    edges = join_hits_to_enhancers(HITS, ENHANCERS)
+    assert edge_set(edges) == {
+        ("TFA", "G1"), ("TFA", "G2"), ("TFA", "G3"), ("TFA", "G5"),
+        ("TFB", "G1"), ("TFB", "G2"), ("TFB", "G3"), ("TFB", "TFA"),
+        ("TFC", "G1"), ("TFC", "G2"), ("TFC", "G3"), ("TFC", "TFA"),
+    }
+    assert len(edges) == len(edge_set(edges))
+    # Only nodes with an edge, not every gene of every enhancer.
+    assert sorted(edges.nodes) == ["G1", "G2", "G3", "G5", "TFA", "TFB", "TFC"]
+
+
+def test_join_hits_to_enhancers_counts():
+    counts = pd.DataFrame({"sequence_record": ["chr2:0-50"], "motif_id": ["TFA"]})
+    edges = join_hits_to_enhancers(HITS, ENHANCERS, counts)
+    assert edge_set(edges) == {("TFA", "G5")}
+    assert sorted(edges.nodes) == ["G5", "TFA"]
+
+
+def test_join_hits_to_active_genes():
+    enhancers = ENHANCERS.assign(active_genes=["G2", "TFA", "G4", None, "AAK1"])
+    edges = join_hits_to_enhancers(HITS, enhancers)
+    assert edge_set(edges) == {("TFA", "G2"), ("TFB", "G2"), ("TFC", "G2"), ("TFB", "TFA"), ("TFC", "TFA")}
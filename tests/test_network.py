@@ -0,0 +1,95 @@
+import ast
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+import pytest
+
+from crcminer.edges import EdgeList
+from crcminer.network import TFNetwork, find_crc_cliques, networkX_helpers, top_crc_cliques
+
+N_TFS = 24
+N_GENES = 40
+
+
+@pytest.fixture(scope="module")
+def edges():
+    """TF to target edges with self-loops, duplicates and dense mutual regulation."""
+    rng = np.random.default_rng(0)
+    tfs = [f"TF{i:02d}" for i in range(N_TFS)]
+    genes = [f"G{i:02d}" for i in range(N_GENES)]
+    pairs = [(tf, gene) for tf in tfs for gene in genes if rng.random() < 0.2]
+    pairs += [(a, b) for a in tfs for b in tfs if rng.random() < 0.7]
+    pairs += pairs[::7]
+    return pairs
+
+
+@pytest.fixture(scope="module")
+def graph(edges):
+    graph = nx.DiGraph()
+    graph.add_edges_from(edges)
+    return graph
+
+
+def edge_list(edges):
+    codes, nodes = pd.factorize(np.asarray(edges, dtype=object).ravel())
+    return EdgeList(nodes, codes[0::2], codes[1::2])
+
+
+def reference_cliques(graph):
+    """Scored CRC cliques, found as by the networkx implementation."""
+    loops = list(nx.nodes_with_selfloops(graph))
+    pairs = [(a, b) for a in loops for b in loops if a != b and graph.has_edge(a, b) and graph.has_edge(b, a)]
+    cliques = list(nx.find_cliques(nx.from_edgelist(pairs)))
+    out_degree = graph.out_degree()
+    scored = [(c, sum(out_degree[n] for n in c) / len(c)) for c in cliques]
+    return cliques, [(frozenset(c), s) for c, s in scored if s > 0 and len(c) > 2]
+
+
+def test_degrees(edges, graph):
+    network = TFNetwork.from_edges(edge_list(edges))
+    table = network.degree_table().set_index("TF")
+    assert sorted(table.index) == sorted(graph.nodes)
+    for node in graph.nodes:
+        assert table.loc[node, "Out"] == graph.out_degree(node)
+        assert table.loc[node, "In"] == graph.in_degree(node)
+        assert table.loc[node, "Total"] == graph.degree(node)
+
+
+def test_cliques(edges, graph):
+    network = TFNetwork.from_edges(edges)
+    cliques, membership = find_crc_cliques(network, network.self_loops())
+    expected, _ = reference_cliques(graph)
+    found = [frozenset(network.nodes[c]) for c in cliques]
+    assert sorted(map(sorted, found)) == sorted(map(sorted, expected))
+    for node, count in zip(network.nodes, membership):
+        assert count == sum(node in c for c in expected)
+
+
+@pytest.mark.parametrize("k", [1, 5, 1000])
+def test_top_cliques(edges, graph, k):
+    network = TFNetwork.from_edges(edges)
+    ranked = top_crc_cliques(network, k, network.self_loops())
+    _, expected = reference_cliques(graph)
+    assert len(expected) > 5
+    scores = sorted((s for _, s in expected), reverse=True)[:k]
+    np.testing.assert_allclose([s for _, s in ranked], scores)
+    assert {frozenset(network.nodes[c]) for c, _ in ranked} <= {c for c, _ in expected}
+
+
+def test_networkX_helpers(edges, graph, tmp_path):
+    networkX_helpers(edges, outdir=str(tmp_path))
+    degrees = pd.read_csv(tmp_path / "TF_Degrees.csv").set_index("TF")
+    assert sorted(degrees.index) == sorted(graph.nodes)
+
+    cliques, ranking = reference_cliques(graph)
+    for node in nx.nodes_with_selfloops(graph):
+        fraction = sum(node in c for c in cliques) / len(ranking)
+        assert degrees.loc[node, "TF_CliqueFraction"] == pytest.approx(fraction)
+    assert degrees["TF_CliqueFraction"].isna().sum() == graph.number_of_nodes() - nx.number_of_selfloops(graph)
+
+    table = pd.read_csv(tmp_path / "Putative_CRC_Cliques.csv", header=None)
+    found = {(frozenset(ast.literal_eval(c)), s) for c, s in table.itertuples(index=False)}
+    assert {c for c, _ in found} == {c for c, _ in ranking}
+    for clique, score in found:
+        assert score == pytest.approx(dict(ranking)[clique])
@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import pytest
+
+from crcminer.hits import read_hits
+from crcminer.motifs import SequenceCollection, get_background, scan_for_motifs
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "crcminer", "data")
+MOTIF_FILE = os.path.join(DATA_DIR, "Homo_sapiens.meme")
+FASTA_FILE = os.path.join(DATA_DIR, "ATAC.chr22.fasta")
+
+# Motifs from the bundled file scanned by both engines, spread over its motif widths.
+N_MOTIFS = 12
+
+KEY = ["sequence_record", "start", "end", "strand", "motif_id"]
+
+
+@pytest.fixture(scope="module")
+def motif_subset(tmp_path_factory):
+    with open(MOTIF_FILE) as f:
+        header, *blocks = f.read().split("\nMOTIF ")
+    step = len(blocks) // N_MOTIFS
+    path = tmp_path_factory.mktemp("motifs") / "subset.meme"
+    path.write_text(header + "\n" + "\n".join("MOTIF " + b for b in blocks[::step][:N_MOTIFS]) + "\n")
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def hits(motif_subset, tmp_path_factory):
+    sequences = SequenceCollection.from_fasta(FASTA_FILE)
+    background = get_background(sequences)
+    outdir = tmp_path_factory.mktemp("hits")
+    found = {}
+    for engine in ["fimo", "numpy"]:
+        path = str(outdir / f"{engine}.txt")
+        scan_for_motifs(motif_subset, sequences, background, path, engine=engine)
+        found[engine] = read_hits(path).sort_values(KEY, ignore_index=True)
+    return found
+
+
+def test_same_hits(hits):
+    fimo, numpy = hits["fimo"], hits["numpy"]
+    assert len(fimo) > 0
+    assert fimo[KEY].equals(numpy[KEY])
+
+
+def test_same_scores_and_pvalues(hits):
+    fimo, numpy = hits["fimo"], hits["numpy"]
+    np.testing.assert_allclose(numpy["score"], fimo["score"], rtol=1e-5, atol=1e-5)
+    np.testing.assert_allclose(numpy["p-value"], fimo["p-value"], rtol=1e-6)